@@ -1,33 +1,64 @@
 import os
+import sys
 import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import streamlit as st
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from sample_store import csv_path, load_columns, table_exists
+from dashboard_data import SCREEN_POINTS, load_pyramid, minmax_decimate, table_version, view
+
 # Set Streamlit page config
 st.set_page_config(page_title="Clock Drift FPGA Dashboard", layout="wide")
 
 st.title("FPGA Clock Drift Analysis Dashboard")
 
-# Helper: load CSV if exists
+MAX_HEATMAP_ANOMALIES = 100
+
+# Helper: load CSV if exists (cached until the file changes)
+@st.cache_data
+def _read_csv(path, mtime_ns):
+    return pd.read_csv(path)
+
 def load_csv(path):
     if os.path.exists(path):
-        return pd.read_csv(path)
+        return _read_csv(path, os.stat(path).st_mtime_ns)
     return None
 
-# Load all CSVs
-drift_df = load_csv("data/clock_drift.csv")
-faulted_df = load_csv("data/clock_drift_faulted.csv")
-corrected_df = load_csv("data/clock_drift_corrected.csv")
+# Helper: memory-mapped columns plus their min/max pyramid, cached across reruns
+# until the table is rewritten (version = its meta.json mtime)
+@st.cache_resource
+def _open_series(name, columns, version):
+    pyramid = load_pyramid(name, list(columns)) if table_exists(name) else []  # legacy CSV: no pyramid
+    return load_columns(name, list(columns)), pyramid
+
+def load_series(name, columns):
+    version = table_version(name)
+    if version is None and os.path.exists(csv_path(name)):
+        version = os.stat(csv_path(name)).st_mtime_ns
+    if version is None:
+        return None
+    raw, pyramid = _open_series(name, tuple(columns), version)
+    return {"raw": raw, "pyramid": pyramid, "rows": len(next(iter(raw.values())))}
+
+# Helper: screen-resolution (sample, value) view of one column over the slider range
+def series_view(series, name, column, sample_range):
+    return view(name, column, sample_range[0], sample_range[1], points=SCREEN_POINTS,
+                pyramid=series["pyramid"], raw=series["raw"][column])
+
+# Load all tables
+drift = load_series("data/clock_drift", ["drift_us"])
+faulted = load_series("data/clock_drift_faulted", ["fpga_2_faulted"])
+corrected = load_series("data/clock_drift_corrected", ["fpga_1_time", "fpga_2_corrected"])
 loss_df = load_csv("output/loss_report.csv")
 anomaly_df = load_csv("output/anomaly_log.csv")
 skew_df = load_csv("data/vlsi_clock_skew.csv")
 signal_df = load_csv("data/signal_delay_profile.csv")
 
 # Sample Range Control
-if drift_df is not None:
-    max_sample = len(drift_df)
+if drift is not None:
+    max_sample = drift["rows"]
     sample_range = st.slider("Select Sample Range", 0, max_sample, (0, max_sample), step=1000)
 else:
     sample_range = (0, 0)
@@ -38,10 +69,10 @@ def render_plot(title, fig):
     st.pyplot(fig)
 
 # 1. Clock Drift Plot
-if drift_df is not None:
-    sliced = drift_df.iloc[sample_range[0]:sample_range[1]]
+if drift is not None:
+    x, y = series_view(drift, "data/clock_drift", "drift_us", sample_range)
     fig, ax = plt.subplots(figsize=(10, 4))
-    ax.plot(sliced["sample"], (sliced["fpga_2_time"] - sliced["fpga_1_time"]) * 1e6, label="Drift (µs)", color='red')
+    ax.plot(x, y, label="Drift (µs)", color='red')
     ax.set_xlabel("Sample")
     ax.set_ylabel("Drift (µs)")
     ax.set_title("Clock Drift Between FPGA_1 and FPGA_2")
@@ -51,14 +82,11 @@ if drift_df is not None:
     render_plot("Clock Drift Over Time", fig)
 
 # 2. Faulted vs Corrected
-if faulted_df is not None and corrected_df is not None:
-    sliced_fault = faulted_df.iloc[sample_range[0]:sample_range[1]]
-    sliced_corr = corrected_df.iloc[sample_range[0]:sample_range[1]]
-
+if faulted is not None and corrected is not None:
     fig, ax = plt.subplots(figsize=(10, 4))
-    ax.plot(sliced_fault["sample"], sliced_fault["fpga_2_faulted"], alpha=0.4, label="Faulted")
-    ax.plot(sliced_corr["sample"], sliced_corr["fpga_2_corrected"], label="Corrected", color='green')
-    ax.plot(sliced_corr["sample"], sliced_corr["fpga_1_time"], linestyle='--', label="FPGA_1", alpha=0.6)
+    ax.plot(*series_view(faulted, "data/clock_drift_faulted", "fpga_2_faulted", sample_range), alpha=0.4, label="Faulted")
+    ax.plot(*series_view(corrected, "data/clock_drift_corrected", "fpga_2_corrected", sample_range), label="Corrected", color='green')
+    ax.plot(*series_view(corrected, "data/clock_drift_corrected", "fpga_1_time", sample_range), linestyle='--', label="FPGA_1", alpha=0.6)
 
     ax.set_title("Clock Correction via Feedback")
     ax.set_xlabel("Sample")
@@ -72,8 +100,9 @@ else:
 
 # 3. Profit/Loss Chart
 if loss_df is not None:
+    x, y = minmax_decimate(loss_df["order_id"].to_numpy(), loss_df["loss_per_order"].to_numpy(), SCREEN_POINTS)
     fig, ax = plt.subplots(figsize=(10, 4))
-    ax.plot(loss_df["order_id"], loss_df["loss_per_order"], label="Loss per Order", color="orange")
+    ax.plot(x, y, label="Loss per Order", color="orange")
     ax.axhline(0, color='black', linestyle='--')
     ax.set_title("Loss due to Clock Drift")
     ax.set_xlabel("Order ID")
@@ -87,7 +116,7 @@ if loss_df is not None:
 if anomaly_df is not None and not anomaly_df.empty:
     fig, ax = plt.subplots(figsize=(12, 3))
     sns.heatmap(
-        anomaly_df[["position_in_stream", "current_order_id"]].T,
+        anomaly_df[["position_in_stream", "current_order_id"]].head(MAX_HEATMAP_ANOMALIES).T,
         cmap="Reds", annot=True, fmt=".0f", cbar=True, ax=ax
     )
     ax.set_title("Order ID Anomalies due to Clock Drift")
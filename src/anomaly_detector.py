@@ -1,82 +1,104 @@
 import os
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+from order_analytics import reorder_summary, window_violation_rates
+from stage_params import run_stage
+from instrumentation import add_rows, section, set_phase
 
-# Set working directory to project root if not already
-project_root = "D:/clock-drift-fpga-project"
-if os.getcwd() != project_root:
-    os.chdir(project_root)
+violation_window = 1000       # Orders per window for violation rates
+max_heatmap_anomalies = 100   # Annotated heatmap shows the first N violations
 
-# Auto-install seaborn if missing
-try:
-    import seaborn as sns
-except ImportError:
-    print("[INFO] seaborn not found. Installing now...")
-    import subprocess
-    import sys
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "seaborn"])
-    import seaborn as sns
-    print("[INFO] seaborn successfully installed.")
 
-seaborn_available = True
+def main(plots=True):
+    # Ensure folders exist
+    os.makedirs("output", exist_ok=True)
+    os.makedirs("output/plots", exist_ok=True)
 
-# Ensure folders exist
-os.makedirs("output", exist_ok=True)
-os.makedirs("output/plots", exist_ok=True)
+    # Load order files
+    with section("csv_io"):
+        normal_orders = pd.read_csv("data/normal_orders.csv")
+    drifted_orders = normal_orders.copy()
 
-# Load order files
-normal_orders = pd.read_csv("data/normal_orders.csv")
-drifted_orders = normal_orders.copy()
+    # ----- Inject anomalies into drifted_orders -----
+    np.random.seed(42)
 
-# ----- Inject anomalies into drifted_orders -----
-import numpy as np
-np.random.seed(42)
+    # Same swap sequence as before (one randint(0, n, 2) per swap, applied in
+    # order), on the raw id array instead of through df.loc
+    num_anomalies = max(1, len(drifted_orders)//50)  # ~2% anomalies
+    swaps = np.random.randint(0, len(drifted_orders), size=(num_anomalies, 2))
+    order_ids = drifted_orders["order_id"].to_numpy().copy()
+    for i, j in swaps.tolist():
+        order_ids[i], order_ids[j] = order_ids[j], order_ids[i]
+    drifted_orders["order_id"] = order_ids
 
-num_anomalies = max(1, len(drifted_orders)//50)  # ~2% anomalies
-for _ in range(num_anomalies):
-    i, j = np.random.randint(0, len(drifted_orders), 2)
-    drifted_orders.loc[i, "order_id"], drifted_orders.loc[j, "order_id"] = (
-        drifted_orders.loc[j, "order_id"], drifted_orders.loc[i, "order_id"]
-    )
+    # Save drifted_orders to output (optional)
+    with section("csv_io"):
+        drifted_orders.to_csv("output/drifted_orders.csv", index=False)
+
+    # Detect anomalies: out-of-order order_ids (an id lower than the one before it)
+    # (orders from a clock fleet also carry the clock_id of the stamping FPGA)
+    has_clock_id = "clock_id" in drifted_orders.columns
+    positions = np.flatnonzero(order_ids[1:] < order_ids[:-1]) + 1
+    add_rows(len(order_ids))
+    anomalies = {
+        "position_in_stream": positions,
+        "current_order_id": order_ids[positions],
+        "previous_order_id": order_ids[positions - 1],
+    }
+    if has_clock_id:
+        anomalies["clock_id"] = drifted_orders["clock_id"].to_numpy()[positions]
+    log_columns = list(anomalies)
 
-# Save drifted_orders to output (optional)
-drifted_orders.to_csv("output/drifted_orders.csv", index=False)
+    # How bad the reordering is: inversions, displacement, minimal reordered set
+    summary = reorder_summary(order_ids)
+    print(f"[INFO] Inversions: {summary['inversions']} of {summary['max_pairs']} pairs, "
+          f"max displacement {summary['max_displacement']} positions, "
+          f"{summary['min_reordered_orders']} of {summary['orders']} orders must move (LIS {summary['lis_length']})")
+    rates = window_violation_rates(order_ids, window=violation_window)
+    with section("csv_io"):
+        rates.to_csv("output/violation_windows.csv", index=False)
+    print("Windowed violation rates saved to: output/violation_windows.csv")
 
-# Detect anomalies: out-of-order order_ids
-anomalies = []
-last_id = -1
-for i, oid in enumerate(drifted_orders["order_id"]):
-    if oid < last_id:
-        anomalies.append({
-            "position_in_stream": i,
-            "current_order_id": oid,
-            "previous_order_id": last_id
-        })
-    last_id = oid
+    # Handle anomalies
+    if not len(positions):
+        print("[OK] No anomalies detected — all order IDs are in correct sequence.")
+        # Save empty CSV to maintain consistent output
+        pd.DataFrame(columns=log_columns).to_csv(
+            "output/anomaly_log.csv", index=False
+        )
+        return
 
-# Handle anomalies
-if anomalies:
-    anomaly_df = pd.DataFrame(anomalies)[["position_in_stream", "current_order_id", "previous_order_id"]]
-    anomaly_df.to_csv("output/anomaly_log.csv", index=False)
-    print(f"[INFO] Anomaly detection completed. {len(anomalies)} out-of-order violations detected.")
+    anomaly_df = pd.DataFrame(anomalies)[log_columns]
+    with section("csv_io"):
+        anomaly_df.to_csv("output/anomaly_log.csv", index=False)
+    print(f"[INFO] Anomaly detection completed. {len(anomaly_df)} out-of-order violations detected.")
+    if has_clock_id:
+        per_clock = anomaly_df["clock_id"].value_counts().sort_index()
+        print("[INFO] Violations by stamping clock: " + ", ".join(f"{cid}: {n}" for cid, n in per_clock.items()))
     print("Anomaly log saved to: output/anomaly_log.csv")
+    if not plots:
+        return
 
-    # Plot heatmap if seaborn is available
-    if seaborn_available:
-        plt.figure(figsize=(12, 5))
-        sns.heatmap(
-            anomaly_df[["position_in_stream", "current_order_id"]].T,
-            cmap="Reds", cbar=True, annot=True, fmt=".0f"
-        )
-        plt.title("Anomaly Heatmap (Order ID Violations due to Clock Drift)")
-        plt.yticks([0.5, 1.5], ['Position in Stream', 'Order ID'], rotation=0)
-        plt.tight_layout()
-        plt.savefig("output/plots/anomaly_heatmap.png")
-        plt.close()
-        print("Anomaly heatmap saved to: output/plots/anomaly_heatmap.png")
-else:
-    print("[OK] No anomalies detected — all order IDs are in correct sequence.")
-    # Save empty CSV to maintain consistent output
-    pd.DataFrame(columns=["position_in_stream", "current_order_id", "previous_order_id"]).to_csv(
-        "output/anomaly_log.csv", index=False
+    # Plot heatmap if seaborn is available (optional; it is the slowest plotting import)
+    try:
+        import seaborn as sns
+    except ImportError:
+        print("[INFO] seaborn not installed (pip install seaborn); skipping the anomaly heatmap.")
+        return
+    import matplotlib.pyplot as plt
+    set_phase("plot")
+    plt.figure(figsize=(12, 5))
+    sns.heatmap(
+        anomaly_df[["position_in_stream", "current_order_id"]].head(max_heatmap_anomalies).T,
+        cmap="Reds", cbar=True, annot=True, fmt=".0f"
     )
+    plt.title("Anomaly Heatmap (Order ID Violations due to Clock Drift)")
+    plt.yticks([0.5, 1.5], ['Position in Stream', 'Order ID'], rotation=0)
+    plt.tight_layout()
+    plt.savefig("output/plots/anomaly_heatmap.png")
+    plt.close()
+    print("Anomaly heatmap saved to: output/plots/anomaly_heatmap.png")
+
+
+if __name__ == "__main__":
+    run_stage(globals())
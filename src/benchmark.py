@@ -0,0 +1,186 @@
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+from stage_params import PARAMS_ENV, PLOTS_ENV
+from pipeline import SRC_DIR, PROJECT_ROOT, STAGES, stage_inputs
+
+# ⏱️ Stage benchmark suite
+#
+# Runs every stage script at several problem sizes (samples of the drift
+# series, or orders / model samples for the stages that do not read it) in a
+# scratch project root, one size at a time, in pipeline order. Each stage is a
+# separate process, so its wall time, peak RSS (from the child's rusage) and
+# throughput (samples / wall time) are measured end to end, CSV and plot I/O
+# included. Results are appended to a CSV; --baseline compares the run against
+# a stored results file and fails when a stage got slower or bigger than the
+# regression threshold allows. --no-plots times the stages without their plots.
+#
+#   python src/benchmark.py --sizes 1e4 1e5 --save-baseline
+#   python src/benchmark.py --sizes 1e4 1e5 --baseline benchmarks/baseline.csv
+
+SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+RESULTS_PATH = os.path.join(PROJECT_ROOT, "output", "benchmarks", "bench_results.csv")
+BASELINE_PATH = os.path.join(PROJECT_ROOT, "benchmarks", "baseline.csv")
+THRESHOLD = 0.25             # Allowed slowdown / growth over the baseline (25%)
+MIN_BASELINE_WALL_S = 0.5    # Wall times below this are too noisy to flag
+
+RESULT_FIELDS = ["run", "size", "stage", "wall_s", "peak_rss_mb", "samples_per_s", "status"]
+
+# Stage parameters that make the stage process `n` samples. The drift series
+# is sampled at 1 MHz; orders are taken from every drift sample.
+SIZING = {
+    "clock": lambda n: {"duration_sec": n / 1e6},
+    "faults": lambda n: {},
+    "feedback": lambda n: {},
+    "ptp": lambda n: {},
+    "stability": lambda n: {},
+    "orders": lambda n: {"order_interval": 1},
+    "anomalies": lambda n: {},
+    "resequence": lambda n: {},
+    "skew": lambda n: {},
+    "loss": lambda n: {},
+    "signal": lambda n: {"samples": n},
+    "vlsi": lambda n: {"mc_samples": max(1, n // 1024)},  # n sink delays on the default 1024-sink tree
+}
+
+
+def run_stage(stage, root, params, log_path, plots=True):
+    # Runs a stage script with `root` as the project root; returns (ok, wall_s, peak_rss_mb)
+    env = dict(os.environ, CLOCK_DRIFT_PROJECT_ROOT=root, MPLBACKEND="Agg")
+    env[PARAMS_ENV] = json.dumps(params)
+    env[PLOTS_ENV] = "1" if plots else "0"
+    with open(log_path, "a") as log:
+        log.write(f"==> {stage} {json.dumps(params)}\n")
+        log.flush()
+        started = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, os.path.join(SRC_DIR, STAGES[stage]["script"])],
+                                cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, "wait4"):
+            # Per-child rusage; ru_maxrss is in KiB on Linux and bytes on macOS
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            scale = 1 if sys.platform == "darwin" else 1024
+            peak_rss_mb = usage.ru_maxrss * scale / 2 ** 20
+        else:
+            proc.wait()
+            peak_rss_mb = float("nan")
+        wall = time.perf_counter() - started
+    return proc.returncode == 0, wall, peak_rss_mb
+
+
+def run_benchmarks(sizes=SIZES, stages=None, results_path=RESULTS_PATH, work_dir=None, plots=True, report=print):
+    # Returns the result rows of this run (also appended to results_path).
+    # Selected stages run with whatever produces their inputs, in pipeline order.
+    wanted = set(SIZING if stages is None else stages)
+    for stage in reversed(list(SIZING)):
+        if stage in wanted:
+            wanted.update(stage_inputs(stage, SIZING[stage](0)).values())
+    stages = [stage for stage in SIZING if stage in wanted]
+    run_id = time.strftime("%Y%m%dT%H%M%S")
+    rows = []
+    for size in sizes:
+        size = int(size)
+        root = work_dir or os.path.join(PROJECT_ROOT, "output", "benchmarks", "work")
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        os.makedirs(os.path.dirname(results_path), exist_ok=True)
+        log_path = os.path.join(os.path.dirname(results_path), f"bench_{run_id}_{size}.log")
+        failed = set()
+        for stage in stages:
+            if set(stage_inputs(stage, SIZING[stage](size)).values()) & failed:
+                failed.add(stage)
+                row = {"run": run_id, "size": size, "stage": stage, "wall_s": "", "peak_rss_mb": "",
+                       "samples_per_s": "", "status": "skipped"}
+            else:
+                ok, wall, rss = run_stage(stage, root, SIZING[stage](size), log_path, plots)
+                if not ok:
+                    failed.add(stage)
+                row = {"run": run_id, "size": size, "stage": stage, "wall_s": round(wall, 4),
+                       "peak_rss_mb": round(rss, 1), "samples_per_s": round(size / wall), "status": "ok" if ok else "failed"}
+            rows.append(row)
+            report(f"{size:>10} {stage:<10} {row['status']:<8} {row['wall_s']:>9} s {row['peak_rss_mb']:>8} MB "
+                   f"{row['samples_per_s']:>12} samples/s")
+        shutil.rmtree(root, ignore_errors=True)
+
+    new_file = not os.path.exists(results_path)
+    with open(results_path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def load_results(path):
+    # Latest measurement per (size, stage) in a results file
+    latest = {}
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            if row["status"] == "ok":
+                latest[(int(row["size"]), row["stage"])] = row
+    return latest
+
+
+def save_baseline(rows, path=BASELINE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(row for row in rows if row["status"] == "ok")
+
+
+def compare(rows, baseline, threshold=THRESHOLD):
+    # Regressions of this run against a baseline: a list of messages
+    regressions = []
+    for row in rows:
+        base = baseline.get((row["size"], row["stage"]))
+        if row["status"] != "ok":
+            if base is not None:
+                regressions.append(f"{row['stage']} @ {row['size']}: {row['status']}")
+            continue
+        if base is None:
+            continue
+        base_wall = float(base["wall_s"])
+        if base_wall >= MIN_BASELINE_WALL_S and row["wall_s"] > base_wall * (1 + threshold):
+            regressions.append(f"{row['stage']} @ {row['size']}: wall {row['wall_s']:.2f} s vs {base_wall:.2f} s")
+        base_rss = float(base["peak_rss_mb"])
+        if base_rss == base_rss and row["peak_rss_mb"] > base_rss * (1 + threshold):  # skip NaN baselines
+            regressions.append(f"{row['stage']} @ {row['size']}: peak RSS {row['peak_rss_mb']:.0f} MB vs {base_rss:.0f} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the stage scripts at several problem sizes.")
+    parser.add_argument("--sizes", nargs="+", type=float, default=SIZES, help="samples per run (default: 1e4 .. 1e7)")
+    parser.add_argument("--stages", nargs="+", choices=list(SIZING), default=None, help="stages to run (default: all)")
+    parser.add_argument("--results", default=RESULTS_PATH, help="results CSV, appended to")
+    parser.add_argument("--baseline", default=None, help="results CSV to compare against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed regression (fraction)")
+    parser.add_argument("--save-baseline", action="store_true", help=f"store this run as {os.path.relpath(BASELINE_PATH)}")
+    parser.add_argument("--no-plots", action="store_true", help="run the stages without their plots")
+    args = parser.parse_args(argv)
+
+    print(f"Python {platform.python_version()} on {platform.platform()}, {os.cpu_count()} CPU(s)")
+    rows = run_benchmarks(args.sizes, args.stages, args.results, plots=not args.no_plots)
+    print(f"Results appended to: {args.results}")
+    if args.save_baseline:
+        save_baseline(rows)
+        print(f"Baseline saved to: {BASELINE_PATH}")
+    status = 1 if any(row["status"] == "failed" for row in rows) else 0
+    if args.baseline:
+        regressions = compare(rows, load_results(args.baseline), args.threshold)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        print(f"{len(regressions)} regression(s) against {args.baseline} (threshold {args.threshold:.0%})")
+        status = status or (1 if regressions else 0)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import os
+import glob
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from sample_store import load_strided, save_table_chunks
+from timebase import ticks_per_second
+from capture_log import (capture_dtype, capture_epoch, capture_records, capture_tables, merge_captures, merge_runs,
+                         new_runs, scan_capture, sort_runs, spill_runs)
+from clock_stream import with_throughput
+from stage_params import run_stage
+from instrumentation import section, set_phase
+
+# 🛰️ Capture Import Parameters (record format: see capture_log.py)
+# Replaces clock_simulator.py + order_simulator.py with real captures: the
+# clock table and both order tables are written where those stages put them.
+capture_files = ["data/captures/*.bin"]   # Files or glob patterns, e.g. one file per port
+record_layout = None       # {field: [format, offset]} for port / sequence / hw_ts / ptp_ts; None = 24-byte default
+record_size = None         # Bytes per record (None = end of the last field)
+header_bytes = 0           # File header skipped before the first record
+ts_unit = "ns"             # Unit of hw_ts / ptp_ts ("ns", "ps", ...)
+delta_dtype = "int64"      # dtype of the stored hw_ts - ptp_ts column ("int32" halves it when offsets fit)
+order_interval = 1         # Every Nth record (PTP order) becomes an order
+chunk_size = 1 << 20       # Records per memory-mapped view
+max_merge_runs = 1024      # Sorted runs merged into drifted_orders.csv (a run ends where a port's hw_ts steps back) ...
+in_memory_sort_rows = 10_000_000  # ... beyond that, orders sorted in RAM up to this many
+max_plot_points = 1_000_000
+
+
+def append_orders(path, chunk):
+    # Append one chunk of orders to a CSV, writing the header on first use
+    with section("csv_io"):
+        pd.DataFrame(chunk).to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+
+
+def main(plots=True):
+    os.makedirs("data", exist_ok=True)
+    os.makedirs("output/plots", exist_ok=True)
+
+    paths = sorted({path for pattern in capture_files for path in glob.glob(pattern)})
+    if not paths:
+        raise FileNotFoundError(f"No capture files match {capture_files}")
+    dtype = capture_dtype(None if record_layout is None else {k: tuple(v) for k, v in record_layout.items()}, record_size)
+    tps = ticks_per_second(ts_unit)
+
+    # 🔎 One pass over every file: per-port counts, sequence gaps, ordering
+    scans = []
+    for path in paths:
+        count, partial = capture_records(path, dtype, header_bytes)
+        if partial:
+            print(f"[WARN] {path}: ignoring {partial} trailing bytes of a partial record")
+        scan = scan_capture(path, dtype, header_bytes, chunk_records=chunk_size)
+        if scan["key_backwards"]:
+            raise ValueError(f"{path}: ptp_ts goes backwards {scan['key_backwards']} times; "
+                             "captures must be in timestamp order to be merged")
+        for stats in scan["ports"]:
+            scans.append({"file": path, **stats})
+        print(f"{path}: {count} records, ports {[stats['port'] for stats in scan['ports']]}")
+    summary_df = pd.DataFrame(scans)
+    with section("csv_io"):
+        summary_df.to_csv("output/capture_summary.csv", index=False)
+    print("Capture summary saved to: output/capture_summary.csv")
+
+    rows = int(summary_df["records"].sum()) if len(summary_df) else 0
+    if not rows:
+        raise ValueError(f"Capture files {paths} hold no records")
+    epoch_ticks = capture_epoch(summary_df["first_ptp_ts"].min(), ts_unit)
+    span_s = (summary_df["last_ptp_ts"].max() - summary_df["first_ptp_ts"].min()) / tps
+    attrs = {
+        "source": "capture",
+        "capture_files": paths,
+        "duration_sec": span_s,
+        "sampling_rate_hz": (rows - 1) / span_s if span_s > 0 else 1.0,  # mean record rate
+        "time_unit": ts_unit,
+        "epoch_ns": epoch_ticks * 10 ** 9 // tps,
+    }
+
+    # 🔁 Merge the files by PTP time into the clock table, sampling orders on the way:
+    # they arrive in PTP (reference) order, so normal orders are appended as they
+    # come, and each port's orders are spilled as runs sorted by hardware time
+    stamps = (f"fpga_1_ts_{ts_unit}", f"fpga_2_ts_{ts_unit}")
+    for path in ("data/normal_orders.csv", "data/drifted_orders.csv"):
+        if os.path.exists(path):
+            os.remove(path)
+    run_dir = tempfile.mkdtemp(prefix="drifted_runs_", dir="data")
+    runs = new_runs(run_dir, stamps[1])
+
+    def clock_chunks():
+        merged = merge_captures(paths, dtype, header_bytes, chunk_records=chunk_size)
+        for table in capture_tables(merged, epoch_ticks, delta_dtype):
+            picked = table["sample"] % order_interval == 0
+            orders = {
+                "order_id": table["sample"][picked] // order_interval,
+                "clock_id": table["port"][picked].astype(np.int64),
+                stamps[0]: table["time_ticks"][picked],
+                stamps[1]: table["time_ticks"][picked] + table["fpga_2_delta"][picked].astype(np.int64),
+            }
+            append_orders("data/normal_orders.csv", orders)
+            spill_runs(runs, orders, "clock_id")
+            yield {col: table[col] for col in ("sample", "time_ticks", "fpga_2_delta")}
+
+    try:
+        save_table_chunks("data/clock_drift", with_throughput(clock_chunks(), "capture_import"), rows=rows,
+                          attrs=attrs)
+        print("Clock table saved to: data/clock_drift.cols")
+        print("Normal order timestamps saved to: data/normal_orders.csv")
+
+        # 🔀 Drifted orders: k-way merge of the sorted runs by hardware time
+        if len(runs["paths"]) <= max_merge_runs:
+            drifted = merge_runs(runs, chunk_size)
+        elif runs["rows"] <= in_memory_sort_rows:
+            print(f"[WARN] {len(runs['paths'])} hardware-time runs (hw_ts steps back often); sorting in memory")
+            drifted = [sort_runs(runs)]
+        else:
+            raise ValueError(f"hw_ts steps back into {len(runs['paths'])} sorted runs over {runs['rows']} orders; "
+                             f"raise max_merge_runs or in_memory_sort_rows")
+        for chunk in drifted:
+            tied_by_ptp = np.lexsort((chunk["order_id"], chunk[stamps[1]]))  # equal hw_ts: PTP order, as before
+            append_orders("data/drifted_orders.csv", {col: values[tied_by_ptp] for col, values in chunk.items()})
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+    print("Drifted order timestamps saved to: data/drifted_orders.csv")
+
+    if not plots:
+        return
+
+    import matplotlib.pyplot as plt
+    set_phase("plot")
+    # 📈 Hardware vs PTP time over the capture
+    clock = load_strided("data/clock_drift", columns=["time_sec", "drift_us"], max_points=max_plot_points)
+    plt.figure(figsize=(10, 5))
+    plt.plot(clock["time_sec"], clock["drift_us"], color="red", linewidth=0.8)
+    plt.xlabel("PTP time since epoch (s)")
+    plt.ylabel("Hardware - PTP timestamp (µs)")
+    plt.title("Captured Clock Offset")
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig("output/plots/capture_drift.png")
+    plt.close()
+    print("Capture plot saved to: output/plots/capture_drift.png")
+
+
+if __name__ == "__main__":
+    run_stage(globals())
@@ -0,0 +1,200 @@
+import os
+import numpy as np
+from order_flow import merge_streams
+from timebase import encode_delta, ticks_per_second
+
+# 🛰️ Binary FPGA capture logs
+#
+# A capture file is a flat array of fixed-width little-endian records, one
+# per timestamped event, optionally behind a file header:
+#
+#   port      u2   @0    capture port
+#   sequence  u4   @4    per-port sequence number
+#   hw_ts     u8   @8    free-running hardware timestamp (ticks of ts_unit)
+#   ptp_ts    u8   @16   PTP-corrected timestamp (same unit)
+#                        24 bytes per record
+#
+# (capture_dtype() builds the structured dtype for another layout: any
+# offsets, widths and record size, extra fields ignored.) Files are
+# memory-mapped with that dtype and read through chunk-sized views, so
+# nothing is parsed per record and memory stays at one chunk of the fields
+# in use however many GB the capture is. Each file must be in timestamp order;
+# several files (one per port, or per capture host) are combined with the
+# k-way chunk merge of order_flow.merge_streams.
+#
+# Captures map onto the tables the simulated stages produce, in integer ticks
+# (see timebase.py): PTP-corrected time plays FPGA_1 (the reference) and the
+# hardware timestamp FPGA_2 (the drifting clock).
+#
+#   clock table   sample, time_ticks = ptp_ts - epoch, fpga_2_delta = hw_ts - ptp_ts
+#   orders        order_id (PTP order), clock_id = port, fpga_1_ts_<unit>, fpga_2_ts_<unit>
+
+CAPTURE_FIELDS = ["port", "sequence", "hw_ts", "ptp_ts"]
+DEFAULT_LAYOUT = {
+    "port": ("<u2", 0),
+    "sequence": ("<u4", 4),
+    "hw_ts": ("<u8", 8),
+    "ptp_ts": ("<u8", 16),
+}
+DEFAULT_RECORD_SIZE = 24
+
+
+def capture_dtype(layout=None, record_size=None):
+    # Structured record dtype from {field: (format, byte offset)}
+    layout = DEFAULT_LAYOUT if layout is None else layout
+    missing = [field for field in CAPTURE_FIELDS if field not in layout]
+    if missing:
+        raise KeyError(f"Capture layout has no field(s) {missing}")
+    names = list(layout)
+    spec = {"names": names, "formats": [layout[n][0] for n in names], "offsets": [int(layout[n][1]) for n in names]}
+    if record_size is not None:
+        spec["itemsize"] = int(record_size)
+    return np.dtype(spec)
+
+
+def capture_records(path, dtype, header_bytes=0):
+    # (whole records, trailing bytes of a partly written record) in a capture file
+    body = os.path.getsize(path) - header_bytes
+    if body < 0:
+        raise ValueError(f"Capture '{path}' is shorter than its {header_bytes}-byte header")
+    return body // dtype.itemsize, body % dtype.itemsize
+
+
+def open_capture(path, dtype, header_bytes=0):
+    # Read-only memory map of the whole records (no data is read yet)
+    count, _ = capture_records(path, dtype, header_bytes)
+    if not count:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=header_bytes, shape=(count,))
+
+
+def iter_capture_chunks(path, dtype, header_bytes=0, fields=CAPTURE_FIELDS, chunk_records=1 << 20):
+    # {field: ndarray} per chunk of records; only these fields of this chunk are copied out
+    records = open_capture(path, dtype, header_bytes)
+    for start in range(0, len(records), chunk_records):
+        view = records[start:start + chunk_records]
+        yield {field: np.array(view[field]) for field in fields}
+
+
+def scan_capture(path, dtype, header_bytes=0, key="ptp_ts", chunk_records=1 << 20):
+    # Per-port statistics of one file in a single pass: records, first / last
+    # timestamps, sequence gaps (missing numbers) and repeats / rewinds, and
+    # how often `key` went backwards in the file (which rules out merging it)
+    ports = {}
+    last_key = None
+    key_backwards = 0
+    for chunk in iter_capture_chunks(path, dtype, header_bytes, chunk_records=chunk_records):
+        keys = chunk[key]
+        if len(keys):
+            key_backwards += int(np.count_nonzero(keys[1:] < keys[:-1]))
+            key_backwards += int(last_key is not None and keys[0] < last_key)
+            last_key = keys[-1]
+        for port in np.unique(chunk["port"]):
+            mine = chunk["port"] == port
+            seq = chunk["sequence"][mine].astype(np.int64)
+            stats = ports.setdefault(int(port), {
+                "port": int(port), "records": 0, "sequence_gaps": 0, "sequence_rewinds": 0, "last_sequence": None,
+                "first_hw_ts": int(chunk["hw_ts"][mine][0]), "first_ptp_ts": int(chunk["ptp_ts"][mine][0]),
+            })
+            steps = np.diff(seq if stats["last_sequence"] is None else np.concatenate(([stats["last_sequence"]], seq)))
+            stats["records"] += len(seq)
+            stats["sequence_gaps"] += int((steps[steps > 1] - 1).sum())
+            stats["sequence_rewinds"] += int(np.count_nonzero(steps <= 0))
+            stats["last_sequence"] = int(seq[-1])
+            stats["last_hw_ts"] = int(chunk["hw_ts"][mine][-1])
+            stats["last_ptp_ts"] = int(chunk["ptp_ts"][mine][-1])
+    return {"path": path, "key_backwards": key_backwards, "ports": [ports[p] for p in sorted(ports)]}
+
+
+def merge_captures(paths, dtype, header_bytes=0, key="ptp_ts", chunk_records=1 << 20):
+    # One stream of field chunks over several capture files, in `key` order
+    streams = [iter_capture_chunks(path, dtype, header_bytes, chunk_records=chunk_records) for path in paths]
+    return merge_streams(streams, key=key)
+
+
+def capture_epoch(first_ptp_ts, unit):
+    # Tick 0 of the tables: the earliest PTP timestamp, rounded down to a whole second
+    tps = ticks_per_second(unit)
+    return int(first_ptp_ts) // tps * tps
+
+
+def capture_tables(chunks, epoch_ticks, delta_dtype="int64"):
+    # Clock-table chunks (sample, time_ticks, fpga_2_delta) plus the port of
+    # each row, from merged capture chunks
+    start = 0
+    for chunk in chunks:
+        ptp = chunk["ptp_ts"].astype(np.int64)
+        delta = chunk["hw_ts"].astype(np.int64) - ptp
+        yield {
+            "sample": np.arange(start, start + len(ptp)),
+            "time_ticks": ptp - epoch_ticks,
+            "fpga_2_delta": encode_delta(delta, delta_dtype),
+            "port": chunk["port"],
+        }
+        start += len(ptp)
+
+
+# 🧮 Sorted runs: rows re-sequenced by another key (hardware time) in bounded
+# memory. spill_runs() appends each group's rows (one group per port) to raw
+# record files, starting a new run whenever the group's key steps back, so
+# every run is sorted; merge_runs() k-way merges them with merge_streams.
+
+def new_runs(run_dir, key):
+    return {"dir": run_dir, "key": key, "dtype": None, "paths": [], "current": {}, "last": {}, "rows": 0}
+
+
+def spill_runs(runs, chunk, group):
+    # Append a chunk ({column: ndarray}) to the sorted runs of each value of chunk[group]
+    if runs["dtype"] is None:
+        runs["dtype"] = np.dtype([(col, np.asarray(values).dtype) for col, values in chunk.items()])
+    groups = np.asarray(chunk[group])
+    for g in np.unique(groups).tolist():
+        mine = groups == g
+        records = np.empty(int(mine.sum()), dtype=runs["dtype"])
+        for col in runs["dtype"].names:
+            records[col] = chunk[col][mine]
+        keys = records[runs["key"]]
+        previous = np.concatenate(([runs["last"].get(g, keys[0])], keys[:-1]))
+        for i, part in enumerate(np.split(records, np.flatnonzero(keys < previous))):
+            if i or g not in runs["current"]:
+                runs["current"][g] = os.path.join(runs["dir"], f"run_{len(runs['paths']):06d}.bin")
+                runs["paths"].append(runs["current"][g])
+            with open(runs["current"][g], "ab") as f:
+                part.tofile(f)
+        runs["last"][g] = keys[-1]
+        runs["rows"] += len(records)
+
+
+# Helper: {column: ndarray} chunks of one spilled run
+def _iter_run(path, dtype, chunk_records):
+    count = os.path.getsize(path) // dtype.itemsize
+    for start in range(0, count, chunk_records):
+        records = np.fromfile(path, dtype=dtype, count=min(chunk_records, count - start), offset=start * dtype.itemsize)
+        yield {col: records[col] for col in dtype.names}
+
+
+def merge_runs(runs, chunk_records=1 << 20):
+    # Every spilled row in key order, as chunks; the merge buffers about
+    # chunk_records rows in total across the runs
+    per_run = max(chunk_records // max(len(runs["paths"]), 1), 1024)
+    return merge_streams([_iter_run(path, runs["dtype"], per_run) for path in runs["paths"]], key=runs["key"])
+
+
+def sort_runs(runs):
+    # Every spilled row in key order as one in-memory chunk (when there are too many runs to merge)
+    records = np.concatenate([np.fromfile(path, dtype=runs["dtype"]) for path in runs["paths"]])
+    records = records[np.argsort(records[runs["key"]], kind="stable")]
+    return {col: records[col] for col in runs["dtype"].names}
+
+
+def write_capture(path, columns, dtype=None, header=b""):
+    # Write records (e.g. synthesized or converted captures) in the binary format
+    dtype = capture_dtype() if dtype is None else dtype
+    n = len(columns["port"])
+    records = np.zeros(n, dtype=dtype)
+    for field, values in columns.items():
+        records[field] = values
+    with open(path, "wb") as f:
+        f.write(header)
+        records.tofile(f)
+    return n
@@ -0,0 +1,89 @@
+import os
+import sys
+import argparse
+from stage_params import ROOT_ENV, parse_value, run_stage, stage_overrides
+from pipeline import STAGES
+
+# 🖥️ Command-line entry point
+#
+# One subcommand per pipeline stage (the keys of pipeline.STAGES) plus the
+# scripts that sit outside the DAG. A stage subcommand runs the script's
+# main() in this process (stage_params.run_stage), with --set overrides on top
+# of CLOCK_DRIFT_STAGE_PARAMS; with --no-plots matplotlib is never imported.
+# `pipeline` and `bench` hand the rest of the command line to pipeline.py and
+# benchmark.py.
+#
+#   python src/cli.py list
+#   python src/cli.py clock --set duration_sec=2 --no-plots
+#   python src/cli.py resequence --set hold_mode=adaptive --root /tmp/run1
+#   python src/cli.py pipeline --no-plots anomalies loss
+#   python src/cli.py bench --sizes 1e4 1e5 --no-plots
+
+# Stage scripts that are not pipeline stages: external inputs, or runs of many pipelines
+EXTRA_COMMANDS = {
+    "capture": "capture_import.py",
+    "stream": "stream_anomaly_detector.py",
+    "sweep": "parameter_sweep.py",
+    "risk": "risk_simulation.py",
+}
+
+
+def stage_commands():
+    # Subcommand -> stage script
+    commands = {stage: spec["script"] for stage, spec in STAGES.items()}
+    commands.update(EXTRA_COMMANDS)
+    return commands
+
+
+def parse_assignments(assignments):
+    # ["name=value", ...] -> {name: value}; values are JSON, else strings
+    params = {}
+    for assignment in assignments:
+        name, sep, raw = assignment.partition("=")
+        if not sep or not name:
+            raise ValueError(f"Expected param=value, got '{assignment}'")
+        params[name] = parse_value(raw)
+    return params
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "pipeline":
+        from pipeline import main as pipeline_main
+        return pipeline_main(argv[1:])
+    if argv and argv[0] == "bench":
+        from benchmark import main as benchmark_main
+        return benchmark_main(argv[1:])
+
+    commands = stage_commands()
+    parser = argparse.ArgumentParser(description="Run the clock drift stages, the pipeline or the benchmarks.")
+    subparsers = parser.add_subparsers(dest="command", required=True, metavar="COMMAND")
+    subparsers.add_parser("list", help="list the stage commands and their scripts")
+    subparsers.add_parser("pipeline", help="run the cached stage pipeline (options: cli.py pipeline --help)")
+    subparsers.add_parser("bench", help="benchmark the stages (options: cli.py bench --help)")
+    for command, script in commands.items():
+        stage = subparsers.add_parser(command, help=f"run {script}")
+        stage.add_argument("--set", dest="overrides", action="append", default=[], metavar="PARAM=VALUE",
+                           help="override a script parameter (JSON value, else string), repeatable")
+        stage.add_argument("--no-plots", action="store_true", help="skip plots (matplotlib is never imported)")
+        stage.add_argument("--root", default=None,
+                           help=f"project root with data/ and output/ (default: {ROOT_ENV} or the repository)")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for command, script in commands.items():
+            print(f"{command:<12} {script}")
+        return 0
+    try:
+        overrides = {**stage_overrides(), **parse_assignments(args.overrides)}
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.root is not None:
+        os.environ[ROOT_ENV] = os.path.abspath(args.root)
+        os.makedirs(args.root, exist_ok=True)
+    run_stage(os.path.splitext(commands[args.command])[0], overrides, plots=False if args.no_plots else None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import numpy as np
+import pandas as pd
+from fault_engine import make_fault_injector
+
+# 🛰️ N-FPGA clock fleet
+#
+# All clocks live in one (samples, num_clocks) array of offsets from true time:
+#
+#   offset_i(t) = initial_i + freq_i * t + 0.5 * aging_i * t^2 + thermal_i(t)
+#
+# where the thermal term integrates a per-clock temperature coefficient over a
+# sinusoidal site temperature (closed form, so chunk edges are seamless), and
+# optional faults come from fault_engine with a private seed per clock.
+#
+# Pairwise statistics are accumulated chunk by chunk over the upper-triangle
+# pairs at a configurable decimation (stats_every), in row blocks, so memory is
+# bounded and no full N x N x T series is ever built. Percentiles come from a
+# log-scale histogram whose bin is read straight from the float64 bit pattern
+# (exponent plus the top SUB_BITS mantissa bits), so binning is one shift.
+
+EXP_MIN = -60        # |offset| below 2**EXP_MIN counts as zero
+EXP_MAX = 0          # |offset| of 1 s and above goes to the top bin
+SUB_BITS = 4         # 16 sub-bins per power of two, ~6% relative resolution
+NUM_BINS = (EXP_MAX - EXP_MIN) << SUB_BITS
+PAIR_BLOCK = 1 << 21  # max (rows x pairs) elements per pairwise block
+
+
+def make_fleet(num_clocks, drift_ppm_std=10.0, aging_ppb_per_day_std=1.0, tempco_ppb_per_c_std=20.0,
+               initial_offset_std_s=0.0, seed=42):
+    rng = np.random.RandomState(seed)
+    return {
+        "num_clocks": num_clocks,
+        "freq": rng.normal(0, drift_ppm_std, num_clocks) * 1e-6,
+        "aging": rng.normal(0, aging_ppb_per_day_std, num_clocks) * 1e-9 / 86400,
+        "tempco": rng.normal(0, tempco_ppb_per_c_std, num_clocks) * 1e-9,
+        "temp_phase": rng.uniform(0, 2 * np.pi, num_clocks),
+        "initial": rng.normal(0, initial_offset_std_s, num_clocks) if initial_offset_std_s else np.zeros(num_clocks),
+        "seed": seed,
+    }
+
+
+def fleet_chunks(fleet, duration_sec, sampling_rate_hz, temp_amplitude_c=5.0, temp_period_s=60.0,
+                 faults=None, fault_chance=0.0, chunk_size=1 << 13):
+    # Yields (sample, time_sec, offsets[chunk, num_clocks]) with offsets in seconds
+    n = int(duration_sec * sampling_rate_hz)
+    w = 2 * np.pi / temp_period_s
+    thermal_scale = -fleet["tempco"] * temp_amplitude_c / w
+    injectors = []
+    if fault_chance > 0:
+        injectors = [make_fault_injector(faults, fault_chance, seed=fleet["seed"] + 1 + i)
+                     for i in range(fleet["num_clocks"])]
+
+    for start in range(0, n, chunk_size):
+        sample = np.arange(start, min(start + chunk_size, n))
+        t = (sample / sampling_rate_hz)[:, None]
+        offsets = fleet["freq"] * t
+        offsets += (0.5 * fleet["aging"]) * (t * t)
+        # cos(w t + phase) expanded so only one cos/sin per sample is evaluated
+        offsets += np.cos(w * t) * (thermal_scale * np.cos(fleet["temp_phase"]))
+        offsets -= np.sin(w * t) * (thermal_scale * np.sin(fleet["temp_phase"]))
+        offsets += fleet["initial"] - thermal_scale * np.cos(fleet["temp_phase"])
+        for i, inject in enumerate(injectors):
+            offsets[:, i] = inject(offsets[:, i])
+        yield sample, t[:, 0], offsets
+
+
+def offsets_at(fleet, t, clock_id, temp_amplitude_c=5.0, temp_period_s=60.0):
+    # Offset of clock_id[i] at true time t[i] (same model as fleet_chunks, no faults)
+    t = np.asarray(t, dtype=np.float64)
+    w = 2 * np.pi / temp_period_s
+    thermal_scale = -fleet["tempco"][clock_id] * temp_amplitude_c / w
+    phase = fleet["temp_phase"][clock_id]
+    return (fleet["initial"][clock_id] + fleet["freq"][clock_id] * t + 0.5 * fleet["aging"][clock_id] * t * t
+            + thermal_scale * (np.cos(w * t + phase) - np.cos(phase)))
+
+
+def new_pair_stats(num_clocks, threshold_s, stats_every=10, sampling_rate_hz=1e6):
+    pair_a, pair_b = np.triu_indices(num_clocks, k=1)
+    return {
+        "pair_a": pair_a,
+        "pair_b": pair_b,
+        "threshold_s": threshold_s,
+        "stats_every": stats_every,
+        "sample_period_s": 1.0 / sampling_rate_hz,
+        "max_abs": np.zeros(len(pair_a)),
+        "above": np.zeros(len(pair_a), dtype=np.int64),
+        "histogram": np.zeros((len(pair_a), NUM_BINS), dtype=np.int64),
+        "samples": 0,
+        # Fleet-wide spread (max - min over all clocks) at full rate
+        "spread_max": 0.0,
+        "spread_above": 0,
+        "spread_samples": 0,
+    }
+
+
+# Helper: log-scale histogram bin of each non-negative float64
+def _log_bins(abs_offsets):
+    bins = (abs_offsets.view(np.int64) >> (52 - SUB_BITS)) - ((1023 + EXP_MIN) << SUB_BITS)
+    return np.clip(bins, 0, NUM_BINS - 1, out=bins)
+
+
+def _bin_upper_edge(bins):
+    exponent = (bins >> SUB_BITS) + EXP_MIN
+    return (1.0 + ((bins & ((1 << SUB_BITS) - 1)) + 1) / (1 << SUB_BITS)) * 2.0 ** exponent
+
+
+def update_pair_stats(stats, offsets):
+    if not len(offsets):
+        return
+    seen = stats["spread_samples"]
+    spread = offsets.max(axis=1) - offsets.min(axis=1)
+    stats["spread_max"] = max(stats["spread_max"], float(spread.max()))
+    stats["spread_above"] += int((spread > stats["threshold_s"]).sum())
+    stats["spread_samples"] += len(offsets)
+
+    # Decimated rows aligned to global multiples of stats_every
+    rows = offsets[-seen % stats["stats_every"]::stats["stats_every"]]
+    num_clocks = offsets.shape[1]
+    num_pairs = len(stats["pair_a"])
+    block = max(1, PAIR_BLOCK // max(1, num_pairs))
+    pair_offsets = np.arange(num_pairs) * NUM_BINS
+    for r in range(0, len(rows), block):
+        sub = rows[r:r + block]
+        # Upper-triangle differences, one broadcast slice per clock (triu order)
+        diff = np.empty((len(sub), num_pairs))
+        col = 0
+        for i in range(num_clocks - 1):
+            width = num_clocks - 1 - i
+            np.subtract(sub[:, i:i + 1], sub[:, i + 1:], out=diff[:, col:col + width])
+            col += width
+        np.abs(diff, out=diff)
+        np.maximum(stats["max_abs"], diff.max(axis=0), out=stats["max_abs"])
+        stats["above"] += (diff > stats["threshold_s"]).sum(axis=0)
+        counts = np.bincount((_log_bins(diff) + pair_offsets).ravel(), minlength=num_pairs * NUM_BINS)
+        stats["histogram"] += counts.reshape(num_pairs, NUM_BINS)
+        stats["samples"] += len(sub)
+
+
+def pair_stats_table(stats, percentiles=(50, 99)):
+    cdf = np.cumsum(stats["histogram"], axis=1)
+    total = np.maximum(cdf[:, -1:], 1)
+    seconds_per_row = stats["stats_every"] * stats["sample_period_s"]
+    table = {
+        "clock_a": stats["pair_a"],
+        "clock_b": stats["pair_b"],
+        "max_abs_offset_s": stats["max_abs"],
+    }
+    for q in percentiles:
+        bins = np.argmax(cdf >= total * (q / 100.0), axis=1)
+        table[f"p{q:g}_abs_offset_s"] = _bin_upper_edge(bins)
+    table["time_above_threshold_s"] = stats["above"] * seconds_per_row
+    return pd.DataFrame(table)
+
+
+def fleet_summary(stats):
+    return {
+        "num_pairs": len(stats["pair_a"]),
+        "max_pairwise_offset_s": float(stats["max_abs"].max()) if len(stats["pair_a"]) else 0.0,
+        "max_fleet_spread_s": stats["spread_max"],
+        "fleet_spread_time_above_threshold_s": stats["spread_above"] * stats["sample_period_s"],
+        "threshold_s": stats["threshold_s"],
+        "samples": stats["spread_samples"],
+    }
+
+
+def stamp_orders(sample, time_sec, offsets, order_interval, rng, next_id=0):
+    # One order every order_interval samples, stamped by a random fleet member
+    local = np.arange(-sample[0] % order_interval, len(sample), order_interval)
+    clock_id = rng.randint(0, offsets.shape[1], size=len(local))
+    return {
+        "order_id": np.arange(next_id, next_id + len(local)),
+        "clock_id": clock_id,
+        "fpga_1_ts": time_sec[local],
+        "fpga_2_ts": time_sec[local] + offsets[local, clock_id],
+    }
@@ -0,0 +1,180 @@
+import numpy as np
+
+# 🧭 Batched Kalman clock-state estimator
+#
+# Each clock's state is x = [offset (s), frequency error (s/s), frequency
+# drift (1/s)], propagated over an interval tau by
+#
+#   F(tau) = [[1, tau, tau^2 / 2],
+#             [0,   1,       tau],
+#             [0,   0,         1]]
+#
+# with the usual three-state clock process noise: white FM (q_offset, s^2/s),
+# random-walk FM (q_freq, 1/s) and random-walk drift (q_drift, 1/s^3) noise
+# densities integrated over tau. Measurements are offsets, z = x[0] + v with
+# std measurement_std_s.
+#
+# K clocks are filtered together: x is K x 3 and P is K x 3 x 3, and every
+# predict / update is a handful of stacked 3x3 products (einsum / matmul), so
+# the Python loop runs over measurement steps, never over clocks. Measurement
+# times may differ per clock and be irregular; a NaN time or offset skips that
+# clock at that step.
+#
+# Outliers (injected spikes, bursts) are gated on the normalized innovation:
+# a measurement more than gate_sigma standard deviations from the prediction
+# is rejected. After max_rejects rejections in a row the clock is assumed to
+# have really stepped (e.g. a drift jump): the measurement is accepted with the
+# covariance re-opened to its initial size, so the filter re-locks.
+#
+# predict_offsets() evaluates the last posterior before each query time,
+# propagated forward, so corrections between sync events are applied ahead of
+# time from past measurements only.
+
+
+def process_noise(tau, q_offset, q_freq, q_drift):
+    # Q(tau) for a batch of intervals: len(tau) x 3 x 3
+    t1 = np.asarray(tau, dtype=np.float64)
+    t2, t3, t4, t5 = t1 ** 2, t1 ** 3, t1 ** 4, t1 ** 5
+    q = np.empty((len(t1), 3, 3))
+    q[:, 0, 0] = q_offset * t1 + q_freq * t3 / 3 + q_drift * t5 / 20
+    q[:, 0, 1] = q[:, 1, 0] = q_freq * t2 / 2 + q_drift * t4 / 8
+    q[:, 0, 2] = q[:, 2, 0] = q_drift * t3 / 6
+    q[:, 1, 1] = q_freq * t1 + q_drift * t3 / 3
+    q[:, 1, 2] = q[:, 2, 1] = q_drift * t2 / 2
+    q[:, 2, 2] = q_drift * t1
+    return q
+
+
+def transition(tau):
+    tau = np.asarray(tau, dtype=np.float64)
+    f = np.zeros((len(tau), 3, 3))
+    f[:, [0, 1, 2], [0, 1, 2]] = 1.0
+    f[:, 0, 1] = f[:, 1, 2] = tau
+    f[:, 0, 2] = tau ** 2 / 2
+    return f
+
+
+def new_kalman_state(num_clocks, measurement_std_s=1e-9, q_offset=1e-20, q_freq=1e-16, q_drift=1e-24,
+                     initial_std=(1e-3, 1e-4, 1e-8), gate_sigma=5.0, max_rejects=5):
+    p0 = np.diag(np.asarray(initial_std, dtype=np.float64) ** 2)
+    return {
+        "t": np.full(num_clocks, np.nan),        # time of the last update (NaN = no measurement yet)
+        "x": np.zeros((num_clocks, 3)),
+        "P": np.repeat(p0[None], num_clocks, axis=0),
+        "P0": p0,
+        "R": measurement_std_s ** 2,
+        "q": (q_offset, q_freq, q_drift),
+        "gate_sigma": gate_sigma,
+        "max_rejects": max_rejects,
+        "rejects": np.zeros(num_clocks, dtype=np.int64),   # consecutive rejections
+        "updates": 0,
+        "rejected": 0,
+    }
+
+
+def kalman_step(state, t, z):
+    # One measurement step for all clocks: t, z are length-K (NaN skips a clock).
+    # Returns (accepted, innovation) per clock.
+    t = np.asarray(t, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    active = ~(np.isnan(t) | np.isnan(z))
+    first = active & np.isnan(state["t"])
+    state["t"][first] = t[first]
+    tau = np.where(active, t - state["t"], 0.0)
+
+    # Predict
+    f = transition(tau)
+    x = np.einsum("kij,kj->ki", f, state["x"])
+    p = f @ state["P"] @ f.transpose(0, 2, 1) + process_noise(tau, *state["q"])
+
+    # Gate and update (H = [1, 0, 0])
+    innovation = np.where(active, z - x[:, 0], 0.0)
+    s = p[:, 0, 0] + state["R"]
+    outlier = active & (innovation ** 2 > state["gate_sigma"] ** 2 * s)
+    relock = outlier & (state["rejects"] >= state["max_rejects"])
+    p[relock] += state["P0"]
+    s = p[:, 0, 0] + state["R"]
+    accepted = active & (~outlier | relock)
+    gain = p[:, :, 0] / s[:, None]
+    gain[~accepted] = 0.0
+    x += gain * innovation[:, None]
+    p -= gain[:, :, None] * p[:, None, 0, :]
+    p = (p + p.transpose(0, 2, 1)) / 2  # keep P symmetric
+
+    state["x"] = np.where(active[:, None], x, state["x"])
+    state["P"] = np.where(active[:, None, None], p, state["P"])
+    state["t"] = np.where(active, t, state["t"])
+    state["rejects"] = np.where(accepted, 0, state["rejects"] + (active & ~accepted))
+    state["updates"] += int(accepted.sum())
+    state["rejected"] += int((active & ~accepted).sum())
+    return accepted, innovation
+
+
+def run_kalman(state, times, offsets):
+    # Filter M measurement steps: times is M (shared) or M x K, offsets M x K.
+    # Returns the posterior after every step: t (M x K), x (M x K x 3),
+    # accepted and innovation (M x K).
+    offsets = np.asarray(offsets, dtype=np.float64)
+    if offsets.ndim == 1:
+        offsets = offsets[:, None]
+    times = np.broadcast_to(np.asarray(times, dtype=np.float64).reshape(len(offsets), -1), offsets.shape)
+    m, k = offsets.shape
+    out = {"t": np.empty((m, k)), "x": np.empty((m, k, 3)), "accepted": np.empty((m, k), dtype=bool),
+           "innovation": np.empty((m, k))}
+    for i in range(m):
+        out["accepted"][i], out["innovation"][i] = kalman_step(state, times[i], offsets[i])
+        out["t"][i] = state["t"]
+        out["x"][i] = state["x"]
+    return out
+
+
+def predict_offsets(t_post, x_post, t, initial=None, available=None):
+    # Offsets of one clock at sorted query times t, each predicted from the
+    # latest posterior available strictly before it (t_post: M, x_post: M x 3).
+    # available (M, default t_post) is when each posterior becomes usable, e.g.
+    # the Delay_Resp arrival of a PTP exchange measured earlier. initial =
+    # (t0, x0) covers queries before the first posterior; otherwise they get 0.
+    t = np.asarray(t, dtype=np.float64)
+    t_post = np.asarray(t_post, dtype=np.float64)
+    x_post = np.asarray(x_post, dtype=np.float64).reshape(-1, 3)
+    available = t_post if available is None else np.asarray(available, dtype=np.float64)
+    if initial is not None and not np.isnan(initial[0]):
+        t_post = np.concatenate(([initial[0]], t_post))
+        x_post = np.concatenate((np.asarray(initial[1], dtype=np.float64).reshape(1, 3), x_post))
+        available = np.concatenate(([initial[0]], available))
+    if not len(t_post):
+        return np.zeros(len(t))
+    idx = np.searchsorted(available, t, side="left") - 1
+    valid = idx >= 0
+    idx = np.maximum(idx, 0)
+    dt = t - t_post[idx]
+    x = x_post[idx]
+    return np.where(valid, x[:, 0] + x[:, 1] * dt + x[:, 2] * dt ** 2 / 2, 0.0)
+
+
+def make_kalman_corrector(measure_every=1000, sample_rate_hz=1e6, **kalman_kwargs):
+    # Stateful (reference, measured) chunk -> (corrected, state) function, like
+    # make_servo(): the offset is measured every measure_every samples and each
+    # sample is corrected by the offset predicted from earlier measurements
+    state = new_kalman_state(1, **kalman_kwargs)
+    carry = {"start": 0}
+
+    def correct(reference, measured):
+        reference = np.asarray(reference, dtype=np.float64)
+        measured = np.asarray(measured, dtype=np.float64)
+        start = carry["start"]
+        t = (start + np.arange(len(measured))) / sample_rate_hz
+        local = np.arange(-start % measure_every, len(measured), measure_every)
+        initial = (state["t"][0], state["x"][0].copy())
+        post = run_kalman(state, t[local], (measured - reference)[local])
+        corrected = measured - predict_offsets(post["t"][:, 0], post["x"][:, 0], t, initial=initial)
+        carry["start"] = start + len(measured)
+        return corrected, {
+            "sample": start + local,
+            "offset_estimate": post["x"][:, 0, 0],
+            "frequency_estimate": post["x"][:, 0, 1],
+            "drift_estimate": post["x"][:, 0, 2],
+            "innovation": post["innovation"][:, 0],
+            "accepted": post["accepted"][:, 0],
+        }
+    return correct
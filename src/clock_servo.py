@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+# 🎛️ Closed-loop clock servo (P / PI / PID)
+#
+# The servo samples the offset of the slave clock every `update_every` samples
+# and holds its correction until the next update:
+#
+#   e[k] = (measured - reference)[t_k] + u[k-1]        offset seen by the servo
+#   I[k] = I[k-1] + e[k] * dt                          integral term
+#   u[k] = -(kp * e[k] + ki * I[k] + kd * (e[k] - e[k-1]) / dt)
+#
+# u[k] is applied to every sample after t_k up to and including t_{k+1}.
+# Without limits the loop is linear, so the whole run is two IIR filters
+# (scipy.signal.lfilter) over the update-rate series. With an integral or
+# output limit the loop saturates, which is not a linear filter; that case
+# steps through the update instants with conditional-integration anti-windup.
+#
+# make_servo() and run_servo_stream() run the same loop chunk by chunk,
+# carrying the filter state (lfilter zi) or the last PID values across chunk
+# edges.
+
+
+# Helper: PID gains as digital filter taps (a = kp, b = ki*dt, c = kd/dt)
+def _servo_filters(kp, ki, kd, dt):
+    a, b, c = kp, ki * dt, kd / dt
+    # Closed loop from disturbance d to error e: E = D (1 - z^-1) / den
+    error_num = [1.0, -1.0]
+    error_den = [1.0, -1.0 + a + b + c, -a - 2.0 * c, c]
+    # Controller from error e to correction u: U (1 - z^-1) = -C(z) (1 - z^-1) E
+    control_num = [-(a + b + c), a + 2.0 * c, -c]
+    control_den = [1.0, -1.0]
+    return error_num, error_den, control_num, control_den
+
+
+def new_servo_carry():
+    return {
+        "start": 0,        # global index of the next chunk
+        "zi_error": None,  # lfilter states (linear loop)
+        "zi_control": None,
+        "u_prev": 0.0,     # last correction, offset and integral
+        "e_prev": 0.0,
+        "i_prev": 0.0,
+    }
+
+
+def _run_linear(d, kp, ki, kd, dt, carry):
+    from scipy.signal import lfilter  # only the linear loop needs scipy (slow to import)
+    error_num, error_den, control_num, control_den = _servo_filters(kp, ki, kd, dt)
+    if carry["zi_error"] is None:
+        carry["zi_error"] = np.zeros(max(len(error_num), len(error_den)) - 1)
+        carry["zi_control"] = np.zeros(max(len(control_num), len(control_den)) - 1)
+    e, carry["zi_error"] = lfilter(error_num, error_den, d, zi=carry["zi_error"])
+    u, carry["zi_control"] = lfilter(control_num, control_den, e, zi=carry["zi_control"])
+    integral = carry["i_prev"] + np.cumsum(e) * dt
+    saturated = np.zeros(len(d), dtype=bool)
+    if len(d):
+        carry["u_prev"], carry["e_prev"], carry["i_prev"] = u[-1], e[-1], integral[-1]
+    return e, integral, u, saturated
+
+
+# Helper: one saturating PID update; returns (integral, correction, saturated)
+def pid_step(ek, e_prev, i_prev, kp, ki, kd, dt, integral_limit=np.inf, output_limit=np.inf):
+    ik = min(max(i_prev + ek * dt, -integral_limit), integral_limit)
+    deriv = (ek - e_prev) / dt
+    uk = -(kp * ek + ki * ik + kd * deriv)
+    if abs(uk) <= output_limit:
+        return ik, uk, False
+    # Anti-windup: freeze the integrator while the output is clamped
+    uk = -(kp * ek + ki * i_prev + kd * deriv)
+    return i_prev, min(max(uk, -output_limit), output_limit), True
+
+
+def _run_limited(d, kp, ki, kd, dt, integral_limit, output_limit, carry):
+    e = np.empty(len(d))
+    u = np.empty(len(d))
+    integral = np.empty(len(d))
+    saturated = np.zeros(len(d), dtype=bool)
+    i_lim = np.inf if integral_limit is None else integral_limit
+    u_lim = np.inf if output_limit is None else output_limit
+
+    u_prev, e_prev, i_prev = carry["u_prev"], carry["e_prev"], carry["i_prev"]
+    for k, dk in enumerate(d.tolist()):
+        ek = dk + u_prev
+        ik, uk, saturated[k] = pid_step(ek, e_prev, i_prev, kp, ki, kd, dt, i_lim, u_lim)
+        e[k], integral[k], u[k] = ek, ik, uk
+        u_prev, e_prev, i_prev = uk, ek, ik
+    carry["u_prev"], carry["e_prev"], carry["i_prev"] = u_prev, e_prev, i_prev
+    return e, integral, u, saturated
+
+
+def _servo_chunk(reference, measured, kp, ki, kd, update_every, sample_rate_hz, integral_limit, output_limit, carry):
+    reference = np.asarray(reference, dtype=np.float64)
+    measured = np.asarray(measured, dtype=np.float64)
+    n = len(measured)
+    start = carry["start"]
+    if update_every < 1:
+        raise ValueError("update_every must be >= 1")
+    dt = update_every / sample_rate_hz
+
+    # Update instants are global multiples of update_every
+    first = -start % update_every
+    update_samples = np.arange(first, n, update_every)
+    d = measured[update_samples] - reference[update_samples]
+
+    u_before = carry["u_prev"]
+    if integral_limit is None and output_limit is None:
+        e, integral, u, saturated = _run_linear(d, kp, ki, kd, dt, carry)
+    else:
+        e, integral, u, saturated = _run_limited(d, kp, ki, kd, dt, integral_limit, output_limit, carry)
+
+    # Hold each correction until the next update: sample T uses update (T-1)//m
+    first_update = (start + first) // update_every
+    held = np.concatenate(([u_before], u))
+    index = (np.arange(start, start + n) - 1) // update_every - first_update + 1
+    corrected = measured + held[index]
+    if start == 0 and n:
+        corrected[0] = measured[0]
+
+    state = pd.DataFrame({
+        "sample": update_samples + start,
+        "offset": e,
+        "integral": integral,
+        "correction": u,
+        "saturated": saturated,
+    })
+    carry["start"] = start + n
+    return corrected, state
+
+
+def run_servo(reference, measured, kp=0.1, ki=0.0, kd=0.0, update_every=1, sample_rate_hz=1e6,
+              integral_limit=None, output_limit=None):
+    return _servo_chunk(reference, measured, kp, ki, kd, update_every, sample_rate_hz,
+                        integral_limit, output_limit, new_servo_carry())
+
+
+def make_servo(kp=0.1, ki=0.0, kd=0.0, update_every=1, sample_rate_hz=1e6, integral_limit=None, output_limit=None):
+    # Stateful (reference, measured) chunk -> (corrected, state) function
+    carry = new_servo_carry()
+
+    def step(reference, measured):
+        return _servo_chunk(reference, measured, kp, ki, kd, update_every, sample_rate_hz,
+                            integral_limit, output_limit, carry)
+    return step
+
+
+def run_servo_stream(chunks, kp=0.1, ki=0.0, kd=0.0, update_every=1, sample_rate_hz=1e6,
+                     integral_limit=None, output_limit=None):
+    # chunks: iterable of (reference, measured) array pairs; yields (corrected, state) per chunk
+    servo = make_servo(kp, ki, kd, update_every, sample_rate_hz, integral_limit, output_limit)
+    for reference, measured in chunks:
+        yield servo(reference, measured)
@@ -1,57 +1,69 @@
 import os
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import os
-
-# 🔍 Set working directory to project root if not already
-project_root = "D:/clock-drift-fpga-project"
-if os.getcwd() != project_root:
-    os.chdir(project_root)
-
-# Ensure folders exist
-os.makedirs("data", exist_ok=True)
-os.makedirs("output", exist_ok=True)
-os.makedirs("output/plots", exist_ok=True)
+from sample_store import save_table_chunks, load_strided
+from clock_stream import generate_clock_chunks, generate_tick_chunks, total_samples, with_throughput
+from stage_params import run_stage
+from instrumentation import set_phase
 
 # Simulation Parameters
 duration_sec = 1           # Total simulated time in seconds
 sampling_rate_hz = 1e6     # 1 MHz sampling rate (1 sample per microsecond)
 drift_per_sec = 10e-6      # 10 microseconds drift per second
+phase_noise = []           # Oscillator noise on FPGA_2, e.g. [{"type": "flicker_fm", "h": 1e-20}] (see phase_noise.py)
+noise_seed = 42
+time_unit = "s"            # "s" (float64 seconds) or "ns" / "ps" (int64 ticks + delta column, see timebase.py)
+delta_dtype = "int32"      # Tick modes: dtype of the FPGA_2 - FPGA_1 column ("int32", "int64" or "float32")
+epoch_ns = 0               # Tick modes: Unix time (ns) of sample 0
+
+chunk_size = 1 << 20       # Samples generated and written per chunk
+max_plot_points = 1_000_000  # Plot is decimated beyond this many points
+
+
+def main(plots=True):
+    # Ensure folders exist
+    os.makedirs("data", exist_ok=True)
+    os.makedirs("output", exist_ok=True)
+    os.makedirs("output/plots", exist_ok=True)
+
+    # Stream the clocks chunk by chunk into the columnar sample store (CSV export
+    # is opt-in), so memory stays flat however long the simulation is
+    total = total_samples(duration_sec, sampling_rate_hz)
+    attrs = {
+        "duration_sec": duration_sec,
+        "sampling_rate_hz": sampling_rate_hz,
+        "drift_per_sec": drift_per_sec,
+        "phase_noise": phase_noise,
+    }
+    if time_unit == "s":
+        chunks = generate_clock_chunks(duration_sec, sampling_rate_hz, drift_per_sec, chunk_size=chunk_size,
+                                       noise=phase_noise, noise_seed=noise_seed)
+    else:
+        # Exact integer ticks; the float columns stay readable (derived on load)
+        chunks = generate_tick_chunks(duration_sec, sampling_rate_hz, drift_per_sec, time_unit=time_unit,
+                                      delta_dtype=delta_dtype, chunk_size=chunk_size, noise=phase_noise,
+                                      noise_seed=noise_seed)
+        attrs.update({"time_unit": time_unit, "epoch_ns": epoch_ns})
+    save_table_chunks("data/clock_drift", with_throughput(chunks, "clock_simulator"), rows=total, attrs=attrs)
+    print("Clock drift simulation completed.")
+    print("Data saved to: data/clock_drift.cols")
+    if not plots:
+        return
+
+    import matplotlib.pyplot as plt
+    set_phase("plot")
+    # Plot the drift (read back from the store, decimated for long runs)
+    clock = load_strided("data/clock_drift", columns=["time_sec", "drift_us"], max_points=max_plot_points)
+    plt.figure(figsize=(10, 5))
+    plt.plot(clock["time_sec"] * 1000, clock["drift_us"], label="Clock Drift", color='red')
+    plt.xlabel("Time (ms)")
+    plt.ylabel("Drift (µs)")
+    plt.title("Simulated Clock Drift between FPGA_1 and FPGA_2")
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig("output/plots/drift_waveform.png")
+    plt.close()
+    print("Drift plot saved to: output/plots/drift_waveform.png")
+
 
-# Time Axis
-total_samples = int(duration_sec * sampling_rate_hz)
-time = np.arange(total_samples) / sampling_rate_hz  # seconds
-
-# FPGA_1 Clock (Perfect Reference Clock)
-clock_1 = time.copy()
-
-# FPGA_2 Clock (with Drift)
-drift = np.linspace(0, drift_per_sec, total_samples)
-clock_2 = time + drift
-
-# Save to CSV
-df = pd.DataFrame({
-    "sample": np.arange(total_samples),
-    "time_sec": time,
-    "fpga_1_time": clock_1,
-    "fpga_2_time": clock_2,
-    "drift_us": (clock_2 - clock_1) * 1e6  # Convert to microseconds
-})
-df.to_csv("data/clock_drift.csv", index=False, float_format="%.10f")
-
-# Plot the drift
-plt.figure(figsize=(10, 5))
-plt.plot(time * 1000, (clock_2 - clock_1) * 1e6, label="Clock Drift", color='red')
-plt.xlabel("Time (ms)")
-plt.ylabel("Drift (µs)")
-plt.title("Simulated Clock Drift between FPGA_1 and FPGA_2")
-plt.grid(True)
-plt.legend()
-plt.tight_layout()
-plt.savefig("output/plots/drift_waveform.png")
-plt.close()
-
-print("Clock drift simulation completed.")
-print("Data saved to: data/clock_drift.csv")
-print("Drift plot saved to: output/plots/drift_waveform.png")
+if __name__ == "__main__":
+    run_stage(globals())
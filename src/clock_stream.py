@@ -0,0 +1,98 @@
+import time
+import numpy as np
+from instrumentation import add_rows
+from phase_noise import new_noise_state, noise_chunk
+from timebase import encode_delta, sample_ticks, ticks_per_second
+
+# 🌊 Chunked streaming of the drift series
+#
+# generate_clock_chunks() yields the same columns clock_simulator.py used to
+# build in one go ("sample", "time_sec", "fpga_1_time", "fpga_2_time",
+# "drift_us"), chunk_size samples at a time. Every value is a function of the
+# global sample index, so chunk edges are seamless and peak memory depends on
+# chunk_size only, not on duration_sec. An optional phase-noise spec (see
+# phase_noise.py) adds colored time error to FPGA_2, generated chunk by chunk.
+# generate_tick_chunks() is the integer-timebase variant (see timebase.py):
+# "sample", "time_ticks" and "fpga_2_delta", computed in ticks throughout.
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+def total_samples(duration_sec, sampling_rate_hz):
+    return int(duration_sec * sampling_rate_hz)
+
+
+def generate_clock_chunks(duration_sec, sampling_rate_hz, drift_per_sec, chunk_size=DEFAULT_CHUNK_SIZE,
+                          noise=None, noise_seed=42):
+    n = total_samples(duration_sec, sampling_rate_hz)
+    # Linear drift reaching drift_per_sec * duration_sec on the last sample
+    drift_step = drift_per_sec * duration_sec / (n - 1) if n > 1 else 0.0
+    noise_state = new_noise_state(noise, sampling_rate_hz, seed=noise_seed) if noise else None
+    for start in range(0, n, chunk_size):
+        sample = np.arange(start, min(start + chunk_size, n))
+        time_sec = sample / sampling_rate_hz
+        drift = sample * drift_step
+        clock_2 = time_sec + drift
+        if noise_state is not None:
+            clock_2 += noise_chunk(noise_state, len(sample))
+        yield {
+            "sample": sample,
+            "time_sec": time_sec,
+            "fpga_1_time": time_sec,
+            "fpga_2_time": clock_2,
+            "drift_us": (clock_2 - time_sec) * 1e6,
+        }
+
+
+def generate_tick_chunks(duration_sec, sampling_rate_hz, drift_per_sec, time_unit="ps", delta_dtype="int32",
+                         chunk_size=DEFAULT_CHUNK_SIZE, noise=None, noise_seed=42):
+    n = total_samples(duration_sec, sampling_rate_hz)
+    drift_step_ticks = drift_per_sec * duration_sec / (n - 1) * ticks_per_second(time_unit) if n > 1 else 0.0
+    noise_state = new_noise_state(noise, sampling_rate_hz, seed=noise_seed) if noise else None
+    for start in range(0, n, chunk_size):
+        sample = np.arange(start, min(start + chunk_size, n))
+        drift = sample * drift_step_ticks
+        if noise_state is not None:
+            drift += noise_chunk(noise_state, len(sample)) * ticks_per_second(time_unit)
+        yield {
+            "sample": sample,
+            "time_ticks": sample_ticks(sample, sampling_rate_hz, time_unit),
+            "fpga_2_delta": encode_delta(np.rint(drift).astype(np.int64), delta_dtype),
+        }
+
+
+def sample_orders(chunks, order_interval, time_columns=("fpga_1_time", "fpga_2_time")):
+    # One order every order_interval samples (global index), numbered across chunks
+    start = 0
+    next_id = 0
+    for chunk in chunks:
+        n = len(chunk[time_columns[0]])
+        local = np.arange(-start % order_interval, n, order_interval)
+        orders = {"order_id": np.arange(next_id, next_id + len(local))}
+        for col in time_columns:
+            orders[col.replace("_time", "_ts")] = np.asarray(chunk[col])[local]
+        yield orders
+        next_id += len(local)
+        start += n
+
+
+# Helper: number of samples in a chunk (an array, a dict of columns, or a tuple of either)
+def _chunk_length(chunk):
+    if isinstance(chunk, dict):
+        return len(next(iter(chunk.values())))
+    if isinstance(chunk, tuple):
+        return _chunk_length(chunk[0])
+    return len(chunk)
+
+
+def with_throughput(chunks, label, report=print):
+    # Pass chunks through unchanged and report samples/second when exhausted
+    started = time.perf_counter()
+    samples = 0
+    for chunk in chunks:
+        samples += _chunk_length(chunk)
+        yield chunk
+    elapsed = time.perf_counter() - started
+    add_rows(samples)
+    rate = samples / elapsed if elapsed > 0 else float("inf")
+    report(f"[{label}] {samples} samples in {elapsed:.2f} s ({rate:,.0f} samples/s)")
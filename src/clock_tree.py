@@ -0,0 +1,186 @@
+import numpy as np
+
+# 🌳 Clock-tree RC model with Elmore delays and Monte Carlo skew
+#
+# A tree is a dict of flat arrays in breadth-first order: node i has parent
+# parent[i] < i (the root has -1), the children of a node are contiguous, and
+# every depth level is one slice levels[d]:levels[d + 1]. Node i carries the
+# wire segment from its parent (resistance r, capacitance c, π-model) plus an
+# optional sink (flip-flop) load; the root's segment is the clock driver.
+#
+# Elmore delay is computed level by level, vectorized over all nodes of a
+# level and over a batch of variation samples at once (arrays are nodes x
+# batch):
+#
+#   down[i]  = c[i] + sink_cap[i] + sum(down[children])   leaves -> root
+#   delay[i] = delay[parent] + r[i] * (down[i] - c[i] / 2) root -> leaves
+#
+# Monte Carlo draws multiply every r, c and sink load by a die-level (global)
+# factor and an independent per-element (local) factor. Samples are processed
+# in batches sized to a memory budget, so 1e5-sink trees x 1e3 samples never
+# hold more than a few node x batch arrays at a time.
+
+DEFAULT_BATCH_BYTES = 256 << 20
+_WORK_ARRAYS = 4  # node x batch float arrays alive at once (r, c, down/delay, draws)
+
+
+def make_tree(parent, r, c, sink_cap=None):
+    # Arbitrary topology from parent indices (any numbering, one root with -1).
+    # Returns the tree relabelled breadth-first; tree["node_id"] maps back.
+    parent = np.asarray(parent, dtype=np.int64)
+    n = len(parent)
+    roots = np.flatnonzero(parent < 0)
+    if len(roots) != 1:
+        raise ValueError(f"A clock tree needs exactly one root (parent -1), found {len(roots)}")
+    if np.any(parent >= n):
+        raise ValueError("Parent indices must refer to nodes of the tree")
+    depth = _depths(parent)
+    level_sizes = np.bincount(depth)
+    # Breadth-first relabelling, one level at a time: nodes ordered by their
+    # parent's new id, so siblings are contiguous and parents ascend
+    by_depth = np.argsort(depth, kind="stable")
+    bounds = np.concatenate(([0], np.cumsum(level_sizes)))
+    new_id = np.empty(n, dtype=np.int64)
+    new_id[by_depth[0]] = 0
+    for d in range(1, len(level_sizes)):
+        nodes = by_depth[bounds[d]:bounds[d + 1]]
+        nodes = nodes[np.argsort(new_id[parent[nodes]], kind="stable")]
+        by_depth[bounds[d]:bounds[d + 1]] = nodes
+        new_id[nodes] = np.arange(bounds[d], bounds[d + 1])
+    order = by_depth
+    new_parent = np.where(parent[order] < 0, -1, new_id[np.maximum(parent[order], 0)])
+    sink_cap = np.zeros(n) if sink_cap is None else np.broadcast_to(np.asarray(sink_cap, dtype=np.float64), (n,))
+    return _finish_tree(new_parent, np.broadcast_to(np.asarray(r, dtype=np.float64), (n,))[order],
+                        np.broadcast_to(np.asarray(c, dtype=np.float64), (n,))[order], sink_cap[order],
+                        level_sizes, node_id=order)
+
+
+# Helper: depth of every node by pointer jumping (O(log depth) vectorized passes)
+def _depths(parent):
+    depth = (parent >= 0).astype(np.int64)
+    ancestor = parent.copy()
+    for _ in range(int(np.log2(max(len(parent), 2))) + 2):
+        valid = np.flatnonzero(ancestor >= 0)
+        if not len(valid):
+            return depth
+        depth[valid] += depth[ancestor[valid]]
+        ancestor[valid] = ancestor[ancestor[valid]]
+    raise ValueError("Parent indices contain a cycle")
+
+
+# Helper: per-level slices and sibling groups used by the traversals
+def _finish_tree(parent, r, c, sink_cap, level_sizes, node_id=None, **extra):
+    levels = np.concatenate(([0], np.cumsum(level_sizes)))
+    groups = []
+    for d in range(1, len(levels) - 1):
+        p = parent[levels[d]:levels[d + 1]]
+        owners, first = np.unique(p, return_index=True)
+        groups.append((owners, first))
+    has_child = np.zeros(len(parent), dtype=bool)
+    has_child[parent[parent >= 0]] = True
+    return {
+        "parent": parent,
+        "r": np.ascontiguousarray(r, dtype=np.float64),
+        "c": np.ascontiguousarray(c, dtype=np.float64),
+        "sink_cap": np.ascontiguousarray(sink_cap, dtype=np.float64),
+        "levels": levels,
+        "groups": groups,
+        "sinks": np.flatnonzero(~has_child),
+        "node_id": np.arange(len(parent)) if node_id is None else node_id,
+        **extra,
+    }
+
+
+def h_tree(levels, die_size_um=10_000.0, r_per_um=0.08, c_per_um=0.2e-15, sink_cap=2e-15, driver_r=50.0):
+    # Binary H-tree with 2**levels sinks, rooted at the die centre. Branches
+    # alternate horizontal / vertical and halve in length every two levels.
+    n = 2 ** (levels + 1) - 1
+    node = np.arange(n)
+    parent = (node - 1) // 2
+    parent[0] = -1
+    depth = np.floor(np.log2(node + 1)).astype(np.int64)
+    length = np.where(depth > 0, die_size_um / 2.0 ** ((depth + 1) // 2 + 1), 0.0)
+    r = length * r_per_um
+    r[0] = driver_r
+    leaf = depth == levels
+    # Sink coordinates (um, die centre at the origin): odd levels branch in x, even in y
+    x = np.zeros(n)
+    y = np.zeros(n)
+    for d in range(1, levels + 1):
+        lo, hi = 2 ** d - 1, 2 ** (d + 1) - 1
+        step = length[lo:hi] * np.where(node[lo:hi] % 2, -1.0, 1.0)  # left child -, right child +
+        axis_x = d % 2 == 1
+        x[lo:hi] = x[parent[lo:hi]] + (step if axis_x else 0.0)
+        y[lo:hi] = y[parent[lo:hi]] + (0.0 if axis_x else step)
+    return _finish_tree(parent, r, length * c_per_um, np.where(leaf, sink_cap, 0.0), 2 ** np.arange(levels + 1),
+                        x_um=x, y_um=y)
+
+
+def elmore_delays(tree, r=None, c=None, sink_cap=None):
+    # Elmore delay (s) of every node; r / c / sink_cap override the tree's
+    # values and may carry a trailing batch axis (nodes x batch)
+    r = tree["r"] if r is None else r
+    c = tree["c"] if c is None else c
+    sink_cap = tree["sink_cap"] if sink_cap is None else sink_cap
+    down = c + (sink_cap if np.ndim(sink_cap) == np.ndim(c) else sink_cap[:, None])
+    return _elmore(tree, r, c, down)
+
+
+# Helper: the two level sweeps; `down` starts as the node loads and is reused for the delays
+def _elmore(tree, r, c, down):
+    levels, parent = tree["levels"], tree["parent"]
+    for d in range(len(levels) - 2, 0, -1):
+        owners, first = tree["groups"][d - 1]
+        down[owners] += np.add.reduceat(down[levels[d]:levels[d + 1]], first, axis=0)
+    down -= c / 2
+    delay = down
+    delay *= r
+    for d in range(1, len(levels) - 1):
+        lo, hi = levels[d], levels[d + 1]
+        delay[lo:hi] += delay[parent[lo:hi]]
+    return delay
+
+
+def batch_size(tree, batch_bytes=DEFAULT_BATCH_BYTES):
+    return max(1, int(batch_bytes // (len(tree["parent"]) * 8 * _WORK_ARRAYS)))
+
+
+def monte_carlo_skew(tree, samples, sigma_local=0.1, sigma_global=0.05, sink_sigma=0.1, seed=42,
+                     batch_bytes=DEFAULT_BATCH_BYTES):
+    # Per-sample sink skew and delay range, plus per-sink delay mean / std,
+    # over `samples` process-variation draws
+    rng = np.random.RandomState(seed)
+    sinks = tree["sinks"]
+    n = len(tree["parent"])
+    result = {name: np.empty(samples) for name in ("skew_s", "min_delay_s", "max_delay_s", "mean_delay_s")}
+    sink_sum = np.zeros(len(sinks))
+    sink_sumsq = np.zeros(len(sinks))
+    step = batch_size(tree, batch_bytes)
+    for start in range(0, samples, step):
+        b = min(step, samples - start)
+        # Global factor per sample (shared by r, c and loads), local factor per element
+        global_factor = 1.0 + sigma_global * rng.standard_normal(b)
+        r = rng.standard_normal((n, b))
+        r *= sigma_local
+        r += 1.0
+        r *= tree["r"][:, None] * global_factor
+        c = rng.standard_normal((n, b))
+        c *= sigma_local
+        c += 1.0
+        c *= tree["c"][:, None] * global_factor
+        down = c.copy()
+        down[sinks] += tree["sink_cap"][sinks, None] * global_factor * (1.0 + sink_sigma * rng.standard_normal((len(sinks), b)))
+        delay = _elmore(tree, r, c, down)
+        del r, c
+        sink_delay = delay[sinks]
+        lo, hi = sink_delay.min(axis=0), sink_delay.max(axis=0)
+        result["skew_s"][start:start + b] = hi - lo
+        result["min_delay_s"][start:start + b] = lo
+        result["max_delay_s"][start:start + b] = hi
+        result["mean_delay_s"][start:start + b] = sink_delay.mean(axis=0)
+        sink_sum += sink_delay.sum(axis=1)
+        sink_sumsq += np.einsum("ij,ij->i", sink_delay, sink_delay)
+    mean = sink_sum / samples
+    result["sink_mean_s"] = mean
+    result["sink_std_s"] = np.sqrt(np.maximum(sink_sumsq / samples - mean ** 2, 0.0))
+    return result
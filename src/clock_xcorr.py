@@ -0,0 +1,373 @@
+import numpy as np
+
+# 🔀 Blind offset / skew estimation between two event streams
+#
+# Two streams stamp the same events with different clocks (stream A, the
+# reference side, and stream B, the drifting side: two capture ports, a
+# gateway and the exchange, ...) but share no event id and no ground-truth
+# time. The offset B - A is estimated per window of A time in two steps:
+#
+#   coarse  Both streams are binned into event counts (bin_s). Each window's
+#           A counts are cross-correlated with the B counts over the window
+#           widened by max_lag_s on both sides, around a prior offset; all
+#           2 * max_lag / bin + 1 lags come from one rfft / irfft pair per
+#           window, done for a batch of windows at once (axis 1). A parabola
+#           through the peak and its two neighbours places it to a fraction of
+#           a bin; score is the Pearson correlation of the counts at the peak,
+#           and peak_ratio the peak over the highest correlation more than one
+#           bin from it, plus the bins the tracked skew smears the peak over
+#           (near 1 when the lag is ambiguous, e.g. a strictly periodic stream
+#           whose period fits in the lag range).
+#   fine    Each A event, shifted by the coarse offset, is matched to the
+#           nearest B event and the matches are fitted by least squares,
+#           residual = offset + skew * (t - window centre). Refitting around
+#           the previous fit with a robust gate (passes) takes the offset at
+#           the window centre to timestamp resolution and gives the frequency
+#           skew (s/s) within the window.
+#
+# The prior follows the offset from batch to batch: the last accepted offset,
+# extrapolated with the skew fitted across the previous batch's accepted
+# windows, so max_lag_s only has to cover how far the offset can wander over
+# one batch, not its whole range (initial_offset_s places the first window).
+# A window is accepted when its peak is inside the lag range, its score
+# reaches min_score, its peak_ratio min_peak_ratio and at least min_matches
+# events were matched.
+#
+# Streams are fed in chunks (update_xcorr / flush_xcorr, or xcorr_stream for
+# two chunk iterators); a batch of windows is estimated once both streams have
+# passed it, so the result does not depend on the chunking. Each stream must
+# be sorted, in float seconds from a nearby origin (float64 keeps ~0.1 ns over
+# days, not at Unix-epoch magnitudes). offset_at() turns the estimates into a
+# correction for any time.
+
+RESULT_COLUMNS = {
+    "window_start_s": np.float64,
+    "time_s": np.float64,        # Window centre (stream A time)
+    "offset_s": np.float64,      # B - A at time_s
+    "skew": np.float64,          # d(offset) / dt within the window
+    "coarse_offset_s": np.float64,
+    "score": np.float64,
+    "peak_ratio": np.float64,    # Peak over the runner-up away from it (see coarse_lags)
+    "events_a": np.int64,
+    "events_b": np.int64,
+    "matched": np.int64,
+    "accepted": bool,
+}
+
+
+def new_xcorr_state(window_s=10e-3, step_s=None, bin_s=1e-6, max_lag_s=50e-6, gate_s=None, fit_events=2048,
+                    min_score=0.2, min_peak_ratio=1.5, min_matches=3, initial_offset_s=0.0, batch_windows=256):
+    return {
+        "window_s": window_s,
+        "step_s": window_s if step_s is None else step_s,
+        "bin_s": bin_s,
+        "lag_bins": int(np.ceil(max_lag_s / bin_s)),
+        "gate_s": bin_s if gate_s is None else gate_s,
+        "fit_events": fit_events,
+        "min_score": min_score,
+        "min_peak_ratio": min_peak_ratio,
+        "min_matches": min_matches,
+        "batch_windows": batch_windows,
+        "batch": 1,                      # grows to batch_windows (see _drain)
+        "a": np.empty(0),                # buffered events not yet behind every pending window
+        "b": np.empty(0),
+        "a_until": -np.inf,              # each stream is complete up to here
+        "b_until": -np.inf,
+        "next_start": None,              # start of the next window (first A event)
+        "track": (None, initial_offset_s, 0.0),   # (time, offset, skew) of the prior
+        "windows": 0,
+    }
+
+
+def _prior(state, t):
+    t0, offset, skew = state["track"]
+    return offset if t0 is None else offset + skew * (t - t0)
+
+
+# Helper: indices of the events in [lo, hi) of each row, flattened, with their row
+def _ranges(events, lo_times, hi_times):
+    lo = np.searchsorted(events, lo_times, side="left")
+    n = np.searchsorted(events, hi_times, side="left") - lo
+    row = np.repeat(np.arange(len(lo)), n)
+    index = np.arange(len(row)) - np.repeat(np.cumsum(n) - n, n) + np.repeat(lo, n)
+    return row, index, n
+
+
+def bin_counts(events, lo_times, bins, bin_s):
+    # rows x bins event counts of [lo, lo + bins * bin_s) for each row's lo time
+    lo_times = np.asarray(lo_times, dtype=np.float64)
+    row, index, _ = _ranges(events, lo_times, lo_times + bins * bin_s)
+    slot = ((events[index] - lo_times[row]) / bin_s).astype(np.int64)
+    np.clip(slot, 0, bins - 1, out=slot)  # rounding at the range edges
+    return np.bincount(row * bins + slot, minlength=len(lo_times) * bins).reshape(-1, bins).astype(np.float64)
+
+
+def coarse_lags(a_counts, b_counts, exclude=1):
+    # Lag (in bins, fractional) of each row's A counts within its B counts,
+    # which are 2 * L bins longer (lags 0..2L), plus the peak's Pearson
+    # correlation, its ratio to the runner-up more than `exclude` bins away
+    # and whether the peak is inside the lag range
+    rows, n = a_counts.shape
+    lags = b_counts.shape[1] - n + 1
+    a = a_counts - a_counts.mean(axis=1, keepdims=True)
+    nfft = 1 << int(np.ceil(np.log2(b_counts.shape[1])))  # i + lag < len(b) <= nfft: no wrap-around
+    corr = np.fft.irfft(np.conj(np.fft.rfft(a, nfft)) * np.fft.rfft(b_counts, nfft), nfft)[:, :lags]
+    row = np.arange(rows)
+    peak = corr.argmax(axis=1)
+    left = corr[row, np.maximum(peak - 1, 0)]
+    mid = corr[row, peak]
+    right = corr[row, np.minimum(peak + 1, lags - 1)]
+    curvature = left - 2 * mid + right
+    inner = (peak > 0) & (peak < lags - 1) & (curvature < 0)
+    delta = np.zeros(rows)
+    delta[inner] = 0.5 * (left - right)[inner] / curvature[inner]
+    # Variance of the B segment under the peak, from running sums
+    csum = np.concatenate([np.zeros((rows, 1)), np.cumsum(b_counts, axis=1)], axis=1)
+    csum2 = np.concatenate([np.zeros((rows, 1)), np.cumsum(b_counts ** 2, axis=1)], axis=1)
+    s1 = csum[row, peak + n] - csum[row, peak]
+    s2 = csum2[row, peak + n] - csum2[row, peak]
+    denom = np.sqrt((a ** 2).sum(axis=1) * np.maximum(s2 - s1 ** 2 / n, 0.0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = np.where(denom > 0, mid / denom, np.nan)
+    # Runner-up: the highest correlation outside peak - exclude .. peak + exclude
+    distance = np.abs(np.arange(lags) - peak[:, None])
+    runner_up = np.where(distance > exclude, corr, -np.inf).max(axis=1, initial=-np.inf)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(runner_up > 0, mid / runner_up, np.inf)
+    return peak + delta, score, ratio, inner
+
+
+# Helper: per-window least-squares line residual = intercept + slope * dt over the kept matches
+def _fit_lines(row, dt, residual, windows):
+    s0 = np.bincount(row, minlength=windows).astype(np.float64)
+    sx = np.bincount(row, dt, windows)
+    sy = np.bincount(row, residual, windows)
+    sxx = np.bincount(row, dt * dt, windows)
+    sxy = np.bincount(row, dt * residual, windows)
+    denom = s0 * sxx - sx ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fitted = (s0 >= 3) & (denom > 0)
+        slope = np.where(fitted, (s0 * sxy - sx * sy) / denom, 0.0)
+        intercept = np.where(s0 > 0, (sy - slope * sx) / s0, 0.0)
+    return intercept, np.where(fitted, slope, np.nan), s0.astype(np.int64)
+
+
+# Helper: per-window median of values in [0, scale[row]] (rows nondecreasing); one
+# float sort of row + value / (2 * scale) instead of a lexsort
+def _row_medians(row, values, scale, windows):
+    counts = np.bincount(row, minlength=windows)
+    if not len(values):
+        return np.full(windows, np.inf)
+    scale = np.maximum(scale, np.finfo(np.float64).tiny)  # exact matches: a zero gate
+    keys = np.sort(row + np.minimum(values, scale[row]) / (2 * scale[row]))
+    middle = np.cumsum(counts) - counts + np.maximum(counts - 1, 0) // 2
+    medians = (keys[np.minimum(middle, len(keys) - 1)] - np.arange(windows)) * 2 * scale
+    return np.where(counts > 0, medians, np.inf)
+
+
+def refine_offsets(a_events, b_events, starts, window_s, coarse, gate_s, skew=0.0, fit_events=None, passes=3):
+    # Least-squares offset at each window centre and skew within it, from A
+    # events matched to their nearest B event; returns (offset, skew, matched).
+    # At high event rates the nearest B event to a poor prediction is often a
+    # neighbour of the true match, which pulls the fit back towards the
+    # prediction; so each pass re-matches around the previous fit, keeping the
+    # matches within 4 robust sigmas (1.4826 * MAD) of it (gate_s on the first).
+    # skew is the starting slope, fit_events caps the A events used per window
+    # (evenly strided).
+    windows = len(starts)
+    centre = starts + window_s / 2
+    row, index, n = _ranges(a_events, starts, starts + window_s)
+    if fit_events:
+        stride = np.maximum(-(-n // fit_events), 1)
+        position = np.arange(len(row)) - (np.cumsum(n) - n)[row]
+        picked = position % stride[row] == 0
+        row, index = row[picked], index[picked]
+    t = a_events[index]
+    dt = t - centre[row]
+    offset, slope = coarse.copy(), np.full(windows, float(skew))
+    gate = np.full(windows, gate_s)
+    matched = np.zeros(windows, dtype=np.int64)
+    if not len(b_events):
+        return offset, np.full(windows, np.nan), matched
+    for _ in range(passes):
+        predicted = t + offset[row] + slope[row] * dt
+        j = np.searchsorted(b_events, predicted)
+        before = b_events[np.maximum(j - 1, 0)]
+        after = b_events[np.minimum(j, len(b_events) - 1)]
+        residual = np.where(np.abs(after - predicted) < np.abs(predicted - before), after, before) - predicted
+        keep = np.abs(residual) <= gate[row]
+        intercept, fitted_slope, matched = _fit_lines(row[keep], dt[keep], residual[keep], windows)
+        offset, slope = offset + intercept, slope + np.nan_to_num(fitted_slope)
+        deviation = np.abs(residual - intercept[row] - np.nan_to_num(fitted_slope)[row] * dt)
+        gate = np.minimum(gate, 4 * 1.4826 * _row_medians(row[keep], deviation[keep], gate, windows))
+    return offset, np.where(matched >= 3, slope, np.nan), matched
+
+
+# Helper: estimate a batch of consecutive windows and move the prior on
+def _estimate_batch(state, starts):
+    window_s, bin_s, lag_bins = state["window_s"], state["bin_s"], state["lag_bins"]
+    bins = int(np.ceil(window_s / bin_s))
+    prior = _prior(state, starts + window_s / 2)
+    a_counts = bin_counts(state["a"], starts, bins, bin_s)
+    b_counts = bin_counts(state["b"], starts + prior - lag_bins * bin_s, bins + 2 * lag_bins, bin_s)
+    smear = int(np.ceil(abs(state["track"][2]) * window_s / bin_s))  # offset drift across a window, in bins
+    lag, score, ratio, inner = coarse_lags(a_counts, b_counts, exclude=1 + smear)
+    coarse = prior + (lag - lag_bins) * bin_s
+    offset, skew, matched = refine_offsets(state["a"], state["b"], starts, window_s, coarse, state["gate_s"],
+                                            state["track"][2], state["fit_events"])
+    accepted = (inner & (score >= state["min_score"]) & (ratio >= state["min_peak_ratio"])
+                & (matched >= state["min_matches"]))
+
+    time_s = starts + window_s / 2
+    if accepted.any():
+        track_skew = state["track"][2]
+        times, offsets = time_s[accepted], offset[accepted]
+        if len(times) > 1:
+            track_skew = np.polyfit(times - times[0], offsets, 1)[0]
+        elif np.isfinite(skew[accepted][0]):
+            track_skew = skew[accepted][0]
+        state["track"] = (times[-1], offsets[-1], track_skew)
+    state["windows"] += len(starts)
+    return {
+        "window_start_s": starts,
+        "time_s": time_s,
+        "offset_s": offset,
+        "skew": skew,
+        "coarse_offset_s": coarse,
+        "score": score,
+        "peak_ratio": ratio,
+        "events_a": a_counts.sum(axis=1).astype(np.int64),
+        "events_b": b_counts.sum(axis=1).astype(np.int64),
+        "matched": matched,
+        "accepted": accepted,
+    }
+
+
+# Helper: how far past a window's end (in A time, plus the prior) B events are still used
+def _b_margin(state):
+    return state["lag_bins"] * state["bin_s"] + state["gate_s"]
+
+
+# Helper: estimate every window that both streams have passed (all that hold A events when final)
+def _drain(state, final=False):
+    results = []
+    window_s, step_s = state["window_s"], state["step_s"]
+    margin = _b_margin(state)
+    while state["next_start"] is not None:
+        # Batches start at one window and double, so the prior has a skew before it is extrapolated far
+        starts = state["next_start"] + step_s * np.arange(state["batch"])
+        if final:
+            ready = starts <= state["a_until"]
+        else:
+            ends = starts + window_s
+            ready = (ends <= state["a_until"]) & (ends + _prior(state, ends) + margin <= state["b_until"])
+        # Whole batches only (but for the last), so batches and the prior do not depend on the chunking
+        count = int(ready.sum()) if final else len(ready) * bool(ready.all())
+        if not count:
+            break
+        results.append(_estimate_batch(state, starts[:count]))
+        state["next_start"] = starts[count - 1] + step_s
+        state["batch"] = min(2 * state["batch"], state["batch_windows"])
+        # Drop the events no later window can reach
+        keep_from = state["next_start"]
+        state["a"] = state["a"][np.searchsorted(state["a"], keep_from):]
+        state["b"] = state["b"][np.searchsorted(state["b"], keep_from + _prior(state, keep_from) - margin):]
+        if count < len(ready):
+            break
+    if not results:
+        return {col: np.empty(0, dtype=dtype) for col, dtype in RESULT_COLUMNS.items()}
+    return {col: np.concatenate([r[col] for r in results]) for col in RESULT_COLUMNS}
+
+
+def update_xcorr(state, a_events=(), b_events=(), a_until=None, b_until=None):
+    # Feed the next events of either stream (sorted, seconds). a_until / b_until
+    # say how far each stream is complete (default: its last event so far).
+    # Returns the windows estimated meanwhile, as a dict of RESULT_COLUMNS arrays.
+    for name, events, until in (("a", a_events, a_until), ("b", b_events, b_until)):
+        events = np.asarray(events, dtype=np.float64)
+        if len(events):
+            if np.any(np.diff(events) < 0) or events[0] < state[name + "_until"]:
+                raise ValueError(f"Stream {name.upper()} events must arrive in timestamp order")
+            state[name] = np.concatenate([state[name], events])
+            state[name + "_until"] = events[-1]
+        if until is not None:
+            state[name + "_until"] = max(state[name + "_until"], until)
+    if state["next_start"] is None and len(state["a"]):
+        state["next_start"] = state["a"][0]
+    return _drain(state)
+
+
+def flush_xcorr(state):
+    # End of both streams: estimate the remaining windows (the last one partly filled)
+    state["b_until"] = np.inf
+    return _drain(state, final=True)
+
+
+def xcorr_stream(a_chunks, b_chunks, **params):
+    # Estimates from two iterators of sorted event-time chunks, read in step so
+    # only about one chunk of each stream is buffered; yields result dicts
+    state = new_xcorr_state(**params)
+    a_chunks, b_chunks = iter(a_chunks), iter(b_chunks)
+    b_done = False
+    for a in a_chunks:
+        a = np.asarray(a, dtype=np.float64)
+        yield update_xcorr(state, a_events=a)
+        while not b_done and state["b_until"] <= state["a_until"] + _prior(state, state["a_until"]) + _b_margin(state):
+            b = next(b_chunks, None)
+            if b is None:
+                b_done = True
+            else:
+                yield update_xcorr(state, b_events=b)
+    for b in b_chunks:
+        yield update_xcorr(state, b_events=b)
+    yield flush_xcorr(state)
+
+
+def estimate_offsets(a_events, b_events, chunk_size=1 << 20, **params):
+    # Whole-array convenience over xcorr_stream: one dict of RESULT_COLUMNS arrays
+    a_chunks = (a_events[i:i + chunk_size] for i in range(0, len(a_events), chunk_size))
+    b_chunks = (b_events[i:i + chunk_size] for i in range(0, len(b_events), chunk_size))
+    parts = list(xcorr_stream(a_chunks, b_chunks, **params))
+    return {col: np.concatenate([part[col] for part in parts]) for col in RESULT_COLUMNS}
+
+
+def offset_at(estimates, times):
+    # Offset B - A at A times, interpolated between accepted window centres;
+    # outside them it is extrapolated with the skew of the nearest end window
+    accepted = np.asarray(estimates["accepted"], dtype=bool)
+    t = np.asarray(estimates["time_s"], dtype=np.float64)[accepted]
+    offset = np.asarray(estimates["offset_s"], dtype=np.float64)[accepted]
+    skew = np.nan_to_num(np.asarray(estimates["skew"], dtype=np.float64)[accepted])
+    times = np.asarray(times, dtype=np.float64)
+    if not len(t):
+        return np.zeros(len(times))
+    result = np.interp(times, t, offset)
+    before, after = times < t[0], times > t[-1]
+    result[before] = offset[0] + skew[0] * (times[before] - t[0])
+    result[after] = offset[-1] + skew[-1] * (times[after] - t[-1])
+    return result
+
+
+def to_reference(estimates, b_times, iterations=2):
+    # B timestamps mapped to A time: a = b - offset(a), solved by fixed-point iteration
+    b_times = np.asarray(b_times, dtype=np.float64)
+    a_times = b_times.copy()
+    for _ in range(iterations):
+        a_times = b_times - offset_at(estimates, a_times)
+    return a_times
+
+
+def make_blind_corrector(estimates, measure_every=100):
+    # Stateful (reference, measured) chunk -> (corrected, state) function, like
+    # make_servo(): measured is corrected by the offset estimated at the
+    # reference time, with the estimate kept every measure_every samples
+    carry = {"start": 0}
+
+    def correct(reference, measured):
+        measured = np.asarray(measured, dtype=np.float64)
+        offset = offset_at(estimates, reference)
+        start = carry["start"]
+        local = np.arange(-start % measure_every, len(measured), measure_every)
+        carry["start"] = start + len(measured)
+        return measured - offset, {"sample": start + local, "offset_estimate": offset[local]}
+    return correct
@@ -1,49 +1,103 @@
 import os
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import os
+from sample_store import TableWriter, iter_table_chunks, load_strided, table_rows
+from clock_servo import make_servo
+from clock_kalman import make_kalman_corrector
+from clock_xcorr import make_blind_corrector
+from clock_stream import with_throughput
+from stage_params import run_stage
+from instrumentation import set_phase
+
+# Feedback Correction Model: "servo" (closed-loop P/PI/PID, see clock_servo.py),
+# "kalman" (offset / frequency / drift estimator, see clock_kalman.py) or "blind"
+# (offsets estimated from the order streams alone, see skew_estimator.py)
+estimator = "servo"
+kp = 0.1               # Proportional gain
+ki = 0.0               # Integral gain (1/s), > 0 for PI
+kd = 0.0               # Derivative gain (s), > 0 for PID
+update_every = 1       # Servo update interval in samples
+sample_rate_hz = 1e6   # Sampling rate of the drift series
+integral_limit = None  # Anti-windup clamp on the integral term (s*s)
+output_limit = None    # Max correction per update (s)
+
+# Kalman estimator (defaults tuned to the fault mix of fault_injection.py)
+measure_every = 100          # Samples between offset measurements (sync events)
+measurement_std_s = 1e-8     # Offset measurement noise (burst faults are ~50 ns)
+q_offset = 3e-13             # Process noise densities: white FM (s^2/s; the drift jumps random-walk the offset),
+q_freq = 1e-16               # random-walk FM (1/s)
+q_drift = 1e-24              # and random-walk drift (1/s^3)
+gate_sigma = 5.0             # Reject measurements further than this from the prediction (faults)
+max_rejects = 5              # ... unless this many in a row (a real step): re-lock
+
+# Blind estimator: offsets estimated from the order stamps alone. Those are taken
+# before fault injection, so injected faults are left in; state every measure_every samples
+skew_estimates = "data/skew_estimates.csv"   # Written by skew_estimator.py
+
+chunk_size = 1 << 20         # Samples processed per chunk
+max_plot_points = 1_000_000  # Plot is decimated beyond this many points
+
+
+def main(plots=True):
+    # Ensure necessary folders exist
+    os.makedirs("data", exist_ok=True)
+    os.makedirs("output/plots", exist_ok=True)
+
+    # 🛠 Stream the faulty drift data through the servo (or estimator); filter state carries
+    # across chunk edges, so the result does not depend on chunk_size
+    columns = ["sample", "fpga_1_time", "fpga_2_faulted"]
+    rows = table_rows("data/clock_drift_faulted")
+    if estimator == "servo":
+        servo = make_servo(kp=kp, ki=ki, kd=kd, update_every=update_every, sample_rate_hz=sample_rate_hz,
+                           integral_limit=integral_limit, output_limit=output_limit)
+        state_every = update_every
+    elif estimator == "kalman":
+        servo = make_kalman_corrector(measure_every=measure_every, sample_rate_hz=sample_rate_hz,
+                                      measurement_std_s=measurement_std_s, q_offset=q_offset, q_freq=q_freq,
+                                      q_drift=q_drift, gate_sigma=gate_sigma, max_rejects=max_rejects)
+        state_every = measure_every
+    elif estimator == "blind":
+        estimates = pd.read_csv(skew_estimates)
+        if estimates["clock_id"].nunique() > 1:
+            raise ValueError(f"{skew_estimates} holds estimates for {estimates['clock_id'].nunique()} clocks; "
+                             "the drift series has one")
+        servo = make_blind_corrector({col: estimates[col].to_numpy() for col in estimates.columns},
+                                     measure_every=measure_every)
+        state_every = measure_every
+    else:
+        raise ValueError(f"Unknown estimator '{estimator}' (expected 'servo', 'kalman' or 'blind')")
+    source = iter_table_chunks("data/clock_drift_faulted", columns=columns, chunk_size=chunk_size)
+
+    # Save the corrected clock data and per-update servo state
+    with TableWriter("data/clock_drift_corrected", rows) as corrected_out, \
+            TableWriter("data/clock_drift_servo_state", -(-rows // state_every)) as state_out:
+        for chunk in with_throughput(source, "corrective_feedback"):
+            corrected, servo_state = servo(chunk["fpga_1_time"], chunk["fpga_2_faulted"])
+            corrected_out.write({**chunk, "fpga_2_corrected": corrected})
+            state_out.write(servo_state)
+    print("Corrected drift data saved to: data/clock_drift_corrected.cols")
+    print("Servo state saved to: data/clock_drift_servo_state.cols")
+    if not plots:
+        return
+
+    import matplotlib.pyplot as plt
+    set_phase("plot")
+    # Plot: Faulted vs Corrected vs Reference
+    df = load_strided("data/clock_drift_corrected",
+                      columns=["sample", "fpga_1_time", "fpga_2_faulted", "fpga_2_corrected"], max_points=max_plot_points)
+    plt.figure(figsize=(10, 5))
+    plt.plot(df["sample"], df["fpga_2_faulted"], label="Faulted FPGA_2", alpha=0.4)
+    plt.plot(df["sample"], df["fpga_2_corrected"], label="Corrected FPGA_2", color="green")
+    plt.plot(df["sample"], df["fpga_1_time"], label="Reference FPGA_1", color="blue", linestyle="--", alpha=0.6)
+    plt.title("Drift Correction using Feedback Controller")
+    plt.xlabel("Sample Index")
+    plt.ylabel("Timestamp (s)")  # Fixed unit label
+    plt.legend(loc="upper right")  # Prevents performance warning
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig("output/plots/corrected_feedback_plot.png")
+    plt.close()
+    print("Correction plot saved to: output/plots/corrected_feedback_plot.png")
+
 
-# 🔍 Set working directory to project root if not already
-project_root = "D:/clock-drift-fpga-project"
-if os.getcwd() != project_root:
-    os.chdir(project_root)
-
-# Ensure necessary folders exist
-os.makedirs("data", exist_ok=True)
-os.makedirs("output/plots", exist_ok=True)
-
-# Load faulty drift data
-df = pd.read_csv("data/clock_drift_faulted.csv")
-
-# Feedback Correction Model using Proportional Control
-kp = 0.1  # Proportional gain
-
-# ➕ Initialize corrected signal
-df["fpga_2_corrected"] = df["fpga_2_faulted"].copy()
-
-# 🛠 Apply feedback correction iteratively
-for i in range(1, len(df)):
-    drift_error = df.loc[i, "fpga_2_corrected"] - df.loc[i, "fpga_1_time"]
-    correction = -kp * drift_error
-    df.loc[i, "fpga_2_corrected"] += correction
-
-# Save the corrected clock data
-df.to_csv("data/clock_drift_corrected.csv", index=False, float_format="%.10f")
-print("Corrected drift data saved to: data/clock_drift_corrected.csv")
-
-# Plot: Faulted vs Corrected vs Reference
-plt.figure(figsize=(10, 5))
-plt.plot(df["sample"], df["fpga_2_faulted"], label="Faulted FPGA_2", alpha=0.4)
-plt.plot(df["sample"], df["fpga_2_corrected"], label="Corrected FPGA_2", color="green")
-plt.plot(df["sample"], df["fpga_1_time"], label="Reference FPGA_1", color="blue", linestyle="--", alpha=0.6)
-plt.title("Drift Correction using Feedback Controller")
-plt.xlabel("Sample Index")
-plt.ylabel("Timestamp (s)")  # Fixed unit label
-plt.legend(loc="upper right")  # Prevents performance warning
-plt.grid(True)
-plt.tight_layout()
-plt.savefig("output/plots/corrected_feedback_plot.png")
-plt.close()
-
-print("Correction plot saved to: output/plots/corrected_feedback_plot.png")
+if __name__ == "__main__":
+    run_stage(globals())
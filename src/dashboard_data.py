@@ -0,0 +1,160 @@
+import os
+import numpy as np
+from sample_store import iter_table_chunks, load_columns, read_meta, save_table, store_dir, table_exists, META_FILE
+
+# 🖥️ Dashboard data layer: screen-resolution views of long sample series
+#
+# Plots never need more than a few thousand points per line, so every series
+# is reduced to about `points` values for the visible sample range:
+#
+#   minmax  each screen bucket keeps its min and max (keeps spikes and faults)
+#   lttb    Largest-Triangle-Three-Buckets, one representative point per bucket
+#
+# For long runs the min/max reduction is precomputed as a pyramid: level 0
+# holds the min and max of every PYRAMID_BASE samples, and each level above
+# halves the previous one. Levels are sample-store tables next to the source
+# ("data/clock_drift_pyramid/L0.cols", ...), memory-mapped on load. A view
+# reads the coarsest level that still has at least `points` buckets in range,
+# so each redraw touches O(points) values whatever the run length. Ranges
+# short enough to read directly are reduced from the raw memory-mapped column
+# (with minmax or lttb); pyramid levels always give the min/max envelope.
+
+PYRAMID_BASE = 64
+SCREEN_POINTS = 2000
+
+
+def minmax_decimate(x, y, buckets):
+    # Interleaved (min, max) per bucket, placed at the bucket's first x
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(y) <= 2 * buckets:
+        return x, y
+    edges = np.linspace(0, len(y), buckets + 1).astype(np.int64)[:-1]
+    lo = np.minimum.reduceat(y, edges)
+    hi = np.maximum.reduceat(y, edges)
+    return np.repeat(x[edges], 2), np.column_stack((lo, hi)).ravel()
+
+
+def lttb(x, y, points):
+    # Largest-Triangle-Three-Buckets: first and last points plus, per bucket,
+    # the point forming the largest triangle with the previous pick and the
+    # next bucket's mean
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if points >= n or points < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    mean_x = np.append(sums_x / counts, x[-1])
+    mean_y = np.append(sums_y / counts, y[-1])
+    picks = np.empty(points, dtype=np.int64)
+    picks[0], picks[-1] = 0, n - 1
+    a = 0
+    for k in range(points - 2):
+        lo, hi = edges[k], edges[k + 1]
+        area = np.abs((x[a] - mean_x[k + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (mean_y[k + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        picks[k + 1] = a
+    return x[picks], y[picks]
+
+
+def pyramid_name(name):
+    return name + "_pyramid"
+
+
+def _level_name(name, level):
+    return os.path.join(pyramid_name(name), f"L{level}")
+
+
+# Helper: identity of the source table, so a rewritten run invalidates its pyramid
+def _source_stamp(name):
+    meta_path = os.path.join(store_dir(name), META_FILE)
+    return {"rows": read_meta(name)["rows"], "mtime_ns": os.stat(meta_path).st_mtime_ns}
+
+
+def table_version(name):
+    # Changes whenever the table is rewritten; None if it does not exist
+    return _source_stamp(name)["mtime_ns"] if table_exists(name) else None
+
+
+def pyramid_current(name, columns):
+    level0 = _level_name(name, 0)
+    if not table_exists(name) or not table_exists(level0):
+        return False
+    attrs = read_meta(level0)["attrs"]
+    return attrs.get("source") == _source_stamp(name) and set(columns) <= set(attrs.get("columns", []))
+
+
+def build_pyramid(name, columns, base=PYRAMID_BASE, chunk_size=1 << 20):
+    # One streaming pass over the table for level 0, then pairwise reductions
+    chunk_size -= chunk_size % base
+    lows = {col: [] for col in columns}
+    highs = {col: [] for col in columns}
+    for chunk in iter_table_chunks(name, columns, chunk_size=chunk_size):
+        edges = np.arange(0, len(chunk[columns[0]]), base)
+        for col in columns:
+            lows[col].append(np.minimum.reduceat(chunk[col], edges))
+            highs[col].append(np.maximum.reduceat(chunk[col], edges))
+    level = {col + "_min": np.concatenate(lows[col]) for col in columns}
+    level.update({col + "_max": np.concatenate(highs[col]) for col in columns})
+    attrs = {"base": base, "columns": list(columns), "source": _source_stamp(name)}
+    depth = 0
+    while True:
+        save_table(_level_name(name, depth), level, attrs={**attrs, "level": depth, "bucket": base << depth})
+        size = len(next(iter(level.values())))
+        if size <= SCREEN_POINTS:
+            break
+        # Pair buckets (an odd last bucket pairs with itself)
+        pairs = np.arange(0, size, 2)
+        level = {key: (np.minimum if key.endswith("_min") else np.maximum).reduceat(values, pairs)
+                 for key, values in level.items()}
+        depth += 1
+    return depth + 1
+
+
+def load_pyramid(name, columns):
+    # Memory-mapped pyramid levels (building or rebuilding them if stale)
+    if not pyramid_current(name, columns):
+        build_pyramid(name, columns)
+    levels = []
+    while table_exists(_level_name(name, len(levels))):
+        level = _level_name(name, len(levels))
+        levels.append({"bucket": read_meta(level)["attrs"]["bucket"], **load_columns(level)})
+    return levels
+
+
+def view(name, column, start, stop, points=SCREEN_POINTS, pyramid=None, method="minmax", raw=None):
+    # (sample, value) arrays for rows [start, stop) of a table, about `points` long.
+    # raw: optional already memory-mapped column; pyramid: from load_pyramid()
+    raw = load_columns(name, [column])[column] if raw is None else raw
+    start, stop = max(0, int(start)), min(len(raw), int(stop))
+    if stop <= start:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    span = stop - start
+    levels = pyramid or []
+    usable = [level for level in levels if span // level["bucket"] >= points]
+    if not usable or span <= points * PYRAMID_BASE:
+        x = np.arange(start, stop)
+        y = np.asarray(raw[start:stop])
+        if method == "lttb":
+            return lttb(x, y, points)
+        return minmax_decimate(x, y, points)
+    level = usable[-1]
+    bucket = level["bucket"]
+    first, last = start // bucket, -(-stop // bucket)
+    lo = np.array(level[column + "_min"][first:last])
+    hi = np.array(level[column + "_max"][first:last])
+    x = np.arange(first, last) * bucket
+    # Partial buckets at the range edges come from the raw samples, so values
+    # outside [start, stop) never widen the envelope
+    for k, lo_row, hi_row in ((0, start, min(stop, (first + 1) * bucket)), (-1, max(start, (last - 1) * bucket), stop)):
+        edge = np.asarray(raw[lo_row:hi_row])
+        lo[k], hi[k], x[k] = edge.min(), edge.max(), lo_row
+    if len(lo) > points:
+        # Combine neighbouring buckets down to the screen width
+        edges = np.linspace(0, len(lo), points + 1).astype(np.int64)[:-1]
+        lo, hi, x = np.minimum.reduceat(lo, edges), np.maximum.reduceat(hi, edges), x[edges]
+    return np.repeat(x, 2), np.column_stack((lo, hi)).ravel()
@@ -0,0 +1,225 @@
+import numpy as np
+
+# ⚡ Vectorized fault-injection engine
+#
+# Every fault model contributes to one of four whole-array layers, which are
+# composed in a fixed order so no fault ever needs a per-sample Python loop:
+#
+#   point : sparse adds at single samples               (spikes)
+#   hold  : samples that repeat the previous value      (stuck-at, forward fill)
+#   step  : adds that persist for the rest of the run   (drift jumps, cumsum)
+#   noise : windowed adds applied last                  (clustered bursts)
+#
+#   faulted = ffill_hold(clean + point) + cumsum(step) + noise
+#
+# Point/hold/step models are "per-sample" faults: each sample gets a random
+# fault type and a fault_chance draw, exactly like the original script. Noise
+# models pick their own windows. A model given its own "seed" draws from a
+# private RandomState; otherwise it shares the engine stream, which keeps the
+# output identical to the legacy loop for the same seed.
+#
+# make_fault_injector() and inject_faults_stream() apply the same models chunk
+# by chunk, carrying the step level, the last held value and burst windows
+# that cross a chunk edge. Models always see global sample positions. With a
+# single chunk the output equals inject_faults().
+
+FAULT_MODELS = {}
+
+
+def register_fault_model(name, layer, signed=True):
+    if layer not in ("point", "hold", "step", "noise"):
+        raise ValueError(f"Unknown fault layer '{layer}'")
+
+    def register(fn):
+        FAULT_MODELS[name] = {"fn": fn, "layer": layer, "signed": signed}
+        return fn
+    return register
+
+
+@register_fault_model("spike", layer="point")
+def spike_fault(positions, signs, magnitude_ns=100):
+    return positions, signs * magnitude_ns * 1e-9
+
+
+@register_fault_model("drift_jump", layer="step")
+def drift_jump_fault(positions, signs, magnitude_ns=50):
+    return positions, signs * magnitude_ns * 1e-9
+
+
+@register_fault_model("stuck", layer="hold", signed=False)
+def stuck_fault(positions, signs):
+    # The first sample has no previous value to hold
+    return positions[positions > 0], None
+
+
+@register_fault_model("burst", layer="noise")
+def burst_fault(start, n, rng, shared_stream, every=2000, probability=0.5, length=300, scale_ns=50):
+    # Windows that begin in [start, start + n); they may run past the chunk end
+    starts = np.arange(-(-start // every) * every, start + n, every)
+    if shared_stream:
+        # Legacy draw order: one rand() per window, then its noise if it fires
+        hits, chunks = [], []
+        for window in starts:
+            if rng.rand() < probability:
+                hits.append(window)
+                chunks.append(rng.normal(loc=0, scale=scale_ns, size=length))
+        hits = np.asarray(hits, dtype=np.int64)
+        noise = np.concatenate(chunks) if chunks else np.empty(0)
+    else:
+        hits = starts[rng.rand(len(starts)) < probability]
+        noise = rng.normal(loc=0, scale=scale_ns, size=len(hits) * length)
+
+    positions = (hits[:, None] + np.arange(length)).ravel()
+    return positions, noise * 1e-9
+
+
+# Same fault mix and magnitudes as the original fault_injection.py
+DEFAULT_FAULTS = [
+    {"model": "spike", "magnitude_ns": 100},
+    {"model": "drift_jump", "magnitude_ns": 50},
+    {"model": "stuck"},
+    {"model": "burst", "every": 2000, "probability": 0.5, "length": 300, "scale_ns": 50},
+]
+
+
+# Helper: split a fault spec into (model entry, params, private rng or None)
+def _resolve(spec):
+    spec = dict(spec)
+    name = spec.pop("model")
+    if name not in FAULT_MODELS:
+        raise KeyError(f"Unknown fault model '{name}'. Registered: {sorted(FAULT_MODELS)}")
+    seed = spec.pop("seed", None)
+    rng = np.random.RandomState(seed) if seed is not None else None
+    return name, FAULT_MODELS[name], spec, rng
+
+
+# Helper: for each held sample, the index of the last non-held sample before it
+def _hold_sources(held):
+    new_run = np.ones(len(held), dtype=bool)
+    new_run[1:] = np.diff(held) != 1
+    run_id = np.cumsum(new_run) - 1
+    return (held[new_run] - 1)[run_id]
+
+
+# Helper: resolve fault specs into per-sample and windowed model lists
+def _prepare(faults):
+    resolved = [_resolve(spec) for spec in (DEFAULT_FAULTS if faults is None else faults)]
+    per_sample = [r for r in resolved if r[1]["layer"] != "noise"]
+    windowed = [r for r in resolved if r[1]["layer"] == "noise"]
+    return per_sample, windowed
+
+
+def new_fault_state():
+    return {
+        "start": 0,                           # global index of the next chunk
+        "step_level": 0.0,                    # accumulated drift jumps so far
+        "hold_value": None,                   # last pre-step value, for stuck-at on a chunk edge
+        "spill_pos": np.empty(0, dtype=np.int64),  # burst samples past the previous chunk
+        "spill_val": np.empty(0),
+    }
+
+
+def _inject_chunk(clean, per_sample, windowed, rng, fault_chance, state):
+    n = len(clean)
+    start = state["start"]
+
+    # 🎲 Per-sample fault type and occurrence (same draw order as the legacy loop)
+    fault_type = rng.choice(len(per_sample), size=n).astype(np.int8) if per_sample else None
+    fault_mask = rng.rand(n) < fault_chance
+    fault_pos = np.flatnonzero(fault_mask)
+    del fault_mask
+    fault_kind = fault_type[fault_pos] if per_sample else np.empty(0, dtype=np.int8)
+    del fault_type
+    fault_pos += start
+
+    # Signs for models on the shared stream are drawn in sample order across models
+    shared_signed = [k for k, (_, entry, _, own) in enumerate(per_sample) if entry["signed"] and own is None]
+    shared_sel = np.isin(fault_kind, shared_signed)
+    shared_signs = np.zeros(len(fault_pos))
+    shared_signs[shared_sel] = rng.choice([-1, 1], size=int(shared_sel.sum()))
+
+    point_pos, point_val, step_pos, step_val, held = [], [], [], [], []
+    for k, (name, entry, params, own) in enumerate(per_sample):
+        sel = fault_kind == k
+        positions = fault_pos[sel]
+        if not entry["signed"]:
+            signs = None
+        elif own is None:
+            signs = shared_signs[sel]
+        else:
+            signs = own.choice([-1, 1], size=len(positions))
+        positions, values = entry["fn"](positions, signs, **params)
+        if entry["layer"] == "point":
+            point_pos.append(positions - start)
+            point_val.append(values)
+        elif entry["layer"] == "step":
+            step_pos.append(positions - start)
+            step_val.append(values)
+        else:
+            held.append(positions - start)
+
+    faulted = np.array(clean, dtype=np.float64)
+
+    for positions, values in zip(point_pos, point_val):
+        np.add.at(faulted, positions, values)
+
+    if held:
+        held = np.unique(np.concatenate(held))
+        if len(held):
+            sources = _hold_sources(held)
+            from_prev = sources < 0
+            faulted[held] = faulted[np.maximum(sources, 0)]
+            if from_prev.any():
+                faulted[held[from_prev]] = state["hold_value"]
+    if n:
+        state["hold_value"] = faulted[-1]
+
+    steps = np.zeros(n)
+    if n:
+        steps[0] = state["step_level"]
+    for positions, values in zip(step_pos, step_val):
+        np.add.at(steps, positions, values)
+    np.cumsum(steps, out=steps)
+    faulted += steps
+    if n:
+        state["step_level"] = steps[-1]
+    del steps
+
+    noise_pos, noise_val = [state["spill_pos"]], [state["spill_val"]]
+    for name, entry, params, own in windowed:
+        positions, values = entry["fn"](start, n, own if own is not None else rng, own is None, **params)
+        noise_pos.append(positions)
+        noise_val.append(values)
+    noise_pos = np.concatenate(noise_pos) - start
+    noise_val = np.concatenate(noise_val)
+    inside = noise_pos < n
+    np.add.at(faulted, noise_pos[inside], noise_val[inside])
+    state["spill_pos"] = noise_pos[~inside] + start
+    state["spill_val"] = noise_val[~inside]
+
+    state["start"] = start + n
+    return faulted
+
+
+def inject_faults(clean, faults=None, fault_chance=0.05, seed=42):
+    per_sample, windowed = _prepare(faults)
+    rng = np.random.RandomState(seed)
+    return _inject_chunk(clean, per_sample, windowed, rng, fault_chance, new_fault_state())
+
+
+def make_fault_injector(faults=None, fault_chance=0.05, seed=42):
+    # Stateful chunk -> faulted chunk function; call it on consecutive chunks
+    per_sample, windowed = _prepare(faults)
+    rng = np.random.RandomState(seed)
+    state = new_fault_state()
+
+    def inject(clean):
+        return _inject_chunk(clean, per_sample, windowed, rng, fault_chance, state)
+    return inject
+
+
+def inject_faults_stream(chunks, faults=None, fault_chance=0.05, seed=42):
+    # chunks: iterable of clean arrays; yields one faulted array per chunk
+    inject = make_fault_injector(faults, fault_chance, seed)
+    for clean in chunks:
+        yield inject(clean)
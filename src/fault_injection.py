@@ -1,69 +1,62 @@
 import os
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-
-# 🔍 Set working directory to project root if not already
-project_root = "D:/clock-drift-fpga-project"
-if os.getcwd() != project_root:
-    os.chdir(project_root)
-# Create required folders
-os.makedirs("data", exist_ok=True)
-os.makedirs("output/plots", exist_ok=True)
-
-# Load base drift data
-df = pd.read_csv("data/clock_drift.csv")
-
-# Add sample index if missing
-if "sample" not in df.columns:
-    df["sample"] = np.arange(len(df))
+from sample_store import iter_table_chunks, load_strided, save_table_chunks, table_rows
+from fault_engine import make_fault_injector
+from clock_stream import with_throughput
+from stage_params import run_stage
+from instrumentation import set_phase
 
 # Fault Injection Parameters
-np.random.seed(42)
+seed = 42
 fault_chance = 0.05  # 5% chance per sample
 fault_magnitude_ns = 100  # 100 nanoseconds
-
-# Copy original clock signal
-df["fpga_2_faulted"] = df["fpga_2_time"].copy()
-
-# Random fault types
-fault_type = np.random.choice(["spike", "drift_jump", "stuck"], size=len(df))
-fault_mask = np.random.rand(len(df)) < fault_chance
-
-for i in range(len(df)):
-    if fault_mask[i]:
-        if fault_type[i] == "spike":
-            df.loc[i, "fpga_2_faulted"] += np.random.choice([-1, 1]) * fault_magnitude_ns * 1e-9
-        elif fault_type[i] == "drift_jump":
-            df.loc[i:, "fpga_2_faulted"] += np.random.choice([-1, 1]) * (fault_magnitude_ns / 2) * 1e-9
-        elif fault_type[i] == "stuck":
-            if i > 0:
-                df.loc[i, "fpga_2_faulted"] = df.loc[i - 1, "fpga_2_faulted"]
-
-# Inject clustered burst faults every 2000 samples
-for burst_start in range(0, len(df), 2000):
-    if np.random.rand() < 0.5:
-        burst = burst_start + np.arange(0, 300)
-        noise = np.random.normal(loc=0, scale=50, size=len(burst)) * 1e-9
-        df.loc[burst, "fpga_2_faulted"] += noise
-
-# Save faulted data
-
-df.to_csv("output/clock_drift_faulted.csv", index=False)
-print("Faulted clock drift data saved to: output/clock_drift_faulted.csv")
-
-
-# Plot fault injection results
-plt.figure(figsize=(10, 5))
-plt.plot(df["sample"], df["fpga_2_time"], label="Original FPGA_2", alpha=0.4)
-plt.plot(df["sample"], df["fpga_2_faulted"], label="Faulted FPGA_2", color="crimson", linewidth=1)
-plt.title("Aggressive Fault Injection in Clock Drift Signal")
-plt.xlabel("Sample Index")
-plt.ylabel("Timestamp (seconds)")
-plt.legend()
-plt.grid(True)
-plt.tight_layout()
-plt.savefig("output/plots/fault_injection_plot.png")
-plt.close()
-
-print("Fault injection plot saved to: output/plots/fault_injection_plot.png")
+chunk_size = 1 << 20         # Samples processed per chunk
+max_plot_points = 1_000_000  # Plot is decimated beyond this many points
+
+
+def main(plots=True):
+    # Create required folders
+    os.makedirs("data", exist_ok=True)
+    os.makedirs("output/plots", exist_ok=True)
+
+    # Fault mix: spikes, drift jumps (half magnitude), stuck-at samples and
+    # clustered burst faults every 2000 samples. See fault_engine.FAULT_MODELS.
+    faults = [
+        {"model": "spike", "magnitude_ns": fault_magnitude_ns},
+        {"model": "drift_jump", "magnitude_ns": fault_magnitude_ns / 2},
+        {"model": "stuck"},
+        {"model": "burst", "every": 2000, "probability": 0.5, "length": 300, "scale_ns": 50},
+    ]
+
+    # Stream the base drift data (only the columns this stage needs) through the
+    # fault engine; with a single chunk this matches the whole-array result
+    columns = ["sample", "fpga_1_time", "fpga_2_time"]
+    rows = table_rows("data/clock_drift")
+    inject = make_fault_injector(faults=faults, fault_chance=fault_chance, seed=seed)
+    source = iter_table_chunks("data/clock_drift", columns=columns, chunk_size=chunk_size)
+    faulted = ({**chunk, "fpga_2_faulted": inject(chunk["fpga_2_time"])} for chunk in source)
+    save_table_chunks("data/clock_drift_faulted", with_throughput(faulted, "fault_injection"), rows=rows)
+    print("Faulted clock drift data saved to: data/clock_drift_faulted.cols")
+    if not plots:
+        return
+
+    import matplotlib.pyplot as plt
+    set_phase("plot")
+    # Plot fault injection results
+    df = load_strided("data/clock_drift_faulted", columns=["sample", "fpga_2_time", "fpga_2_faulted"],
+                      max_points=max_plot_points)
+    plt.figure(figsize=(10, 5))
+    plt.plot(df["sample"], df["fpga_2_time"], label="Original FPGA_2", alpha=0.4)
+    plt.plot(df["sample"], df["fpga_2_faulted"], label="Faulted FPGA_2", color="crimson", linewidth=1)
+    plt.title("Aggressive Fault Injection in Clock Drift Signal")
+    plt.xlabel("Sample Index")
+    plt.ylabel("Timestamp (seconds)")
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig("output/plots/fault_injection_plot.png")
+    plt.close()
+    print("Fault injection plot saved to: output/plots/fault_injection_plot.png")
+
+
+if __name__ == "__main__":
+    run_stage(globals())
@@ -1,59 +1,121 @@
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import os
 import os
+from sample_store import read_meta, table_exists
+from price_engine import (generate_ticks, load_tick_index, build_tick_index, loss_tables, new_loss_totals,
+                          price_orders, save_ticks)
+from timebase import order_seconds
+from stage_params import run_stage
+from instrumentation import add_rows, section, set_phase, timed_iter
+
+# Loss model parameters (see price_engine.py)
+ticks_table = "data/ticks"    # Tick series per instrument; (re)generated unless it matches the run
+orders_path = "data/normal_orders.csv"  # "data/blind_orders.csv": loss left after blind correction
+                                        # of FPGA_2 (see skew_estimator.py)
+num_instruments = 1           # Orders without an instrument column trade order_id % num_instruments
+ticks_per_sec = 1000          # Generated tick rate per instrument
+seed = 42
+pricing = "linear"            # "linear" (interpolated, as before) or "previous" (as-of tick)
+bucket_sec = 0.1              # Time bucket for loss aggregation
+chunk_size = 1 << 20          # Orders priced per batch
+write_order_report = True     # Per-order loss_report.csv (used by the dashboard)
+max_plot_points = 100_000     # Loss plot is decimated beyond this many orders
+
+
+def order_time_range(path):
+    # (earliest, latest) FPGA_1 / FPGA_2 stamp in seconds over one pass of an order file
+    start_sec, end_sec = float("inf"), float("-inf")
+    stamps = pd.read_csv(path, chunksize=chunk_size, usecols=lambda col: col.startswith(("fpga_1_ts", "fpga_2_ts")))
+    for orders in timed_iter(stamps, "csv_io"):
+        orders = order_seconds(orders)
+        for col in ("fpga_1_ts", "fpga_2_ts"):
+            if len(orders):
+                start_sec = min(start_sec, float(orders[col].min()))
+                end_sec = max(end_sec, float(orders[col].max()))
+    return (start_sec, end_sec) if start_sec <= end_sec else (0.0, 0.0)
+
+
+def main(plots=True):
+    os.makedirs("output", exist_ok=True)
+    os.makedirs("output/plots", exist_ok=True)
+
+    # 💹 Tick index: a random walk spanning the orders' own stamps (both clocks). A stored
+    # table is reused only while it was generated with this run's parameters and span;
+    # tick tables from elsewhere (no generator attrs) are used as they are
+    start_sec, end_sec = order_time_range(orders_path)
+    generated = {"start_sec": start_sec, "duration_sec": end_sec - start_sec, "ticks_per_sec": ticks_per_sec,
+                 "seed": seed, "num_instruments": num_instruments}
+    stored = read_meta(ticks_table)["attrs"] if table_exists(ticks_table) else None
+    if stored is not None and ("seed" not in stored or all(stored.get(k) == v for k, v in generated.items())):
+        index = load_tick_index(ticks_table)
+        first = index["time_sec"][index["starts"][:-1]].max()
+        last = index["time_sec"][index["starts"][1:] - 1].min()
+        if "seed" not in stored and (first > start_sec or last < end_sec):
+            print(f"[WARN] Tick table '{ticks_table}' covers {first:.6f} s to {last:.6f} s on every instrument, but "
+                  f"the orders span {start_sec:.6f} s to {end_sec:.6f} s; orders outside it are priced flat")
+    else:
+        ticks = generate_ticks(num_instruments, end_sec - start_sec, ticks_per_sec, seed=seed, start_sec=start_sec)
+        save_ticks(ticks_table, ticks, attrs=generated)
+        index = build_tick_index(**ticks)
+    instruments = len(index["starts"]) - 1
+
+    # Price every order at its true (FPGA_1) and drifted (FPGA_2) timestamp, batch by
+    # batch; each row of the order file carries both stamps, so no merge is needed
+    totals = new_loss_totals(bucket_sec)
+    plot_parts = []
+    report_path = "output/loss_report.csv"
+    if os.path.exists(report_path):
+        os.remove(report_path)
+    for orders in timed_iter(pd.read_csv(orders_path, chunksize=chunk_size), "csv_io"):
+        orders = order_seconds(orders)  # integer-tick stamps are priced in seconds
+        if "instrument" not in orders.columns:
+            orders["instrument"] = orders["order_id"] % instruments
+        value_normal, value_drifted, loss = price_orders(index, totals, orders, method=pricing)
+        add_rows(len(orders))
+        report = pd.DataFrame({
+            "order_id": orders["order_id"].to_numpy(),
+            "value_normal": value_normal,
+            "value_drifted": value_drifted,
+            "loss_per_order": loss,
+        })
+        if write_order_report:
+            with section("csv_io"):
+                report.to_csv(report_path, mode="a", header=not os.path.exists(report_path), index=False)
+        plot_parts.append(report[["order_id", "loss_per_order"]])
+        # Keep the plot series bounded: thin what has been collected so far
+        if sum(len(part) for part in plot_parts) > 2 * max_plot_points:
+            merged = pd.concat(plot_parts)
+            plot_parts = [merged.iloc[::2]]
+
+    tables = loss_tables(totals)
+    for key, frame in tables.items():
+        with section("csv_io"):
+            frame.to_csv(f"output/loss_by_{key}.csv", index=False)
+    print(f"Priced {totals['orders']} orders on {instruments} instrument(s): total loss {totals['total_loss']:.4f}")
+    if write_order_report:
+        print("Loss report saved to: output/loss_report.csv")
+    print("Loss by instrument / time bucket / clock saved to: output/loss_by_instrument.csv, "
+          "output/loss_by_bucket.csv, output/loss_by_clock.csv")
+
+    if not plots:
+        return
+
+    import matplotlib.pyplot as plt
+    set_phase("plot")
+    merged = pd.concat(plot_parts) if plot_parts else pd.DataFrame(columns=["order_id", "loss_per_order"])
+    plt.figure(figsize=(10, 5))
+    plt.plot(merged["order_id"], merged["loss_per_order"], label="Loss per Order", color='orange')
+    plt.axhline(0, color='black', linestyle='--')
+    plt.title("Profit/Loss Impact Due to Clock Drift")
+    plt.xlabel("Order ID")
+    plt.ylabel("Loss (₹ or $)")
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig("output/plots/loss_graph.png")
+    plt.close()
+
+    print("Loss impact graph saved to: output/plots/loss_graph.png")
+
 
-# 🔍 Set working directory to project root if not already
-project_root = "D:/clock-drift-fpga-project"
-if os.getcwd() != project_root:
-    os.chdir(project_root)
-
-os.makedirs("output", exist_ok=True)
-os.makedirs("output/plots", exist_ok=True)
-
-# Load order data
-normal_df = pd.read_csv("data/normal_orders.csv")
-drifted_df = pd.read_csv("data/drifted_orders.csv")
-
-# Simulate a price timeline (random walk)
-np.random.seed(42)
-price_changes = np.random.normal(loc=0, scale=0.1, size=len(normal_df) + 100)
-prices_over_time = 100 + np.cumsum(price_changes)
-
-# 🧠 Price based on timestamps
-normal_df["executed_price"] = np.interp(normal_df["fpga_1_ts"], np.linspace(0, 1, len(prices_over_time)), prices_over_time)
-drifted_df["executed_price"] = np.interp(drifted_df["fpga_2_ts"], np.linspace(0, 1, len(prices_over_time)), prices_over_time)
-
-# Calculate values
-normal_df["value"] = normal_df["executed_price"]
-drifted_df["value"] = drifted_df["executed_price"]
-
-# Compare by order_id
-merged = pd.merge(
-    normal_df[["order_id", "value"]],
-    drifted_df[["order_id", "value"]],
-    on="order_id",
-    suffixes=("_normal", "_drifted")
-)
-
-# Loss = drifted - normal
-merged["loss_per_order"] = merged["value_drifted"] - merged["value_normal"]
-
-# Save and plot
-merged.to_csv("output/loss_report.csv", index=False)
-print("Loss report saved to: output/loss_report.csv")
-
-plt.figure(figsize=(10, 5))
-plt.plot(merged["order_id"], merged["loss_per_order"], label="Loss per Order", color='orange')
-plt.axhline(0, color='black', linestyle='--')
-plt.title("Profit/Loss Impact Due to Clock Drift")
-plt.xlabel("Order ID")
-plt.ylabel("Loss (₹ or $)")
-plt.grid(True)
-plt.legend()
-plt.tight_layout()
-plt.savefig("output/plots/loss_graph.png")
-plt.close()
-
-print("Loss impact graph saved to: output/plots/loss_graph.png")
+if __name__ == "__main__":
+    run_stage(globals())
@@ -0,0 +1,83 @@
+import os
+import numpy as np
+from sample_store import TableWriter
+from clock_fleet import make_fleet, fleet_chunks, new_pair_stats, update_pair_stats, pair_stats_table, fleet_summary
+from clock_stream import with_throughput
+from stage_params import run_stage
+from instrumentation import section, set_phase
+
+# Fleet Parameters
+num_clocks = 32                # FPGAs at the site
+duration_sec = 1               # Total simulated time in seconds
+sampling_rate_hz = 1e6         # 1 MHz sampling rate
+drift_ppm_std = 10.0           # Spread of per-clock frequency offsets (ppm)
+aging_ppb_per_day_std = 1.0    # Spread of per-clock aging rates (ppb/day)
+tempco_ppb_per_c_std = 20.0    # Spread of temperature coefficients (ppb/°C)
+temp_amplitude_c = 5.0         # Site temperature swing (°C)
+temp_period_s = 60.0           # Site temperature cycle (s)
+fault_chance = 0.0             # Per-sample fault chance per clock (fault_engine defaults)
+seed = 42
+
+threshold_s = 5e-6             # Pairwise offset considered harmful (5 µs)
+stats_every = 100              # Pairwise stats decimation (samples)
+save_offsets = True            # Keep the fleet table for order_simulator.py
+
+
+def main(plots=True):
+    # Ensure folders exist
+    os.makedirs("data", exist_ok=True)
+    os.makedirs("output/plots", exist_ok=True)
+
+    # Simulate the fleet chunk by chunk and accumulate pairwise statistics
+    fleet = make_fleet(num_clocks, drift_ppm_std=drift_ppm_std, aging_ppb_per_day_std=aging_ppb_per_day_std,
+                       tempco_ppb_per_c_std=tempco_ppb_per_c_std, seed=seed)
+    stats = new_pair_stats(num_clocks, threshold_s, stats_every=stats_every, sampling_rate_hz=sampling_rate_hz)
+    clock_columns = [f"clock_{i:02d}" for i in range(num_clocks)]
+    chunks = fleet_chunks(fleet, duration_sec, sampling_rate_hz, temp_amplitude_c=temp_amplitude_c,
+                          temp_period_s=temp_period_s, fault_chance=fault_chance)
+
+    rows = int(duration_sec * sampling_rate_hz)
+    writer = TableWriter("data/clock_fleet", rows, attrs={"num_clocks": num_clocks, "sampling_rate_hz": sampling_rate_hz,
+                                                          "offset_units": "s"}) if save_offsets else None
+    for sample, time_sec, offsets in with_throughput(chunks, "fleet_simulator"):
+        update_pair_stats(stats, offsets)
+        if writer is not None:
+            # Offsets are small, so float32 keeps ~0.1 ps resolution at half the size
+            columns = {"sample": sample, "time_sec": time_sec}
+            columns.update({col: offsets[:, i].astype(np.float32) for i, col in enumerate(clock_columns)})
+            writer.write(columns)
+    if writer is not None:
+        writer.close()
+        print("Fleet offsets saved to: data/clock_fleet.cols")
+
+    # Save pairwise statistics
+    pair_df = pair_stats_table(stats)
+    with section("csv_io"):
+        pair_df.to_csv("output/fleet_pair_stats.csv", index=False)
+    summary = fleet_summary(stats)
+    print(f"Max pairwise offset: {summary['max_pairwise_offset_s'] * 1e6:.3f} µs, "
+          f"fleet spread above {threshold_s * 1e6:.1f} µs for {summary['fleet_spread_time_above_threshold_s']:.3f} s")
+    print("Pairwise offset stats saved to: output/fleet_pair_stats.csv")
+    if not plots:
+        return
+
+    import matplotlib.pyplot as plt
+    set_phase("plot")
+    # Plot: max pairwise offset matrix
+    matrix = np.zeros((num_clocks, num_clocks))
+    matrix[pair_df["clock_a"], pair_df["clock_b"]] = pair_df["max_abs_offset_s"] * 1e6
+    matrix += matrix.T
+    plt.figure(figsize=(8, 7))
+    plt.imshow(matrix, cmap="Reds")
+    plt.colorbar(label="Max |offset| (µs)")
+    plt.title("Max Pairwise Clock Offset across the FPGA Fleet")
+    plt.xlabel("Clock")
+    plt.ylabel("Clock")
+    plt.tight_layout()
+    plt.savefig("output/plots/fleet_pairwise_heatmap.png")
+    plt.close()
+    print("Fleet heatmap saved to: output/plots/fleet_pairwise_heatmap.png")
+
+
+if __name__ == "__main__":
+    run_stage(globals())
@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import time
+import atexit
+import socket
+import tracemalloc
+from contextlib import contextmanager
+
+# 📋 Stage instrumentation and run reports
+#
+# A stage script calls start_stage() once (stage_params.run_stage does it). From
+# then on the process time is split into phases:
+#
+#   compute   default phase
+#   plot      set_phase("plot") before the plotting block
+#   csv_io    CSV reads and writes (section("csv_io") / timed_iter)
+#   store_io  sample-store reads and writes (sample_store.py reports these)
+#
+# set_phase() switches the script's top-level phase; section() is a nested
+# context that pauses the enclosing phase, so library code (sample_store,
+# pandas CSV calls) can claim its own time inside any phase. When the stage
+# exits, one JSON line is appended to the run report (output/run_report.jsonl,
+# or CLOCK_DRIFT_RUN_REPORT) with wall and CPU time, time per phase, rows
+# processed, bytes read / written (process I/O counters where the OS has them,
+# plus the sample-store bytes), the peak RSS and, with CLOCK_DRIFT_TRACEMALLOC=1,
+# the tracemalloc peak of Python allocations.
+#
+# CLOCK_DRIFT_PROFILE selects stages to profile ("all", or comma-separated
+# stage names); their profile is written to output/profiles/<stage>.prof
+# (cProfile, readable with pstats/snakeviz) or, with
+# CLOCK_DRIFT_PROFILER=pyinstrument and pyinstrument installed,
+# output/profiles/<stage>.html. Without start_stage() every hook is a no-op.
+
+REPORT_ENV = "CLOCK_DRIFT_RUN_REPORT"
+PROFILE_ENV = "CLOCK_DRIFT_PROFILE"
+PROFILER_ENV = "CLOCK_DRIFT_PROFILER"
+TRACEMALLOC_ENV = "CLOCK_DRIFT_TRACEMALLOC"
+DEFAULT_REPORT = "output/run_report.jsonl"
+PROFILE_DIR = "output/profiles"
+
+_stage = None
+
+
+# Helper: cumulative process read/write byte counters (Linux), or None
+def _io_counters():
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+# Helper: peak resident set size of this process in MB, or None
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss: bytes on macOS, KiB elsewhere
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+def _env_flag(name):
+    return os.environ.get(name, "0").lower() in ("1", "true", "yes")
+
+
+def profiling_enabled(name):
+    selected = [s.strip() for s in os.environ.get(PROFILE_ENV, "").split(",") if s.strip()]
+    return "all" in selected or name in selected
+
+
+def start_stage(name, report_path=None, params=None):
+    # Begin instrumenting this process as stage `name`; the report is written at exit
+    global _stage
+    if _stage is not None:
+        raise RuntimeError(f"Stage '{_stage['name']}' is already being instrumented")
+    from stage_params import stage_overrides
+    now = time.perf_counter()
+    _stage = {
+        "name": name,
+        "params": stage_overrides() if params is None else params,
+        "report_path": report_path or os.environ.get(REPORT_ENV) or DEFAULT_REPORT,
+        "started": now,
+        "cpu_started": time.process_time(),
+        "io_started": _io_counters(),
+        "phases": {},
+        "stack": [["compute", now]],  # [phase, time it last became active]
+        "rows": 0,
+        "store_bytes_read": 0,
+        "store_bytes_written": 0,
+        "status": "ok",
+        "profiler": None,
+    }
+    if _env_flag(TRACEMALLOC_ENV):
+        tracemalloc.start()
+    if profiling_enabled(name):
+        _stage["profiler"] = _start_profiler()
+    previous_hook = sys.excepthook
+
+    def excepthook(exc_type, exc, tb):
+        _stage["status"] = f"failed: {exc_type.__name__}"
+        previous_hook(exc_type, exc, tb)
+    sys.excepthook = excepthook
+    atexit.register(finish_stage)
+    return _stage
+
+
+# Helper: pyinstrument if requested and installed, else cProfile
+def _start_profiler():
+    if os.environ.get(PROFILER_ENV, "cprofile").lower() == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            return ("pyinstrument", profiler)
+        except ImportError:
+            print("pyinstrument is not installed; profiling with cProfile instead")
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return ("cprofile", profiler)
+
+
+def _stop_profiler(name, profiler):
+    kind, profiler = profiler
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    if kind == "pyinstrument":
+        profiler.stop()
+        path = os.path.join(PROFILE_DIR, f"{name}.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        path = os.path.join(PROFILE_DIR, f"{name}.prof")
+        profiler.dump_stats(path)
+    return path
+
+
+# Helper: charge the time since the innermost phase became active to it
+def _charge(now):
+    top = _stage["stack"][-1]
+    _stage["phases"][top[0]] = _stage["phases"].get(top[0], 0.0) + now - top[1]
+    top[1] = now
+
+
+def set_phase(phase):
+    # Switch the top-level phase ("compute", "plot", ...)
+    if _stage is None:
+        return
+    _charge(time.perf_counter())
+    _stage["stack"][0][0] = phase
+
+
+@contextmanager
+def section(phase):
+    # Nested phase: time inside is charged to `phase`, not to the enclosing one
+    if _stage is None:
+        yield
+        return
+    now = time.perf_counter()
+    _charge(now)
+    _stage["stack"].append([phase, now])
+    try:
+        yield
+    finally:
+        now = time.perf_counter()
+        _charge(now)
+        _stage["stack"].pop()
+        _stage["stack"][-1][1] = now
+
+
+def timed_iter(iterable, phase):
+    # Iterate with the time spent producing each item charged to `phase`
+    # (e.g. pd.read_csv(..., chunksize=n) -> "csv_io")
+    iterator = iter(iterable)
+    while True:
+        with section(phase):
+            item = next(iterator, StopIteration)
+        if item is StopIteration:
+            return
+        yield item
+
+
+def add_rows(count):
+    if _stage is not None:
+        _stage["rows"] += int(count)
+
+
+def add_store_bytes(read=0, written=0):
+    if _stage is not None:
+        _stage["store_bytes_read"] += int(read)
+        _stage["store_bytes_written"] += int(written)
+
+
+def stage_report():
+    # Snapshot of the current stage's measurements (None outside a stage)
+    if _stage is None:
+        return None
+    now = time.perf_counter()
+    _charge(now)
+    io_now = _io_counters()
+    io_started = _stage["io_started"]
+    wall = now - _stage["started"]
+    return {
+        "stage": _stage["name"],
+        "status": _stage["status"],
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(time.time() - wall)),
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+        "params": _stage["params"],
+        "wall_s": wall,
+        "cpu_s": time.process_time() - _stage["cpu_started"],
+        "startup_cpu_s": _stage["cpu_started"],  # interpreter start and imports, before start_stage()
+        "phases_s": dict(_stage["phases"]),
+        "rows": _stage["rows"],
+        "rows_per_s": _stage["rows"] / wall if wall > 0 else None,
+        "bytes_read": io_now[0] - io_started[0] if io_now and io_started else None,
+        "bytes_written": io_now[1] - io_started[1] if io_now and io_started else None,
+        "store_bytes_read": _stage["store_bytes_read"],
+        "store_bytes_written": _stage["store_bytes_written"],
+        "peak_rss_mb": _peak_rss_mb(),
+        "tracemalloc_peak_mb": tracemalloc.get_traced_memory()[1] / 2 ** 20 if tracemalloc.is_tracing() else None,
+    }
+
+
+def finish_stage():
+    # Write the report line (runs at exit; safe to call once by hand before that)
+    global _stage
+    if _stage is None:
+        return None
+    report = stage_report()
+    if _stage["profiler"] is not None:
+        report["profile"] = _stop_profiler(_stage["name"], _stage["profiler"])
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    os.makedirs(os.path.dirname(_stage["report_path"]) or ".", exist_ok=True)
+    with open(_stage["report_path"], "a") as f:
+        f.write(json.dumps(report) + "\n")
+    _stage = None
+    return report
+
+
+def read_run_report(path=DEFAULT_REPORT):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,138 @@
+from bisect import bisect_left
+import numpy as np
+import pandas as pd
+
+# 📊 Reordering analytics for order streams
+#
+# Given order ids in arrival order (the order the exchange sees them after
+# drift), these measure how far the stream is from the true order:
+#
+#   inversion_count   pairs (i < j) that arrive as j before i; 0 = in order
+#   displacements     arrival position minus true position, per order
+#   longest_increasing_subsequence
+#                     the largest set of orders already in relative order;
+#                     every other order had to be reordered (the minimal set)
+#   window_violation_rates
+#                     descents (id lower than the one before it, the rule used
+#                     by anomaly_detector.py) and late orders per window
+#
+# Ids only need to be distinct; they are ranked first, so gaps are fine.
+# Everything is O(n log n) and vectorized except the LIS, which is a
+# patience-sorting pass with a fast path for orders that extend the longest
+# run so far (the common case for a mostly ordered stream).
+
+
+def true_positions(order_ids):
+    # Rank of each arriving order in the true (sorted id) order
+    order_ids = np.asarray(order_ids)
+    ranks = np.empty(len(order_ids), dtype=np.int64)
+    ranks[np.argsort(order_ids, kind="stable")] = np.arange(len(order_ids))
+    return ranks
+
+
+def inversion_count(order_ids):
+    # Bit by bit from the top, like a wavelet tree over the ranks. The ranks
+    # are padded to a power of two (with larger ranks arriving last, which adds
+    # no inversions), so at level b they form blocks of 2**(b+1) sharing their
+    # higher bits, each in arrival order. A 0-bit rank at in-block index j with
+    # z 0-bit ranks before it jumped ahead of j - z larger ones; summed over a
+    # block that is sum(j) - 2**b * (2**b - 1) / 2. Splitting every block into
+    # its 0-bit then 1-bit ranks (two boolean selects) gives the next level.
+    # Each level is a few O(n) passes, O(n log n) in total.
+    ranks = true_positions(order_ids)
+    n = len(ranks)
+    if n < 2:
+        return 0
+    levels = int(n - 1).bit_length()
+    size = 1 << levels
+    dtype = np.int32 if size <= np.iinfo(np.int32).max else np.int64
+    cur = np.concatenate((ranks.astype(dtype), np.arange(n, size, dtype=dtype)))
+    del ranks
+    total = 0
+    for b in range(levels - 1, -1, -1):
+        half = 1 << b
+        zero = (cur & half) == 0
+        zero_pos = np.flatnonzero(zero)
+        zero_pos &= 2 * half - 1
+        total += int(zero_pos.sum(dtype=np.int64)) - (size // (2 * half)) * (half * (half - 1) // 2)
+        del zero_pos
+        blocks = size // (2 * half)
+        cur = np.concatenate((cur[zero].reshape(blocks, half), cur[~zero].reshape(blocks, half)), axis=1).ravel()
+    return total
+
+
+def displacements(order_ids):
+    # Signed: > 0 means the order arrived later than its true position
+    return np.arange(len(order_ids)) - true_positions(order_ids)
+
+
+def longest_increasing_subsequence(order_ids):
+    # Returns a boolean mask of arrival positions in one longest increasing
+    # subsequence; ~mask is a minimum set of orders that were reordered.
+    ranks = true_positions(order_ids).tolist()
+    n = len(ranks)
+    tails = []        # smallest tail rank of an increasing run of each length
+    tail_pos = []     # arrival position of that tail
+    prev = [-1] * n   # predecessor position in the run ending at each position
+    top = -1          # tails[-1], kept in a local for the fast path
+    for pos, rank in enumerate(ranks):
+        if rank > top:
+            if tail_pos:
+                prev[pos] = tail_pos[-1]
+            tails.append(rank)
+            tail_pos.append(pos)
+            top = rank
+            continue
+        k = bisect_left(tails, rank)
+        if k:
+            prev[pos] = tail_pos[k - 1]
+        tails[k] = rank
+        tail_pos[k] = pos
+        if k == len(tails) - 1:
+            top = rank
+
+    mask = np.zeros(n, dtype=bool)
+    pos = tail_pos[-1] if tail_pos else -1
+    while pos >= 0:
+        mask[pos] = True
+        pos = prev[pos]
+    return mask
+
+
+def window_violation_rates(order_ids, window=1000):
+    # Per window of `window` arriving orders: descents (vs. the previous order)
+    # and late orders (below the highest id seen so far in the stream)
+    order_ids = np.asarray(order_ids)
+    n = len(order_ids)
+    descents = np.zeros(n, dtype=np.int64)
+    descents[1:] = order_ids[1:] < order_ids[:-1]
+    late = np.zeros(n, dtype=np.int64)
+    late[1:] = order_ids[1:] < np.maximum.accumulate(order_ids)[:-1]
+    starts = np.arange(0, n, window)
+    sizes = np.diff(np.append(starts, n))
+    descent_counts = np.add.reduceat(descents, starts) if n else np.empty(0, dtype=np.int64)
+    late_counts = np.add.reduceat(late, starts) if n else np.empty(0, dtype=np.int64)
+    return pd.DataFrame({
+        "window_start": starts,
+        "window_end": starts + sizes,
+        "descents": descent_counts,
+        "late_orders": late_counts,
+        "descent_rate": descent_counts / np.maximum(sizes, 1),
+        "late_rate": late_counts / np.maximum(sizes, 1),
+    })
+
+
+def reorder_summary(order_ids):
+    disp = displacements(order_ids)
+    in_order = longest_increasing_subsequence(order_ids)
+    n = len(disp)
+    return {
+        "orders": n,
+        "inversions": inversion_count(order_ids),
+        "max_pairs": n * (n - 1) // 2,
+        "max_displacement": int(np.abs(disp).max()) if n else 0,
+        "mean_abs_displacement": float(np.abs(disp).mean()) if n else 0.0,
+        "displaced_orders": int(np.count_nonzero(disp)),
+        "lis_length": int(in_order.sum()),
+        "min_reordered_orders": int(n - in_order.sum()),
+    }
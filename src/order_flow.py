@@ -0,0 +1,171 @@
+import heapq
+from collections import deque
+import numpy as np
+from clock_fleet import make_fleet, offsets_at
+
+# 🌊 Bursty order flow across several gateways
+#
+# Market orders arrive as a Poisson or a self-exciting Hawkes process with
+# mean rate rate_hz. The Hawkes process is built from its branching form, so
+# it needs no per-event loop: immigrants arrive as Poisson(rate * (1 - n)) and
+# every order spawns Poisson(n) follow-ups after Exp(burst_decay_s) delays
+# (n = branching_ratio < 1 sets how bursty the flow is). Time is generated in
+# windows of chunk_orders / rate_hz seconds; follow-ups that fall past the
+# window are carried into the next one, where their own follow-ups are drawn.
+#
+# Orders are numbered in true time (order_id), routed to gateways, and stamped
+# by the gateway's own clock (a clock_fleet member, fpga_2_ts) and given a
+# physical exchange arrival time (arrival_ts = true time + link latency +
+# jitter, FIFO per gateway). Each gateway stream is sorted by its stamps, and
+# merge_streams() combines them into the exchange sequence with a k-way heap
+# merge over chunks: the heap holds each gateway's last buffered key, and
+# everything up to the smallest of those keys is final and can be emitted.
+
+ORDER_COLUMNS = ["order_id", "clock_id", "fpga_1_ts", "fpga_2_ts", "arrival_ts"]
+
+
+def _poisson_window(rng, t0, t1, rate_hz):
+    return np.sort(rng.uniform(t0, t1, rng.poisson(rate_hz * (t1 - t0))))
+
+
+def market_arrivals(duration_sec, rate_hz, process="hawkes", branching_ratio=0.7, burst_decay_s=1e-3,
+                    chunk_orders=1 << 20, seed=42):
+    # Yields sorted arrays of true order times, about chunk_orders per window
+    if process not in ("poisson", "hawkes"):
+        raise ValueError(f"Unknown process '{process}' (expected 'poisson' or 'hawkes')")
+    if process == "hawkes" and not 0 <= branching_ratio < 1:
+        raise ValueError("branching_ratio must be in [0, 1) for a stationary Hawkes process")
+    rng = np.random.RandomState(seed)
+    n = branching_ratio if process == "hawkes" else 0.0
+    window = chunk_orders / rate_hz
+    spill = np.empty(0)
+    t0 = 0.0
+    while t0 < duration_sec:
+        t1 = min(t0 + window, duration_sec)
+        due = spill < t1
+        current = np.concatenate((spill[due], _poisson_window(rng, t0, t1, rate_hz * (1 - n))))
+        spill = spill[~due]
+        events = [current]
+        # One generation of follow-ups at a time, all vectorized
+        while n and len(current):
+            parents = np.repeat(current, rng.poisson(n, len(current)))
+            children = parents + rng.exponential(burst_decay_s, len(parents))
+            inside = children < t1
+            spill = np.concatenate((spill, children[~inside & (children < duration_sec)]))
+            current = children[inside]
+            events.append(current)
+        yield np.sort(np.concatenate(events))
+        t0 = t1
+
+
+def make_gateways(num_gateways, latency_s=20e-6, latency_spread_s=5e-6, jitter_s=2e-6, weights=None,
+                  drift_ppm_std=10.0, seed=42, **fleet_kwargs):
+    rng = np.random.RandomState(seed)
+    weights = np.full(num_gateways, 1.0 / num_gateways) if weights is None else np.asarray(weights, dtype=np.float64)
+    return {
+        "num_gateways": num_gateways,
+        "clocks": make_fleet(num_gateways, drift_ppm_std=drift_ppm_std, seed=seed, **fleet_kwargs),
+        "latency": latency_s + rng.uniform(-latency_spread_s, latency_spread_s, num_gateways),
+        "jitter_s": jitter_s,
+        "cum_weights": np.cumsum(weights / weights.sum()),
+        "rng": np.random.RandomState(seed + 1),
+        "next_id": 0,
+        "last_arrival": np.full(num_gateways, -np.inf),
+    }
+
+
+def route_orders(gateways, true_ts):
+    # One market chunk -> order records (true-time order), gateway stamps and arrivals
+    rng = gateways["rng"]
+    n = len(true_ts)
+    clock_id = np.minimum(np.searchsorted(gateways["cum_weights"], rng.rand(n), side="right"),
+                          gateways["num_gateways"] - 1)
+    order_id = np.arange(gateways["next_id"], gateways["next_id"] + n)
+    gateways["next_id"] += n
+    arrival = true_ts + gateways["latency"][clock_id] + rng.exponential(gateways["jitter_s"], n)
+    return {
+        "order_id": order_id,
+        "clock_id": clock_id,
+        "fpga_1_ts": true_ts,
+        "fpga_2_ts": true_ts + offsets_at(gateways["clocks"], true_ts, clock_id),
+        "arrival_ts": arrival,
+    }
+
+
+def _take(chunk, index):
+    return {col: values[index] for col, values in chunk.items()}
+
+
+def gateway_streams(gateways, market_chunks, on_market_chunk=None):
+    # Split the market stream into one chunk stream per gateway. The market is
+    # pulled lazily whenever a gateway runs dry, so only undelivered chunks are
+    # buffered. on_market_chunk sees every routed chunk in true-time order.
+    queues = [deque() for _ in range(gateways["num_gateways"])]
+    market = iter(market_chunks)
+
+    def pull():
+        true_ts = next(market, None)
+        if true_ts is None:
+            return False
+        orders = route_orders(gateways, true_ts)
+        if on_market_chunk is not None:
+            on_market_chunk(orders)
+        order = np.argsort(orders["clock_id"], kind="stable")
+        bounds = np.searchsorted(orders["clock_id"][order], np.arange(gateways["num_gateways"] + 1))
+        for g, queue in enumerate(queues):
+            part = _take(orders, order[bounds[g]:bounds[g + 1]])
+            if len(part["order_id"]):
+                # The link is FIFO: an order never overtakes the one sent before it
+                arrival = np.maximum.accumulate(np.append(gateways["last_arrival"][g], part["arrival_ts"]))[1:]
+                part["arrival_ts"] = arrival
+                gateways["last_arrival"][g] = arrival[-1]
+                queue.append(part)
+        return True
+
+    def stream(g):
+        while True:
+            while not queues[g]:
+                if not pull():
+                    return
+            yield queues[g].popleft()
+    return [stream(g) for g in range(gateways["num_gateways"])]
+
+
+def merge_streams(streams, key="fpga_2_ts"):
+    # k-way merge of chunk streams, each sorted by `key`, into one sorted chunk stream
+    pending = {}
+    heap = []
+
+    def refill(g):
+        chunk = next(streams[g], None)
+        while chunk is not None and not len(chunk[key]):
+            chunk = next(streams[g], None)
+        if chunk is None:
+            pending.pop(g, None)
+            return
+        pending[g] = chunk
+        heapq.heappush(heap, (chunk[key][-1], g))
+
+    for g in range(len(streams)):
+        refill(g)
+    while heap:
+        horizon, g = heapq.heappop(heap)
+        # Every stream's remaining keys are >= its last buffered key >= horizon
+        parts = []
+        for h in list(pending):
+            cut = np.searchsorted(pending[h][key], horizon, side="right")
+            if cut:
+                parts.append(_take(pending[h], slice(0, cut)))
+                pending[h] = _take(pending[h], slice(cut, None))
+        if parts:  # empty when an equal key of another stream already took everything up to horizon
+            merged = {col: np.concatenate([part[col] for part in parts]) for col in parts[0]}
+            yield _take(merged, np.argsort(merged[key], kind="stable"))
+        refill(g)
+
+
+def order_flow(duration_sec, rate_hz, num_gateways=4, process="hawkes", branching_ratio=0.7, burst_decay_s=1e-3,
+               merge_key="fpga_2_ts", chunk_orders=1 << 20, seed=42, on_market_chunk=None, **gateway_kwargs):
+    # Exchange-sequenced order chunks (ORDER_COLUMNS), merged on merge_key
+    gateways = make_gateways(num_gateways, seed=seed, **gateway_kwargs)
+    market = market_arrivals(duration_sec, rate_hz, process, branching_ratio, burst_decay_s, chunk_orders, seed)
+    return merge_streams(gateway_streams(gateways, market, on_market_chunk), key=merge_key)
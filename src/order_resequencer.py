@@ -0,0 +1,120 @@
+import os
+import numpy as np
+import pandas as pd
+from timebase import order_seconds
+from resequencer import resequence, resequence_stream, resequence_summary, smallest_hold
+from stage_params import run_stage
+from instrumentation import add_rows, section, set_phase
+
+# 🧮 Re-sequencer Parameters (see resequencer.py)
+# Orders are taken in the drifted (exchange) sequence, held for a window
+# measured on arrival_column and released in sequence_column order.
+sequence_column = "fpga_1_ts"    # Timestamp orders are re-sequenced by
+arrival_column = "fpga_2_ts"     # Arrival clock ("arrival_ts" for order_flow link arrivals)
+hold_mode = "fixed"              # "fixed" hold, or "adaptive" (hold = window + estimated clock offset)
+offset_window = 1000             # Adaptive: orders per block of the offset estimate
+hold_windows = [0.0, 1e-6, 2e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4]   # Sweep (s), increasing
+max_violation_rate = 1e-3        # Fairness target: violations left per order
+hold_s = None                    # None = smallest swept hold meeting the target (largest if none does)
+engine = "batch"                 # Final pass: "batch" (vectorized) or "stream" (heap, chunk by chunk)
+chunk_size = 1 << 20             # Stream engine: orders fed per chunk
+
+
+def main(plots=True):
+    os.makedirs("data", exist_ok=True)
+    os.makedirs("output/plots", exist_ok=True)
+
+    if hold_mode not in ("fixed", "adaptive"):
+        raise ValueError(f"Unknown hold_mode '{hold_mode}' (expected 'fixed' or 'adaptive')")
+    if engine not in ("batch", "stream"):
+        raise ValueError(f"Unknown engine '{engine}' (expected 'batch' or 'stream')")
+    adaptive = hold_mode == "adaptive"
+
+    try:
+        with section("csv_io"):
+            orders = pd.read_csv("data/drifted_orders.csv")
+    except FileNotFoundError:
+        raise FileNotFoundError("Missing 'data/drifted_orders.csv'. Please run order_simulator.py first.")
+    orders = order_seconds(orders)
+    for col in (sequence_column, arrival_column):
+        if col not in orders.columns:
+            raise KeyError(f"Column '{col}' not in data/drifted_orders.csv (columns: {list(orders.columns)})")
+    order_ids = orders["order_id"].to_numpy()
+    keys = orders[sequence_column].to_numpy(dtype=np.float64)
+    arrivals = orders[arrival_column].to_numpy(dtype=np.float64)
+    add_rows(len(orders))
+
+    # 🔁 Sweep the hold window (batch engine) and pick the smallest meeting the target
+    sweep = []
+    for window in sorted(hold_windows):
+        summary = resequence_summary(order_ids, arrivals, resequence(keys, arrivals, window, adaptive, offset_window))
+        sweep.append({"hold_mode": hold_mode, "hold_window_s": window, **summary})
+        print(f"[resequencer] hold {window * 1e6:g} µs ({hold_mode}): {summary['violations_after']} of "
+              f"{summary['violations_before']} violations left, "
+              f"mean added latency {summary['mean_added_latency_s'] * 1e6:.3f} µs, "
+              f"p99 {summary['p99_added_latency_s'] * 1e6:.3f} µs")
+    sweep_df = pd.DataFrame(sweep)
+    with section("csv_io"):
+        sweep_df.to_csv("output/resequencer_sweep.csv", index=False)
+    print("Hold-window sweep saved to: output/resequencer_sweep.csv")
+
+    hold = hold_s
+    if hold is None:
+        chosen = smallest_hold(sweep, max_violation_rate)
+        if chosen is None:
+            chosen = sweep[-1]
+            print(f"[WARN] No swept hold meets {max_violation_rate:g} violations per order; using the largest")
+        hold = chosen["hold_window_s"]
+
+    # 🧾 Final pass with the chosen hold
+    if engine == "batch":
+        result = resequence(keys, arrivals, hold, adaptive, offset_window)
+    else:
+        result = resequence_stream(keys, arrivals, hold, adaptive, offset_window, chunk_size)
+    summary = {"hold_mode": hold_mode, "hold_window_s": hold, "engine": engine,
+               **resequence_summary(order_ids, arrivals, result, inversions=True)}
+    print(f"[INFO] Hold {hold * 1e6:g} µs ({hold_mode}, {engine}): removed {summary['violations_removed']} of "
+          f"{summary['violations_before']} violations ({summary['inversions_before']} -> {summary['inversions_after']} "
+          f"inversions), mean added latency {summary['mean_added_latency_s'] * 1e6:.3f} µs, "
+          f"at most {summary['max_buffered']} orders held")
+
+    resequenced = orders.iloc[result["order"]].reset_index(drop=True)
+    resequenced["release_s"] = result["release_s"][result["order"]]
+    resequenced["added_latency_s"] = resequenced["release_s"] - np.maximum.accumulate(arrivals)[result["order"]]
+    with section("csv_io"):
+        resequenced.to_csv("data/resequenced_orders.csv", index=False)
+        pd.DataFrame([summary]).to_csv("output/resequencer_summary.csv", index=False)
+    print("Re-sequenced orders saved to: data/resequenced_orders.csv")
+    print("Re-sequencer summary saved to: output/resequencer_summary.csv")
+
+    if not plots:
+        return
+
+    import matplotlib.pyplot as plt
+    set_phase("plot")
+    # 📈 Violations left and latency added against the hold window
+    fig, (ax_viol, ax_lat) = plt.subplots(1, 2, figsize=(14, 5))
+    holds_us = sweep_df["hold_window_s"] * 1e6
+    ax_viol.plot(holds_us, sweep_df["violation_rate"], marker="o", label="Violations left per order")
+    ax_viol.axhline(max_violation_rate, color="red", linestyle="--", label="Fairness target")
+    ax_viol.axvline(hold * 1e6, color="gray", linestyle=":", label="Chosen hold")
+    ax_viol.set_yscale("symlog", linthresh=max(max_violation_rate / 10, 1e-9))
+    ax_viol.set_title(f"Sequence Violations vs Hold Window ({hold_mode})")
+    ax_viol.set_xlabel("Hold window (µs)")
+    ax_viol.set_ylabel("Violations per order")
+    ax_lat.plot(holds_us, sweep_df["mean_added_latency_s"] * 1e6, marker="o", label="Mean")
+    ax_lat.plot(holds_us, sweep_df["p99_added_latency_s"] * 1e6, marker="o", label="p99")
+    ax_lat.set_title("Added Latency per Order")
+    ax_lat.set_xlabel("Hold window (µs)")
+    ax_lat.set_ylabel("Added latency (µs)")
+    for ax in (ax_viol, ax_lat):
+        ax.grid(True)
+        ax.legend()
+    plt.tight_layout()
+    plt.savefig("output/plots/resequencer_tradeoff.png")
+    plt.close()
+    print("Re-sequencer plot saved to: output/plots/resequencer_tradeoff.png")
+
+
+if __name__ == "__main__":
+    run_stage(globals())
@@ -1,42 +1,108 @@
 import os
 import pandas as pd
 import numpy as np
-import os
+from sample_store import iter_table_chunks, read_meta, table_exists
+from timebase import order_time_unit
+from clock_fleet import stamp_orders
+from order_flow import order_flow
+from clock_stream import sample_orders, with_throughput
+from stage_params import run_stage
+from instrumentation import section
 
-# 🔍 Set working directory to project root if not already
-project_root = "D:/clock-drift-fpga-project"
-if os.getcwd() != project_root:
-    os.chdir(project_root)
+# Order generation parameters
+order_interval = 1000          # Every 1000 samples = 1 ms
+chunk_size = 1 << 20           # Drift samples read (or flow orders generated) per chunk
+clock_source = "clock_drift"   # "clock_drift" (FPGA_1 vs FPGA_2), "clock_fleet" (any fleet member)
+                               # or "order_flow" (bursty multi-gateway flow, see order_flow.py)
+seed = 42                      # Fleet / order-flow modes
 
-# Ensure folders exist
-os.makedirs("data", exist_ok=True)
-os.makedirs("output", exist_ok=True)
+# Order-flow mode: Hawkes/Poisson arrivals stamped by each gateway's own clock
+flow = {
+    "duration_sec": 1.0,
+    "rate_hz": 100_000,        # Mean order rate
+    "num_gateways": 4,
+    "process": "hawkes",       # "hawkes" (bursty) or "poisson"
+    "branching_ratio": 0.7,    # Hawkes: follow-ups per order (burstiness), < 1
+    "burst_decay_s": 1e-3,     # Hawkes: mean delay of a follow-up
+    "merge_key": "fpga_2_ts",  # Exchange sequence by gateway stamp, or "arrival_ts" (link latency)
+}
 
-# Load clock drift data
-try:
-    df = pd.read_csv("data/clock_drift.csv")
-except FileNotFoundError:
-    raise FileNotFoundError("Missing 'data/clock_drift.csv'. Please run the clock drift generator first.")
 
-# Order generation parameters
-order_interval = 1000  # Every 1000 samples = 1 ms
-order_indices = np.arange(0, len(df), order_interval)
-
-# Generate Orders
-orders = pd.DataFrame({
-    "order_id": np.arange(len(order_indices)),
-    "fpga_1_ts": df.loc[order_indices, "fpga_1_time"].values,
-    "fpga_2_ts": df.loc[order_indices, "fpga_2_time"].values
-})
-
-# Save normal orders (FPGA_1 is ground truth)
-normal_orders = orders.sort_values(by="fpga_1_ts").reset_index(drop=True)
-normal_orders.to_csv("data/normal_orders.csv", index=False)
-
-# Save drifted orders (FPGA_2 introduces possible reorder)
-drifted_orders = orders.sort_values(by="fpga_2_ts").reset_index(drop=True)
-drifted_orders.to_csv("data/drifted_orders.csv", index=False)
-
-print("Order simulation completed.")
-print("Normal order timestamps saved to: data/normal_orders.csv")
-print("Drifted order timestamps saved to: data/drifted_orders.csv")
+def append_orders(path, chunk):
+    # Append one chunk of orders to a CSV, writing the header on first use
+    with section("csv_io"):
+        pd.DataFrame(chunk).to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+
+
+def main(plots=True):
+    # Ensure folders exist
+    os.makedirs("data", exist_ok=True)
+    os.makedirs("output", exist_ok=True)
+
+    if clock_source == "order_flow":
+        # Stream straight to disk: the router hands over each chunk in true-time
+        # order (normal orders) while the k-way merge emits the exchange sequence
+        for path in ("data/normal_orders.csv", "data/drifted_orders.csv"):
+            if os.path.exists(path):
+                os.remove(path)
+        drifted = order_flow(seed=seed, chunk_orders=chunk_size,
+                             on_market_chunk=lambda chunk: append_orders("data/normal_orders.csv", chunk), **flow)
+        for chunk in with_throughput(drifted, "order_simulator"):
+            append_orders("data/drifted_orders.csv", chunk)
+    else:
+        # Generate Orders by streaming the clock table; only the sampled orders are kept
+        try:
+            if clock_source == "clock_fleet":
+                # Each order is stamped by a random fleet member; FPGA_1 stays true time
+                rng = np.random.RandomState(seed)
+                clock_columns = [col for col in read_meta("data/clock_fleet")["columns"] if col.startswith("clock_")]
+                order_chunks = []
+                chunks = iter_table_chunks("data/clock_fleet", chunk_size=chunk_size)
+                for chunk in with_throughput(chunks, "order_simulator"):
+                    offsets = np.column_stack([chunk[col] for col in clock_columns]).astype(np.float64)
+                    next_id = sum(len(c["order_id"]) for c in order_chunks)
+                    order_chunks.append(stamp_orders(chunk["sample"], chunk["time_sec"], offsets, order_interval,
+                                                     rng, next_id))
+                order_columns = ["order_id", "clock_id", "fpga_1_ts", "fpga_2_ts"]
+            else:
+                # A legacy data/clock_drift.csv (no store metadata) holds float seconds
+                attrs = read_meta("data/clock_drift").get("attrs", {}) if table_exists("data/clock_drift") else {}
+                time_unit = attrs.get("time_unit")
+                if time_unit is None:
+                    chunks = iter_table_chunks("data/clock_drift", columns=["fpga_1_time", "fpga_2_time"],
+                                               chunk_size=chunk_size)
+                    order_chunks = list(sample_orders(with_throughput(chunks, "order_simulator"), order_interval))
+                    order_columns = ["order_id", "fpga_1_ts", "fpga_2_ts"]
+                else:
+                    # Integer-tick clocks: stamp orders with exact int64 ticks (fpga_1_ts_ps, ...)
+                    stamps = (f"fpga_1_ts_{time_unit}", f"fpga_2_ts_{time_unit}")
+                    chunks = iter_table_chunks("data/clock_drift", columns=["time_ticks", "fpga_2_delta"],
+                                               chunk_size=chunk_size)
+                    chunks = ({stamps[0]: c["time_ticks"],
+                               stamps[1]: c["time_ticks"] + c["fpga_2_delta"].astype(np.int64)} for c in chunks)
+                    order_chunks = list(sample_orders(with_throughput(chunks, "order_simulator"), order_interval, stamps))
+                    order_columns = ["order_id", *stamps]
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Missing 'data/{clock_source}.cols'. Please run the clock drift generator first.")
+        orders = pd.DataFrame({col: np.concatenate([c[col] for c in order_chunks]) for col in order_columns})
+
+        unit = order_time_unit(orders.columns)
+        fpga_1_ts, fpga_2_ts = ("fpga_1_ts", "fpga_2_ts") if unit is None else (f"fpga_1_ts_{unit}", f"fpga_2_ts_{unit}")
+
+        # Save normal orders (FPGA_1 is ground truth)
+        normal_orders = orders.sort_values(by=fpga_1_ts).reset_index(drop=True)
+        with section("csv_io"):
+            normal_orders.to_csv("data/normal_orders.csv", index=False)
+
+        # Save drifted orders (FPGA_2 introduces possible reorder)
+        drifted_orders = orders.sort_values(by=fpga_2_ts).reset_index(drop=True)
+        with section("csv_io"):
+            drifted_orders.to_csv("data/drifted_orders.csv", index=False)
+
+    print("Order simulation completed.")
+    print("Normal order timestamps saved to: data/normal_orders.csv")
+    print("Drifted order timestamps saved to: data/drifted_orders.csv")
+
+
+if __name__ == "__main__":
+    run_stage(globals())
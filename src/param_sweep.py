@@ -0,0 +1,211 @@
+import os
+import csv
+import json
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from clock_stream import DEFAULT_CHUNK_SIZE, generate_clock_chunks, sample_orders
+from fault_engine import make_fault_injector
+from clock_servo import make_servo
+from ptp_protocol import simulate_ptp
+from price_engine import build_tick_index, generate_ticks, price_at
+
+# 🧪 Parameter sweeps over the whole pipeline
+#
+# Each grid point runs clock generation -> fault injection -> correction ->
+# orders -> loss model in memory (no files in data/), and comes back as one
+# row of summary metrics:
+#
+#   residual_rms_s / residual_max_s   corrected FPGA_2 minus FPGA_1
+#   order_violations                  out-of-order ids in FPGA_2 time order
+#   total_loss                        sum of drifted minus normal order value
+#
+# Points run in a process pool. A point's seed is derived from a hash of its
+# own parameters (not its position in the grid), so results do not depend on
+# grid order, worker count or which points ran before an interruption. Every
+# finished point is appended to the results CSV straight away and the file is
+# flushed, so rerunning the same sweep skips the points already on disk.
+# Fault draws follow the chunk layout (see fault_engine), so keep chunk_size
+# fixed for all runs that share a results file.
+
+# Pipeline settings used by any point that does not override them
+DEFAULT_POINT = {
+    "duration_sec": 1,
+    "sampling_rate_hz": 1e6,
+    "drift_per_sec": 10e-6,
+    "fault_chance": 0.05,
+    "fault_magnitude_ns": 100,
+    "correction": "servo",        # "servo" (corrective_feedback) or "ptp" (ptp_sync_model)
+    "kp": 0.1,
+    "ki": 0.0,
+    "kd": 0.0,
+    "update_every": 1,
+    "sync_interval": 5000,        # PTP sync interval in samples
+    "correction_strength": 0.5,   # PTP: fraction of the offset removed per sync
+    "order_interval": 1000,
+}
+
+METRICS = ["point_id", "seed", "residual_rms_s", "residual_max_s", "orders", "order_violations", "total_loss"]
+
+
+def expand_grid(grid):
+    # {"kp": [0.1, 0.2], "drift_per_sec": [5e-6, 1e-5]} -> list of 4 point dicts
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def point_id(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def point_seed(params, base_seed=42):
+    # Stable across runs, platforms and grid orderings
+    digest = hashlib.sha256(f"{base_seed}:{point_id(params)}".encode()).digest()
+    return int.from_bytes(digest[:4], "little") & 0x7FFFFFFF
+
+
+# Helper: fault mix of fault_injection.py for a given magnitude
+def _default_faults(magnitude_ns):
+    return [
+        {"model": "spike", "magnitude_ns": magnitude_ns},
+        {"model": "drift_jump", "magnitude_ns": magnitude_ns / 2},
+        {"model": "stuck"},
+        {"model": "burst", "every": 2000, "probability": 0.5, "length": 300, "scale_ns": 50},
+    ]
+
+
+def _order_violations(order_id, fpga_2_ts):
+    # Same rule as anomaly_detector.py: an id lower than the one before it
+    ids = order_id[np.argsort(fpga_2_ts, kind="stable")]
+    return int((ids[1:] < ids[:-1]).sum())
+
+
+def _order_loss(fpga_1_ts, fpga_2_ts, duration_sec, seed):
+    # Same tick model and interpolated pricing as financial_model.py (one instrument)
+    index = build_tick_index(**generate_ticks(1, duration_sec, seed=seed))
+    value_normal, value_drifted = price_at(index, np.zeros(len(fpga_1_ts), dtype=np.int64), fpga_1_ts, fpga_2_ts,
+                                           method="linear")
+    return value_drifted - value_normal
+
+
+# Helper: concatenate per-chunk order dicts from clock_stream.sample_orders
+def _concat(order_chunks):
+    order_chunks = list(order_chunks)
+    return {col: np.concatenate([c[col] for c in order_chunks]) for col in ("order_id", "fpga_1_ts", "fpga_2_ts")}
+
+
+def _residual_stats(residual, acc):
+    acc["sum_sq"] += float(np.dot(residual, residual))
+    acc["max_abs"] = max(acc["max_abs"], float(np.abs(residual).max())) if len(residual) else acc["max_abs"]
+    acc["samples"] += len(residual)
+
+
+def run_point(params, base_seed=42, chunk_size=DEFAULT_CHUNK_SIZE):
+    seed = point_seed(params, base_seed)
+    return {
+        **params,
+        "point_id": point_id(params),
+        "seed": seed,
+        **simulate_point({**DEFAULT_POINT, **params}, seed, seed + 1, chunk_size),
+    }
+
+
+def simulate_point(p, seed, price_seed, chunk_size=DEFAULT_CHUNK_SIZE):
+    # One full pipeline run for complete settings p; faults draw from seed, ticks from price_seed
+    faults = p.get("faults") or _default_faults(p["fault_magnitude_ns"])
+    inject = make_fault_injector(faults=faults, fault_chance=p["fault_chance"], seed=seed)
+    chunks = generate_clock_chunks(p["duration_sec"], p["sampling_rate_hz"], p["drift_per_sec"], chunk_size=chunk_size)
+    acc = {"sum_sq": 0.0, "max_abs": 0.0, "samples": 0}
+
+    if p["correction"] == "servo":
+        # Streamed: only the running residual sums and the sampled orders are kept
+        servo = make_servo(kp=p["kp"], ki=p["ki"], kd=p["kd"], update_every=p["update_every"],
+                           sample_rate_hz=p["sampling_rate_hz"])
+
+        def corrected_chunks():
+            for chunk in chunks:
+                corrected, _ = servo(chunk["fpga_1_time"], inject(chunk["fpga_2_time"]))
+                _residual_stats(corrected - chunk["fpga_1_time"], acc)
+                yield {"fpga_1_time": chunk["fpga_1_time"], "fpga_2_time": corrected}
+        orders = _concat(sample_orders(corrected_chunks(), p["order_interval"]))
+    elif p["correction"] == "ptp":
+        # simulate_ptp needs the whole series, as in ptp_sync_model.py
+        parts = [(c["time_sec"], c["fpga_1_time"], inject(c["fpga_2_time"])) for c in chunks]
+        time_sec, fpga_1, faulted = (np.concatenate(col) for col in zip(*parts))
+        del parts
+        sync_interval_s = p["sync_interval"] / p["sampling_rate_hz"]
+        corrected_offsets, _, _ = simulate_ptp(time_sec, faulted - fpga_1, sync_interval_s=sync_interval_s,
+                                               kp=0.0, ki=p["correction_strength"] / sync_interval_s, kd=0.0)
+        _residual_stats(corrected_offsets[:, 0], acc)
+        corrected = {"fpga_1_time": fpga_1, "fpga_2_time": fpga_1 + corrected_offsets[:, 0]}
+        orders = _concat(sample_orders([corrected], p["order_interval"]))
+    else:
+        raise ValueError(f"Unknown correction '{p['correction']}' (expected 'servo' or 'ptp')")
+
+    loss = _order_loss(orders["fpga_1_ts"], orders["fpga_2_ts"], p["duration_sec"], price_seed)
+    return {
+        "residual_rms_s": float(np.sqrt(acc["sum_sq"] / acc["samples"])) if acc["samples"] else 0.0,
+        "residual_max_s": acc["max_abs"],
+        "orders": len(orders["order_id"]),
+        "order_violations": _order_violations(orders["order_id"], orders["fpga_2_ts"]),
+        "total_loss": float(loss.sum()),
+    }
+
+
+# Helper: drop a partial last row left behind by a crash mid-write
+def _trim_torn_row(results_path):
+    with open(results_path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def completed_points(results_path):
+    if not os.path.exists(results_path):
+        return set()
+    _trim_torn_row(results_path)
+    with open(results_path, newline="") as f:
+        return {row["point_id"] for row in csv.DictReader(f) if row.get("total_loss")}
+
+
+def run_sweep(grid, results_path, base_seed=42, max_workers=None, chunk_size=DEFAULT_CHUNK_SIZE, report=print):
+    # grid: dict of parameter -> list of values, or an explicit list of point dicts
+    points = expand_grid(grid) if isinstance(grid, dict) else list(grid)
+    done = completed_points(results_path)
+    pending = [params for params in points if point_id(params) not in done]
+    report(f"[sweep] {len(points)} points, {len(points) - len(pending)} already in {results_path}, {len(pending)} to run")
+    if not pending:
+        return results_path
+
+    param_names = sorted({name for params in points for name in params})
+    fieldnames = param_names + METRICS
+    os.makedirs(os.path.dirname(results_path) or ".", exist_ok=True)
+    new_file = not os.path.exists(results_path) or os.path.getsize(results_path) == 0
+    if not new_file:
+        with open(results_path, newline="") as f:
+            existing = next(csv.reader(f), [])
+        if existing != fieldnames:
+            raise ValueError(f"'{results_path}' has columns {existing}, this sweep writes {fieldnames}; use a new results file")
+
+    failures = 0
+    with open(results_path, "a", newline="") as out, ProcessPoolExecutor(max_workers=max_workers) as pool:
+        writer = csv.DictWriter(out, fieldnames=fieldnames)
+        if new_file:
+            writer.writeheader()
+        futures = {pool.submit(run_point, params, base_seed, chunk_size): params for params in pending}
+        for finished, future in enumerate(as_completed(futures), 1):
+            try:
+                row = future.result()
+            except Exception as exc:
+                # Not written, so the point is retried on the next run
+                failures += 1
+                report(f"[sweep] point {futures[future]} failed: {exc!r}")
+                continue
+            writer.writerow(row)
+            out.flush()
+            os.fsync(out.fileno())
+            report(f"[sweep] {finished}/{len(pending)} done")
+    if failures:
+        report(f"[sweep] {failures} point(s) failed; rerun to retry them")
+    return results_path
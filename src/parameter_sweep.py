@@ -0,0 +1,29 @@
+import os
+import pandas as pd
+from param_sweep import run_sweep
+from stage_params import run_stage
+
+# Sweep Parameters: every combination below is one pipeline run (see
+# param_sweep.DEFAULT_POINT for the settings that are not swept)
+grid = {
+    "drift_per_sec": [5e-6, 10e-6, 20e-6],
+    "correction": ["servo"],
+    "kp": [0.05, 0.1, 0.2, 0.5],
+    "fault_chance": [0.0, 0.05],
+}
+base_seed = 42       # Per-point seeds are derived from this and the point's parameters
+max_workers = None   # None = one worker per CPU core
+results_path = "output/sweeps/sweep_results.csv"  # Rerunning resumes from this file
+
+
+def main(plots=True):
+    os.makedirs("output/sweeps", exist_ok=True)
+    run_sweep(grid, results_path, base_seed=base_seed, max_workers=max_workers)
+    results = pd.read_csv(results_path)
+    print(f"Sweep results saved to: {results_path}")
+    print(results.sort_values("residual_rms_s").head(10).to_string(index=False))
+
+
+if __name__ == "__main__":
+    # The guard keeps worker processes (spawned on Windows) from rerunning the sweep
+    run_stage(globals())
@@ -0,0 +1,125 @@
+import numpy as np
+
+# 〰️ Power-law phase noise, synthesized chunk by chunk
+#
+# Oscillator noise is described by the fractional-frequency PSD
+# S_y(f) = h_alpha * f**alpha, i.e. a time-error (phase) PSD
+# S_x(f) = S_y(f) / (2 pi f)**2 = h_alpha / (4 pi**2) * f**(alpha - 2):
+#
+#   white_pm        alpha = +2     flicker_fm      alpha = -1
+#   flicker_pm      alpha = +1     random_walk_fm  alpha = -2
+#   white_fm        alpha =  0
+#
+# A noise spec is a list of components, each {"type": <name>, "h": h_alpha},
+# or {"type": "mask", "carrier_hz": f0, "offsets_hz": [...], "dbc_hz": [...]}
+# for a single-sideband phase-noise mask L(f) (log-log interpolated, flat
+# beyond its ends). Components are independent and summed; the output is the
+# time error x in seconds.
+#
+# Each component is white Gaussian noise through a filter. An f**-beta phase
+# PSD is (1 - z^-1)**(-beta / 2) applied to white noise (Kasdin & Walter):
+# the integer part of beta / 2 is exact running sums carried across chunks,
+# and the fractional remainder (flicker) is a truncated FIR whose taps follow
+# the binomial series. Masks become a linear-phase FIR designed by frequency
+# sampling. FIRs are applied with FFT convolution in overlap-add form: each
+# chunk is convolved on its own and the filter tail is carried into the next
+# chunk, so a 1e8-sample series costs one chunk of memory. Flicker and mask
+# shapes are exact down to about sample_rate_hz / filter_len.
+
+NOISE_TYPES = {"white_pm": 2, "flicker_pm": 1, "white_fm": 0, "flicker_fm": -1, "random_walk_fm": -2}
+DEFAULT_FILTER_LEN = 1 << 14
+
+
+def kasdin_taps(beta, length):
+    # FIR taps of (1 - z^-1)**(-beta / 2): h_0 = 1, h_k = h_(k-1) * (beta / 2 + k - 1) / k
+    k = np.arange(1, length)
+    return np.concatenate(([1.0], np.cumprod((beta / 2 + k - 1) / k)))
+
+
+def mask_psd(offsets_hz, dbc_hz, carrier_hz, f):
+    # Time-error PSD S_x(f) (s^2/Hz) of an L(f) mask, log-log interpolated
+    log_l = np.interp(np.log10(np.maximum(f, offsets_hz[0])), np.log10(offsets_hz), dbc_hz)
+    return 2 * 10 ** (log_l / 10) / (2 * np.pi * carrier_hz) ** 2
+
+
+def mask_taps(offsets_hz, dbc_hz, carrier_hz, sample_rate_hz, length):
+    # Linear-phase FIR whose response on unit white noise has the mask's PSD
+    offsets_hz = np.asarray(offsets_hz, dtype=np.float64)
+    if np.any(np.diff(offsets_hz) <= 0) or offsets_hz[0] <= 0:
+        raise ValueError("Mask offsets must be positive and increasing")
+    f = np.fft.rfftfreq(length, 1 / sample_rate_hz)
+    amplitude = np.sqrt(mask_psd(offsets_hz, np.asarray(dbc_hz, dtype=np.float64), carrier_hz, f) * sample_rate_hz / 2)
+    taps = np.roll(np.fft.irfft(amplitude, length), length // 2)
+    return taps * np.hanning(length + 2)[1:-1]  # taper the truncated response (the energy sits mid-window)
+
+
+def _component_filter(component, sample_rate_hz, filter_len):
+    # (scale, fir taps or None, number of running sums) for one component
+    kind = component["type"]
+    if kind == "mask":
+        taps = mask_taps(component["offsets_hz"], component["dbc_hz"], component["carrier_hz"], sample_rate_hz, filter_len)
+        return 1.0, taps, 0
+    if kind not in NOISE_TYPES:
+        raise ValueError(f"Unknown noise type '{kind}' (expected one of {sorted(NOISE_TYPES)} or 'mask')")
+    beta = 2 - NOISE_TYPES[kind]
+    # White noise of variance s^2 through (1 - z^-1)**(-beta/2) has S_x(f) ~ (2 s^2 / fs) (fs / (2 pi f))**beta
+    b = component["h"] / (4 * np.pi ** 2)
+    scale = np.sqrt(b / 2 * sample_rate_hz ** (1 - beta) * (2 * np.pi) ** beta)
+    sums, fractional = divmod(beta, 2)
+    taps = kasdin_taps(fractional, filter_len) if fractional else None
+    return scale, taps, int(sums)
+
+
+def new_noise_state(noise, sample_rate_hz, filter_len=DEFAULT_FILTER_LEN, seed=42):
+    # One random stream per component, so the series does not depend on the chunking
+    components = []
+    for k, component in enumerate(noise):
+        scale, taps, sums = _component_filter(component, sample_rate_hz, filter_len)
+        state = {"scale": scale, "taps": taps, "sums": np.zeros(sums), "tail": None, "spectra": {},
+                 "rng": np.random.RandomState(seed + k)}
+        if taps is not None:
+            # Warm-up: start with a full filter history instead of zeros
+            state["tail"] = np.zeros(len(taps) - 1)
+            _overlap_add(state, state["rng"].standard_normal(len(taps)))
+        components.append(state)
+    return {"components": components}
+
+
+# Helper: FFT-convolve one block with the component's FIR, carrying the tail
+def _overlap_add(state, block):
+    taps = state["taps"]
+    n = len(block)
+    nfft = 1 << int(np.ceil(np.log2(n + len(taps) - 1)))
+    spectrum = state["spectra"].get(nfft)
+    if spectrum is None:
+        spectrum = state["spectra"][nfft] = np.fft.rfft(taps, nfft)
+    full = np.fft.irfft(np.fft.rfft(block, nfft) * spectrum, nfft)[:n + len(taps) - 1]
+    full[:len(taps) - 1] += state["tail"]
+    state["tail"] = full[n:].copy()
+    return full[:n]
+
+
+def noise_chunk(state, n):
+    # The next n samples of the time error (s)
+    x = np.zeros(n)
+    for component in state["components"]:
+        w = component["rng"].standard_normal(n)
+        if component["taps"] is not None:
+            w = _overlap_add(component, w)
+        for k in range(len(component["sums"])):
+            w = np.cumsum(w)
+            w += component["sums"][k]
+            component["sums"][k] = w[-1]
+        x += component["scale"] * w
+    return x
+
+
+def phase_noise_chunks(noise, n, sample_rate_hz, chunk_size=1 << 20, filter_len=DEFAULT_FILTER_LEN, seed=42):
+    # Yields the time-error series (s) of n samples in chunks of chunk_size
+    state = new_noise_state(noise, sample_rate_hz, filter_len, seed)
+    for start in range(0, n, chunk_size):
+        yield noise_chunk(state, min(chunk_size, n - start))
+
+
+def phase_noise(noise, n, sample_rate_hz, filter_len=DEFAULT_FILTER_LEN, seed=42):
+    return np.concatenate(list(phase_noise_chunks(noise, n, sample_rate_hz, filter_len=filter_len, seed=seed)) or [np.empty(0)])
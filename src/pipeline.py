@@ -0,0 +1,417 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from stage_params import PARAMS_ENV, PLOTS_ENV, parse_value
+from instrumentation import PROFILE_ENV, REPORT_ENV, read_run_report
+
+# 🧩 DAG pipeline runner
+#
+# Each stage script is declared with the files it reads (and the stage that
+# produces them), the files it writes, and its parameter overrides (names of
+# the script's module-level constants, see stage_params.py). A stage's key is
+# a hash of its script and the local modules it imports, its parameters, and
+# the content hashes of its inputs. Outputs live in a versioned artifact:
+#
+#   artifacts/<stage>/<key>/data/...      outputs (inputs are linked in)
+#   artifacts/<stage>/<key>/output/...
+#   artifacts/<stage>/<key>/manifest.json key parts and output content hashes
+#   artifacts/<stage>/latest              key of the last successful run
+#
+# A stage whose artifact already exists is skipped; its manifest supplies the
+# output hashes that downstream keys are built from, so a rerun that changes
+# one parameter only reruns that stage and whatever consumes its outputs
+# (and stops early when an output comes out byte-identical). Independent
+# stages run in parallel as subprocesses, each with its artifact directory as
+# the project root (CLOCK_DRIFT_PROJECT_ROOT). A failed run leaves no
+# manifest, so it is never mistaken for a cached result. Each executed
+# stage's instrumentation report (see instrumentation.py) is stored in its
+# manifest and appended to artifacts/run_report.jsonl. With --no-plots the
+# stages skip their plots (and their .png outputs) and are cached under keys
+# of their own.
+#
+#   python src/pipeline.py                       # everything
+#   python src/pipeline.py anomalies loss        # these stages and what they need
+#   python src/pipeline.py --set clock.drift_per_sec=2e-5 --jobs 4
+#   python src/pipeline.py --force --profile feedback feedback   # cProfile one stage
+#   python src/pipeline.py --no-plots            # headless: data and CSVs only
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SRC_DIR)
+ARTIFACTS_DIR = os.path.join(PROJECT_ROOT, "artifacts")
+MANIFEST_FILE = "manifest.json"
+RUN_REPORT = os.path.join(ARTIFACTS_DIR, "run_report.jsonl")
+
+# Where order_simulator.py reads its clocks, by clock_source
+ORDER_INPUTS = {
+    "clock_drift": {"data/clock_drift.cols": "clock"},
+    "clock_fleet": {"data/clock_fleet.cols": "fleet"},
+    "order_flow": {},
+}
+
+# Extra inputs of corrective_feedback.py, by estimator
+FEEDBACK_INPUTS = {
+    "blind": {"data/skew_estimates.csv": "skew"},
+}
+
+# Orders financial_model.py prices, by orders_path: as stamped, or blind-corrected (skew_estimator.py)
+LOSS_INPUTS = {
+    "data/normal_orders.csv": {"data/normal_orders.csv": "orders"},
+    "data/blind_orders.csv": {"data/blind_orders.csv": "skew"},
+}
+
+STAGES = {
+    "clock": {
+        "script": "clock_simulator.py",
+        "inputs": {},
+        "outputs": ["data/clock_drift.cols", "output/plots/drift_waveform.png"],
+    },
+    "faults": {
+        "script": "fault_injection.py",
+        "inputs": {"data/clock_drift.cols": "clock"},
+        "outputs": ["data/clock_drift_faulted.cols", "output/plots/fault_injection_plot.png"],
+    },
+    "feedback": {
+        "script": "corrective_feedback.py",
+        "inputs": lambda params: {"data/clock_drift_faulted.cols": "faults",
+                                  **FEEDBACK_INPUTS.get(params.get("estimator", "servo"), {})},
+        "outputs": ["data/clock_drift_corrected.cols", "data/clock_drift_servo_state.cols",
+                    "output/plots/corrected_feedback_plot.png"],
+    },
+    "ptp": {
+        "script": "ptp_sync_model.py",
+        "inputs": {"data/clock_drift.cols": "clock"},
+        "outputs": ["data/clock_drift_corrected.cols", "data/ptp_exchanges.cols", "output/plots/ptp_sync_plot.png"],
+    },
+    "stability": {
+        "script": "stability_analysis.py",
+        "inputs": {"data/clock_drift.cols": "clock", "data/clock_drift_faulted.cols": "faults",
+                   "data/clock_drift_corrected.cols": "feedback"},
+        "outputs": ["output/stability_metrics.csv", "output/plots/stability_plot.png"],
+    },
+    "fleet": {
+        "script": "fleet_simulator.py",
+        "inputs": {},
+        "outputs": ["data/clock_fleet.cols"],
+    },
+    "orders": {
+        "script": "order_simulator.py",
+        "inputs": lambda params: ORDER_INPUTS[params.get("clock_source", "clock_drift")],
+        "outputs": ["data/normal_orders.csv", "data/drifted_orders.csv"],
+    },
+    "anomalies": {
+        "script": "anomaly_detector.py",
+        "inputs": {"data/normal_orders.csv": "orders"},
+        "outputs": ["output/anomaly_log.csv", "output/violation_windows.csv", "output/drifted_orders.csv"],
+    },
+    "resequence": {
+        "script": "order_resequencer.py",
+        "inputs": {"data/drifted_orders.csv": "orders"},
+        "outputs": ["data/resequenced_orders.csv", "output/resequencer_sweep.csv", "output/resequencer_summary.csv",
+                    "output/plots/resequencer_tradeoff.png"],
+    },
+    "skew": {
+        "script": "skew_estimator.py",
+        "inputs": {"data/normal_orders.csv": "orders", "data/drifted_orders.csv": "orders"},
+        "outputs": ["data/skew_estimates.csv", "data/blind_orders.csv", "output/skew_summary.csv",
+                    "output/plots/skew_estimate.png"],
+    },
+    "loss": {
+        "script": "financial_model.py",
+        "inputs": lambda params: LOSS_INPUTS[params.get("orders_path", "data/normal_orders.csv")],
+        "outputs": ["data/ticks.cols", "output/loss_by_instrument.csv", "output/loss_by_bucket.csv",
+                    "output/loss_by_clock.csv", "output/plots/loss_graph.png"],
+    },
+    "signal": {
+        "script": "signal_model.py",
+        "inputs": {},
+        "outputs": ["data/signal_delay_profile.csv", "output/plots/signal_delay_profile.png"],
+    },
+    "vlsi": {
+        "script": "vlsi_drift_model.py",
+        "inputs": {},
+        "outputs": ["data/vlsi_clock_skew.csv", "data/vlsi_sink_delays.csv", "output/plots/vlsi_skew_plot.png"],
+    },
+}
+
+# Stages run when no targets are given (fleet only runs when orders need it)
+DEFAULT_TARGETS = ["feedback", "ptp", "stability", "anomalies", "resequence", "skew", "loss", "signal", "vlsi"]
+
+
+def stage_inputs(stage, params):
+    inputs = STAGES[stage]["inputs"]
+    return inputs(params) if callable(inputs) else inputs
+
+
+def stage_outputs(stage, plots=True):
+    # Declared outputs; plot images are not written (or required) with plots off
+    return [path for path in STAGES[stage]["outputs"] if plots or not path.endswith(".png")]
+
+
+def _sha256_file(path, digest=None):
+    digest = hashlib.sha256() if digest is None else digest
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest
+
+
+def content_hash(path):
+    # sha256 of a file, or of a directory's files (relative names and contents, sorted)
+    if os.path.isfile(path):
+        return _sha256_file(path).hexdigest()
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path, followlinks=True):
+        dirs.sort()
+        for name in sorted(files):
+            full = os.path.join(root, name)
+            digest.update(os.path.relpath(full, path).replace(os.sep, "/").encode() + b"\0")
+            _sha256_file(full, digest)
+    return digest.hexdigest()
+
+
+# Helper: the script plus every src module it imports, transitively
+def _code_files(script, seen=None):
+    seen = set() if seen is None else seen
+    seen.add(script)
+    with open(os.path.join(SRC_DIR, script), encoding="utf-8") as f:
+        source = f.read()
+    for module in re.findall(r"^\s*(?:from|import)\s+(\w+)", source, flags=re.MULTILINE):
+        name = module + ".py"
+        if name not in seen and os.path.exists(os.path.join(SRC_DIR, name)):
+            _code_files(name, seen)
+    return seen
+
+
+def code_hash(script):
+    digest = hashlib.sha256()
+    for name in sorted(_code_files(script)):
+        digest.update(name.encode() + b"\0")
+        _sha256_file(os.path.join(SRC_DIR, name), digest)
+    return digest.hexdigest()
+
+
+def stage_key(stage, params, input_hashes, plots=True):
+    parts = {
+        "stage": stage,
+        "code": code_hash(STAGES[stage]["script"]),
+        "params": params,
+        "inputs": input_hashes,
+    }
+    if not plots:
+        parts["plots"] = False  # only added when off, so keys of plotted runs are unchanged
+    payload = json.dumps(parts, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def artifact_dir(stage, key):
+    return os.path.join(ARTIFACTS_DIR, stage, key)
+
+
+def read_manifest(stage, key):
+    path = os.path.join(artifact_dir(stage, key), MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def latest_artifact(stage):
+    # Directory of the last successful run of a stage, or None
+    path = os.path.join(ARTIFACTS_DIR, stage, "latest")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return artifact_dir(stage, f.read().strip())
+
+
+# Helper: make an upstream output visible at the same path in a stage's workspace
+def _link_input(source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.symlink(source, target, target_is_directory=os.path.isdir(source))
+    except OSError:
+        # No symlink permission (e.g. Windows without developer mode)
+        if os.path.isdir(source):
+            shutil.copytree(source, target)
+        else:
+            shutil.copy2(source, target)
+
+
+def stage_name(stage):
+    # Name the stage script reports under (its file name without .py)
+    return os.path.splitext(STAGES[stage]["script"])[0]
+
+
+def execute_stage(stage, key, params, inputs, profile=False, plots=True):
+    # Runs one stage in a scratch workspace and publishes it as artifacts/<stage>/<key>
+    final = artifact_dir(stage, key)
+    work = final + ".tmp"
+    shutil.rmtree(work, ignore_errors=True)
+    os.makedirs(os.path.join(work, "data"))
+    os.makedirs(os.path.join(work, "output"))
+    for path, source in inputs.items():
+        _link_input(os.path.join(artifact_dir(source["stage"], source["key"]), path), os.path.join(work, path))
+
+    env = dict(os.environ, CLOCK_DRIFT_PROJECT_ROOT=work, MPLBACKEND="Agg")
+    env[PARAMS_ENV] = json.dumps(params)
+    env[REPORT_ENV] = os.path.join(work, "output", "run_report.jsonl")
+    env[PROFILE_ENV] = stage_name(stage) if profile else ""
+    env[PLOTS_ENV] = "1" if plots else "0"
+    started = time.time()
+    with open(os.path.join(work, "run.log"), "w") as log:
+        result = subprocess.run([sys.executable, os.path.join(SRC_DIR, STAGES[stage]["script"])],
+                                cwd=work, env=env, stdout=log, stderr=subprocess.STDOUT)
+    elapsed = time.time() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"Stage '{stage}' failed (exit {result.returncode}), see {os.path.join(work, 'run.log')}")
+    outputs = stage_outputs(stage, plots)
+    missing = [path for path in outputs if not os.path.exists(os.path.join(work, path))]
+    if missing:
+        raise RuntimeError(f"Stage '{stage}' did not write {missing}, see {os.path.join(work, 'run.log')}")
+
+    manifest = {
+        "stage": stage,
+        "key": key,
+        "script": STAGES[stage]["script"],
+        "params": params,
+        "inputs": inputs,
+        "outputs": {path: content_hash(os.path.join(work, path)) for path in outputs},
+        "elapsed_s": elapsed,
+        "finished": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "report": read_run_report(env[REPORT_ENV])[-1] if os.path.exists(env[REPORT_ENV]) else None,
+    }
+    with open(os.path.join(work, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(work, final)
+    return manifest
+
+
+# Helper: targets plus every stage they depend on, in dependency order
+def _plan(targets, params):
+    order = []
+
+    def visit(stage, path):
+        if stage not in STAGES:
+            raise KeyError(f"Unknown stage '{stage}' (expected one of {sorted(STAGES)})")
+        if stage in path:
+            raise ValueError(f"Stage dependency cycle: {' -> '.join(path + [stage])}")
+        if stage in order:
+            return
+        for upstream in stage_inputs(stage, params.get(stage, {})).values():
+            visit(upstream, path + [stage])
+        order.append(stage)
+    for target in targets:
+        visit(target, [])
+    return order
+
+
+def run_pipeline(targets=None, params=None, jobs=None, force=False, profile=(), plots=True, report=print):
+    # params: {stage: {name: value}}; profile: stages to run under the profiler;
+    # plots=False skips every stage's plots. Returns {stage: manifest} for the
+    # stages run or reused.
+    params = params or {}
+    unknown = sorted(set(params) - set(STAGES))
+    if unknown:
+        raise KeyError(f"Parameters given for unknown stage(s) {unknown}")
+    order = _plan(targets or DEFAULT_TARGETS, params)
+    deps = {stage: set(stage_inputs(stage, params.get(stage, {})).values()) for stage in order}
+    manifests = {}
+    failed = set()
+
+    def prepare(stage):
+        # Key from upstream manifests; returns the cached manifest if there is one
+        stage_params = params.get(stage, {})
+        inputs = {}
+        for path, upstream in stage_inputs(stage, stage_params).items():
+            producer = manifests[upstream]
+            inputs[path] = {"stage": upstream, "key": producer["key"], "sha256": producer["outputs"][path]}
+        key = stage_key(stage, stage_params, {path: source["sha256"] for path, source in inputs.items()}, plots)
+        return key, stage_params, inputs, (None if force else read_manifest(stage, key))
+
+    def finish(stage, manifest, cached):
+        manifests[stage] = manifest
+        with open(os.path.join(ARTIFACTS_DIR, stage, "latest"), "w") as f:
+            f.write(manifest["key"])
+        if cached:
+            report(f"[{stage}] up to date ({manifest['key']})")
+        else:
+            report(f"[{stage}] done in {manifest['elapsed_s']:.1f}s ({manifest['key']})")
+            if manifest["report"] is not None:
+                with open(RUN_REPORT, "a") as f:
+                    f.write(json.dumps({"pipeline_stage": stage, "key": manifest["key"], **manifest["report"]}) + "\n")
+
+    pending = list(order)
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+        while pending or running:
+            for stage in list(pending):
+                if deps[stage] & failed:
+                    pending.remove(stage)
+                    failed.add(stage)
+                    report(f"[{stage}] skipped: upstream failed")
+                elif deps[stage] <= set(manifests):
+                    pending.remove(stage)
+                    key, stage_params, inputs, cached = prepare(stage)
+                    if cached is not None:
+                        finish(stage, cached, cached=True)
+                    else:
+                        report(f"[{stage}] scheduled ({key})")
+                        future = pool.submit(execute_stage, stage, key, stage_params, inputs, stage in profile, plots)
+                        running[future] = stage
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    finish(stage, future.result(), cached=False)
+                except RuntimeError as exc:
+                    failed.add(stage)
+                    report(f"[{stage}] {exc}")
+    if failed:
+        raise RuntimeError(f"Pipeline failed: {sorted(failed)}")
+    return manifests
+
+
+def parse_overrides(assignments):
+    # ["stage.name=value", ...] -> {stage: {name: value}}; values are JSON, else strings
+    params = {}
+    for assignment in assignments:
+        target, sep, raw = assignment.partition("=")
+        stage, dot, name = target.partition(".")
+        if not sep or not dot:
+            raise ValueError(f"Expected stage.param=value, got '{assignment}'")
+        params.setdefault(stage, {})[name] = parse_value(raw)
+    return params
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the clock drift pipeline as a cached DAG of stages.")
+    parser.add_argument("targets", nargs="*", help=f"stages to bring up to date (default: {' '.join(DEFAULT_TARGETS)})")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="STAGE.PARAM=VALUE",
+                        help="override a stage script parameter (JSON value), repeatable")
+    parser.add_argument("--jobs", type=int, default=None, help="stages run in parallel (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="rerun the selected stages even if cached")
+    parser.add_argument("--profile", action="append", default=[], metavar="STAGE",
+                        help="profile a stage when it runs (cProfile, or pyinstrument via CLOCK_DRIFT_PROFILER)")
+    parser.add_argument("--no-plots", action="store_true", help="skip plots (matplotlib is never imported)")
+    args = parser.parse_args(argv)
+    try:
+        run_pipeline(args.targets, parse_overrides(args.overrides), jobs=args.jobs, force=args.force,
+                     profile=args.profile, plots=not args.no_plots)
+    except (KeyError, ValueError, RuntimeError) as exc:
+        print(exc)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+from sample_store import load_columns, save_table, table_exists
+
+# 💹 Indexed multi-instrument price replay and loss engine
+#
+# Tick data for all instruments lives in three flat columns (instrument,
+# time_sec, price) sorted by instrument, then time. The index is CSR-style:
+# instrument i owns rows starts[i]:starts[i + 1], so its ticks are one sorted
+# slice. Orders are priced in batches: they are grouped by instrument with one
+# stable argsort, then each group is time-sorted and does a single
+# np.searchsorted against its instrument's slice, for the true (FPGA_1) and
+# the drifted (FPGA_2) stamp.
+#
+#   method="previous"  last tick at or before the timestamp (as-of pricing)
+#   method="linear"    linear interpolation between the surrounding ticks
+#
+# Orders before an instrument's first tick take its first price. Losses are
+# value(drifted) - value(true), as in the original financial_model.py, and are
+# aggregated with bincount per instrument, per time bucket and per clock, so
+# no per-order table has to be joined or kept.
+
+
+def generate_ticks(num_instruments=1, duration_sec=1.0, ticks_per_sec=1000.0, start_price=100.0,
+                   volatility=0.1, seed=42, start_sec=0.0):
+    # Poisson tick times over [start_sec, start_sec + duration_sec] and a random
+    # walk (volatility per tick) per instrument
+    rng = np.random.RandomState(seed)
+    counts = rng.poisson(ticks_per_sec * duration_sec, num_instruments) + 1
+    instrument = np.repeat(np.arange(num_instruments, dtype=np.int32), counts)
+    time_sec = start_sec + rng.uniform(0, duration_sec, len(instrument))
+    time_sec[np.concatenate(([0], np.cumsum(counts)[:-1]))] = start_sec  # every instrument quotes from the start
+    order = np.lexsort((time_sec, instrument))
+    time_sec = time_sec[order]
+    steps = rng.normal(loc=0, scale=volatility, size=len(instrument))
+    walk = np.cumsum(steps)
+    starts = np.concatenate(([0], np.cumsum(counts)))
+    # Restart the walk at start_price for each instrument
+    price = start_price + walk - np.repeat(walk[starts[:-1]] - steps[starts[:-1]], counts)
+    return {"instrument": instrument, "time_sec": time_sec, "price": price}
+
+
+def build_tick_index(instrument, time_sec, price):
+    instrument = np.asarray(instrument)
+    time_sec = np.asarray(time_sec, dtype=np.float64)
+    order = np.lexsort((time_sec, instrument))
+    if np.any(order != np.arange(len(order))):
+        instrument, time_sec, price = instrument[order], time_sec[order], np.asarray(price)[order]
+    num_instruments = int(instrument.max()) + 1 if len(instrument) else 0
+    starts = np.searchsorted(instrument, np.arange(num_instruments + 1))
+    if np.any(np.diff(starts) == 0):
+        raise ValueError("Every instrument needs at least one tick")
+    return {"starts": starts, "time_sec": time_sec, "price": np.asarray(price, dtype=np.float64)}
+
+
+def save_ticks(name, ticks, attrs=None):
+    return save_table(name, ticks, attrs=attrs)
+
+
+def load_tick_index(name):
+    ticks = load_columns(name, ["instrument", "time_sec", "price"])
+    return build_tick_index(ticks["instrument"], ticks["time_sec"], ticks["price"])
+
+
+def ticks_available(name):
+    return table_exists(name)
+
+
+def price_at(index, instrument, *timestamps, method="previous"):
+    # Batched lookup of the price of each (instrument, timestamp) pair; pass
+    # several timestamp arrays to price them all with a single grouping pass.
+    # Returns one price array per timestamp array.
+    instrument = np.asarray(instrument)
+    timestamps = [np.asarray(ts, dtype=np.float64) for ts in timestamps]
+    out = [np.empty(len(instrument)) for _ in timestamps]
+    # Small ids group with a radix sort (numpy's stable sort on 16-bit ints)
+    small = len(instrument) and 0 <= instrument.min() and instrument.max() < 1 << 15
+    order = np.argsort(instrument.astype(np.int16) if small else instrument, kind="stable")
+    ids, first = np.unique(instrument[order], return_index=True)
+    bounds = np.append(first, len(order))
+    starts = index["starts"]
+    if len(ids) and (ids[0] < 0 or ids[-1] >= len(starts) - 1):
+        raise KeyError(f"Instrument ids must be in [0, {len(starts) - 2}]")
+    for k, inst in enumerate(ids):
+        rows = order[bounds[k]:bounds[k + 1]]
+        lo, hi = starts[inst], starts[inst + 1]
+        times, prices = index["time_sec"][lo:hi], index["price"][lo:hi]
+        for ts, prices_out in zip(timestamps, out):
+            t = ts[rows]
+            # Sorted needles keep searchsorted cache-friendly on long tick slices
+            by_time = np.argsort(t, kind="stable")
+            pos = np.empty(len(t), dtype=np.int64)
+            pos[by_time] = np.searchsorted(times, t[by_time], side="right") - 1
+            np.clip(pos, 0, len(times) - 1, out=pos)
+            if method == "previous":
+                prices_out[rows] = prices[pos]
+            elif method == "linear":
+                nxt = np.minimum(pos + 1, len(times) - 1)
+                span = times[nxt] - times[pos]
+                weight = np.clip((t - times[pos]) / np.where(span > 0, span, 1), 0, 1)
+                prices_out[rows] = prices[pos] + weight * (prices[nxt] - prices[pos])
+            else:
+                raise ValueError(f"Unknown method '{method}' (expected 'previous' or 'linear')")
+    return out
+
+
+def new_loss_totals(bucket_sec=0.1):
+    return {
+        "bucket_sec": bucket_sec,
+        "orders": 0,
+        "total_loss": 0.0,
+        "by_instrument": np.zeros(0),
+        "by_bucket": np.zeros(0),
+        "by_clock": np.zeros(0),
+        "orders_by_instrument": np.zeros(0, dtype=np.int64),
+        "orders_by_bucket": np.zeros(0, dtype=np.int64),
+        "orders_by_clock": np.zeros(0, dtype=np.int64),
+    }
+
+
+# Helper: add bincount(keys, weights) into a running total that grows as needed
+def _accumulate(totals, key, keys, weights=None):
+    counts = np.bincount(keys, weights=weights)
+    if len(counts) > len(totals[key]):
+        totals[key] = np.concatenate((totals[key], np.zeros(len(counts) - len(totals[key]), totals[key].dtype)))
+    totals[key][:len(counts)] += counts
+
+
+def price_orders(index, totals, orders, method="previous", quantity=None):
+    # orders: dict/DataFrame with instrument, fpga_1_ts, fpga_2_ts and optionally clock_id
+    instrument = np.asarray(orders["instrument"])
+    value_normal, value_drifted = price_at(index, instrument, orders["fpga_1_ts"], orders["fpga_2_ts"], method=method)
+    if quantity is not None:
+        value_normal *= quantity
+        value_drifted *= quantity
+    loss = value_drifted - value_normal
+
+    bucket = (np.asarray(orders["fpga_1_ts"]) // totals["bucket_sec"]).astype(np.int64)
+    np.maximum(bucket, 0, out=bucket)
+    clock = np.asarray(orders["clock_id"]) if "clock_id" in orders else np.zeros(len(loss), dtype=np.int64)
+    for name, keys in (("instrument", instrument), ("bucket", bucket), ("clock", clock)):
+        _accumulate(totals, "by_" + name, keys, loss)
+        _accumulate(totals, "orders_by_" + name, keys)
+    totals["orders"] += len(loss)
+    totals["total_loss"] += float(loss.sum())
+    return value_normal, value_drifted, loss
+
+
+def loss_tables(totals):
+    def table(key, label, scale=None):
+        keys = np.arange(len(totals["by_" + key]))
+        keep = totals["orders_by_" + key] > 0
+        frame = pd.DataFrame({
+            label: keys[keep] * scale if scale else keys[keep],
+            "orders": totals["orders_by_" + key][keep],
+            "total_loss": totals["by_" + key][keep],
+        })
+        frame["mean_loss"] = frame["total_loss"] / frame["orders"]
+        return frame
+    return {
+        "instrument": table("instrument", "instrument"),
+        "bucket": table("bucket", "bucket_start_s", totals["bucket_sec"]),
+        "clock": table("clock", "clock_id"),
+    }
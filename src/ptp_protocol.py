@@ -0,0 +1,140 @@
+import heapq
+import numpy as np
+import pandas as pd
+from clock_servo import pid_step
+
+# 🌐 Event-driven PTP (IEEE 1588, two-step) simulator
+#
+# Every sync_interval the master sends Sync (departure t1) and Follow_Up
+# (carrying t1) to each slave. The slave stamps Sync arrival as t2, sends a
+# Delay_Req stamped t3, and the master answers with a Delay_Resp carrying the
+# Delay_Req arrival time t4. On Delay_Resp the slave computes
+#
+#   offset          = ((t2 - t1) - (t4 - t3)) / 2
+#   mean_path_delay = ((t2 - t1) + (t4 - t3)) / 2
+#
+# and feeds the offset to its servo. Path delays are base + asymmetry/2 +
+# Gaussian jitter (master->slave) and base - asymmetry/2 + jitter (back), so
+# asymmetry shows up as a constant offset error, exactly as on a real network.
+#
+# All message times are driven by a heap of timestamped events, merged across
+# slaves. Only the slave readings t2/t3 depend on the servo, and only through
+# the correction currently applied, so the delays and free-running offsets are
+# drawn/interpolated up front as arrays. Corrections are then expanded onto the
+# sample grid as one piecewise-constant step array per slave.
+
+SYNC, SYNC_ARRIVAL, FOLLOW_UP, DELAY_REQ, DELAY_RESP = 0, 1, 2, 3, 4
+
+
+# Helper: broadcast a scalar or per-slave parameter to one value per slave
+def _per_slave(value, num_slaves):
+    return np.broadcast_to(np.asarray(value, dtype=np.float64), (num_slaves,))
+
+
+def simulate_ptp(time_sec, slave_offsets, sync_interval_s=5e-3, path_delay_s=1e-6, asymmetry_s=0.0,
+                 jitter_s=0.0, delay_req_gap_s=50e-6, follow_up_gap_s=1e-6,
+                 kp=0.0, ki=100.0, kd=0.0, integral_limit=np.inf, output_limit=np.inf, seed=42):
+    time_sec = np.asarray(time_sec, dtype=np.float64)
+    slave_offsets = np.asarray(slave_offsets, dtype=np.float64)
+    if slave_offsets.ndim == 1:
+        slave_offsets = slave_offsets[:, None]
+    num_slaves = slave_offsets.shape[1]
+    rng = np.random.RandomState(seed)
+
+    path_delay = _per_slave(path_delay_s, num_slaves)
+    asymmetry = _per_slave(asymmetry_s, num_slaves)
+    jitter = _per_slave(jitter_s, num_slaves)
+
+    # 📨 Message timing (true time) for every exchange and slave
+    t1 = np.arange(time_sec[0], time_sec[-1], sync_interval_s)
+    num_exchanges = len(t1)
+    shape = (num_exchanges, num_slaves)
+    ms_delay = path_delay + asymmetry / 2 + jitter * rng.standard_normal(shape)
+    sm_delay = path_delay - asymmetry / 2 + jitter * rng.standard_normal(shape)
+    resp_delay = path_delay + asymmetry / 2 + jitter * rng.standard_normal(shape)
+    sync_arrival = t1[:, None] + ms_delay
+    follow_up_arrival = sync_arrival + follow_up_gap_s
+    req_departure = follow_up_arrival + delay_req_gap_s
+    t4 = req_departure + sm_delay
+    resp_arrival = t4 + resp_delay
+
+    # Free-running slave offsets at the moments the slave reads its clock
+    sync_offset = np.empty(shape)
+    req_offset = np.empty(shape)
+    for j in range(num_slaves):
+        sync_offset[:, j] = np.interp(sync_arrival[:, j], time_sec, slave_offsets[:, j])
+        req_offset[:, j] = np.interp(req_departure[:, j], time_sec, slave_offsets[:, j])
+
+    t2 = np.empty(shape)
+    t3 = np.empty(shape)
+    offset_est = np.empty(shape)
+    corrections = np.empty(shape)
+
+    # ⏱️ Event queue: (true_time, seq, message, slave, exchange)
+    queue = []
+    seq = 0
+    for j in range(num_slaves):
+        if num_exchanges:
+            queue.append((t1[0], seq, SYNC, j, 0))
+            seq += 1
+    heapq.heapify(queue)
+
+    applied = [0.0] * num_slaves
+    e_prev = [0.0] * num_slaves
+    i_prev = [0.0] * num_slaves
+    dt = sync_interval_s
+    events_processed = 0
+
+    while queue:
+        _, _, message, j, k = heapq.heappop(queue)
+        events_processed += 1
+        if message == SYNC:
+            # Sync departs the master at t1
+            heapq.heappush(queue, (sync_arrival[k, j], seq, SYNC_ARRIVAL, j, k))
+            seq += 1
+            if k + 1 < num_exchanges:
+                heapq.heappush(queue, (t1[k + 1], seq, SYNC, j, k + 1))
+                seq += 1
+        elif message == SYNC_ARRIVAL:
+            # The slave stamps Sync arrival with its (corrected) clock as t2
+            t2[k, j] = sync_arrival[k, j] + sync_offset[k, j] + applied[j]
+            heapq.heappush(queue, (follow_up_arrival[k, j], seq, FOLLOW_UP, j, k))
+            seq += 1
+        elif message == FOLLOW_UP:
+            # Follow_Up delivers t1; the slave then issues Delay_Req
+            heapq.heappush(queue, (req_departure[k, j], seq, DELAY_REQ, j, k))
+            seq += 1
+        elif message == DELAY_REQ:
+            t3[k, j] = req_departure[k, j] + req_offset[k, j] + applied[j]
+            heapq.heappush(queue, (resp_arrival[k, j], seq, DELAY_RESP, j, k))
+            seq += 1
+        else:
+            # Delay_Resp delivers t4: estimate offset and step the servo
+            ek = ((t2[k, j] - t1[k]) - (t4[k, j] - t3[k, j])) / 2
+            ik, uk, _ = pid_step(ek, e_prev[j], i_prev[j], kp, ki, kd, dt, integral_limit, output_limit)
+            offset_est[k, j] = ek
+            applied[j] = corrections[k, j] = uk
+            e_prev[j], i_prev[j] = ek, ik
+
+    # 🪜 Piecewise-constant corrections on the sample grid, one pass per slave
+    corrected_offsets = np.empty_like(slave_offsets)
+    for j in range(num_slaves):
+        order = np.argsort(resp_arrival[:, j], kind="stable")
+        starts = np.searchsorted(time_sec, resp_arrival[order, j])
+        counts = np.diff(np.concatenate(([0], starts, [len(time_sec)])))
+        steps = np.repeat(np.concatenate(([0.0], corrections[order, j])), counts)
+        corrected_offsets[:, j] = slave_offsets[:, j] + steps
+
+    exchanges = pd.DataFrame({
+        "slave": np.tile(np.arange(num_slaves), num_exchanges),
+        "exchange": np.repeat(np.arange(num_exchanges), num_slaves),
+        "t1": np.repeat(t1, num_slaves),
+        "t2": t2.ravel(),
+        "t3": t3.ravel(),
+        "t4": t4.ravel(),
+        "resp_arrival": resp_arrival.ravel(),
+        "offset_estimate": offset_est.ravel(),
+        "mean_path_delay": (((t2 - t1[:, None]) + (t4 - t3)) / 2).ravel(),
+        "correction": corrections.ravel(),
+    })
+    return corrected_offsets, exchanges, events_processed
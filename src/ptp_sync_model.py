@@ -1,54 +1,97 @@
 import os
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import os
+from sample_store import load_table, save_table
+from ptp_protocol import simulate_ptp
+from clock_kalman import new_kalman_state, predict_offsets, run_kalman
+from stage_params import run_stage
+from instrumentation import add_rows, set_phase
 
-# 🔍 Set working directory to project root if not already
-project_root = "D:/clock-drift-fpga-project"
-if os.getcwd() != project_root:
-    os.chdir(project_root)
+# PTP synchronization config
+sample_rate_hz = 1e6        # Sampling rate of the drift series
+sync_interval = 5000        # every 5ms (in samples)
+correction_strength = 0.5   # fraction of the measured offset removed per sync
+path_delay_s = 1e-6         # mean one-way network delay
+asymmetry_s = 0.0           # master->slave minus slave->master delay
+jitter_s = 0.0              # std-dev of per-message delay jitter
+estimator = "servo"         # "servo" (step by correction_strength each sync) or "kalman"
+measurement_std_s = 1e-9    # Kalman: offset measurement noise (raise with jitter_s)
+gate_sigma = 5.0            # Kalman: outlier gate on the normalized innovation
 
-# Ensure required folders
-os.makedirs("data", exist_ok=True)
-os.makedirs("output/plots", exist_ok=True)
 
-# Load drift data
-df = pd.read_csv("data/clock_drift.csv")
+def main(plots=True):
+    # Ensure required folders
+    os.makedirs("data", exist_ok=True)
+    os.makedirs("output/plots", exist_ok=True)
 
-# Add sample index if not present
-if "sample" not in df.columns:
-    df.insert(0, "sample", range(len(df)))
+    # Load drift data
+    df = load_table("data/clock_drift", columns=["sample", "fpga_1_time", "fpga_2_time"], mmap=False)
 
-# PTP synchronization config
-sync_interval = 5000  # every 5ms
-correction_strength = 0.5  # partial correction
-
-# Apply PTP correction
-corrected_fpga_2 = df["fpga_2_time"].copy()
-for i in range(0, len(df), sync_interval):
-    drift = df.loc[i, "fpga_2_time"] - df.loc[i, "fpga_1_time"]
-    correction = -correction_strength * drift
-    corrected_fpga_2.loc[i:] = corrected_fpga_2.loc[i:] + correction  # safer than chained assign
-
-# Save corrected clock
-df["fpga_2_corrected"] = corrected_fpga_2
-df.to_csv("data/clock_drift_corrected.csv", index=False, float_format="%.10f")
-print("PTP sync simulation completed.")
-print("Corrected clock data saved to: data/clock_drift_corrected.csv")
-
-# Plot comparison
-plt.figure(figsize=(10, 5))
-plt.plot(df["sample"], df["fpga_1_time"], label="FPGA_1 (Reference)", linestyle="--", alpha=0.7)
-plt.plot(df["sample"], df["fpga_2_time"], label="FPGA_2 (Original Drift)", alpha=0.6)
-plt.plot(df["sample"], df["fpga_2_corrected"], label="FPGA_2 (After PTP Sync)", color='green')
-plt.title("PTP Clock Synchronization Simulation")
-plt.xlabel("Sample Index")
-plt.ylabel("Timestamp (s)")  # Fixed
-plt.legend()
-plt.grid(True)
-plt.tight_layout()
-plt.savefig("output/plots/ptp_sync_plot.png")
-plt.close()
-
-print("Sync visualization saved to: output/plots/ptp_sync_plot.png")
+    # Add sample index if not present
+    if "sample" not in df.columns:
+        df.insert(0, "sample", range(len(df)))
+
+    # Servo: stepping the clock by correction_strength * offset each sync is an
+    # integral controller with ki * sync_interval = correction_strength
+    sync_interval_s = sync_interval / sample_rate_hz
+    servo = {"kp": 0.0, "ki": correction_strength / sync_interval_s, "kd": 0.0}
+    if estimator == "kalman":
+        servo = {"kp": 0.0, "ki": 0.0, "kd": 0.0}  # free-running slave; corrections come from the estimator
+    elif estimator != "servo":
+        raise ValueError(f"Unknown estimator '{estimator}' (expected 'servo' or 'kalman')")
+
+    # Apply PTP correction via the two-way message exchange
+    time_sec = df["sample"].to_numpy() / sample_rate_hz
+    slave_offsets = (df["fpga_2_time"] - df["fpga_1_time"]).to_numpy()
+    corrected_offsets, exchanges, events_processed = simulate_ptp(
+        time_sec, slave_offsets, sync_interval_s=sync_interval_s, path_delay_s=path_delay_s,
+        asymmetry_s=asymmetry_s, jitter_s=jitter_s, **servo,
+    )
+    if estimator == "kalman":
+        # Each exchange measures the offset around Sync arrival (t1 + path delay) and
+        # is usable from Delay_Resp arrival on; between exchanges the predicted
+        # offset (frequency and drift included) is removed sample by sample
+        num_slaves = corrected_offsets.shape[1]
+        measured = exchanges["offset_estimate"].to_numpy().reshape(-1, num_slaves)
+        measured_at = exchanges["t1"].to_numpy().reshape(-1, num_slaves) + path_delay_s
+        available = exchanges["resp_arrival"].to_numpy().reshape(-1, num_slaves)
+        kalman = new_kalman_state(num_slaves, measurement_std_s=measurement_std_s, gate_sigma=gate_sigma)
+        posterior = run_kalman(kalman, measured_at, measured)
+        for j in range(num_slaves):
+            order = np.argsort(available[:, j], kind="stable")
+            corrected_offsets[:, j] -= predict_offsets(posterior["t"][order, j], posterior["x"][order, j], time_sec,
+                                                       available=available[order, j])
+        exchanges["correction"] = -posterior["x"][:, :, 0].ravel()
+        print(f"Kalman estimator: {kalman['updates']} updates, {kalman['rejected']} rejected as outliers")
+    corrected_fpga_2 = df["fpga_1_time"].to_numpy() + corrected_offsets[:, 0]
+    add_rows(len(df))
+    print(f"PTP message exchanges: {len(exchanges)} ({events_processed} events)")
+
+    # Save corrected clock
+    df["fpga_2_corrected"] = corrected_fpga_2
+    save_table("data/clock_drift_corrected", df)
+    save_table("data/ptp_exchanges", exchanges)
+    print("PTP sync simulation completed.")
+    print("Corrected clock data saved to: data/clock_drift_corrected.cols")
+    if not plots:
+        return
+
+    import matplotlib.pyplot as plt
+    set_phase("plot")
+    # Plot comparison
+    plt.figure(figsize=(10, 5))
+    plt.plot(df["sample"], df["fpga_1_time"], label="FPGA_1 (Reference)", linestyle="--", alpha=0.7)
+    plt.plot(df["sample"], df["fpga_2_time"], label="FPGA_2 (Original Drift)", alpha=0.6)
+    plt.plot(df["sample"], df["fpga_2_corrected"], label="FPGA_2 (After PTP Sync)", color='green')
+    plt.title("PTP Clock Synchronization Simulation")
+    plt.xlabel("Sample Index")
+    plt.ylabel("Timestamp (s)")  # Fixed
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.savefig("output/plots/ptp_sync_plot.png")
+    plt.close()
+    print("Sync visualization saved to: output/plots/ptp_sync_plot.png")
+
+
+if __name__ == "__main__":
+    run_stage(globals())
@@ -0,0 +1,205 @@
+import heapq
+import numpy as np
+from order_analytics import inversion_count
+
+# 🧮 Hold-window order re-sequencer
+#
+# Orders reach the exchange in arrival order (the drifted sequence) and each
+# carries a sequencing key, the timestamp it should be ranked by (fpga_1_ts by
+# default). The re-sequencer buffers orders in a min-heap on the key and
+# keeps a watermark that trails the arrival clock by the hold window:
+#
+#   watermark(t) = max over time so far of (t - hold)
+#
+# and releases, in key order, every buffered order whose key is at or below
+# the watermark. An order whose key is already below the watermark when it
+# arrives (it was delayed by more than the hold) is released at once, behind
+# orders it should have preceded: the violations that remain.
+#
+# The hold is either fixed (hold_s) or adaptive: hold_s plus an estimate of the
+# clock offset (arrival - key), taken as the largest offset seen in the
+# previous full block of offset_window orders and the current one. With the
+# offset tracked, the added latency stays near hold_s however far the stamping
+# clock has drifted.
+#
+# Two implementations give identical release sequences:
+#
+#   resequence_chunk / flush_resequencer (resequence_stream for whole arrays)
+#                     streaming, one heap push and pop per order, O(log w)
+#                     for w buffered orders, state carried across chunks
+#   resequence        batch, vectorized: the watermark is a cumulative max,
+#                     each order's release interval is one searchsorted, and
+#                     the release sequence is a lexsort on (interval, key)
+#
+# Time only advances with arrivals (a time earlier than the previous arrival
+# counts as that arrival), and the hold in force between two arrivals is the
+# one set by the earlier. Orders still buffered at the end are released when
+# the watermark would pass them (key + last hold).
+
+
+def new_resequencer_state(hold_s=1e-6, adaptive=False, offset_window=1000):
+    return {
+        "hold_s": hold_s,
+        "adaptive": adaptive,
+        "offset_window": offset_window,
+        "heap": [],                 # (key, arrival position)
+        "clock": -np.inf,           # last arrival time
+        "watermark": -np.inf,
+        "hold": hold_s,             # hold in force since the last arrival
+        "block_max": -np.inf,       # adaptive: largest offset of the previous full block ...
+        "run_max": -np.inf,         # ... and of the current one
+        "block_fill": 0,
+        "seen": 0,
+        "max_buffered": 0,
+    }
+
+
+def resequence_chunk(state, keys, arrivals):
+    # Feed the next chunk of arriving orders; returns (position, release time)
+    # arrays of the orders released meanwhile, in release order. Positions
+    # count arrivals from the start of the stream.
+    keys = np.asarray(keys, dtype=np.float64).tolist()
+    arrivals = np.asarray(arrivals, dtype=np.float64).tolist()
+    heap, push, pop = state["heap"], heapq.heappush, heapq.heappop
+    clock, watermark, hold = state["clock"], state["watermark"], state["hold"]
+    hold_s, adaptive, window = state["hold_s"], state["adaptive"], state["offset_window"]
+    block_max, run_max, fill = state["block_max"], state["run_max"], state["block_fill"]
+    depth = state["max_buffered"]
+    released, times = [], []
+    for pos, (key, arrival) in enumerate(zip(keys, arrivals), start=state["seen"]):
+        clock = max(clock, arrival)
+        # Watermark at this arrival under the previous hold
+        if pos and clock - hold > watermark:
+            watermark = clock - hold
+            while heap and heap[0][0] <= watermark:
+                k, p = pop(heap)
+                released.append(p)
+                times.append(k + hold)
+        if adaptive:
+            if fill == window:
+                block_max, run_max, fill = run_max, -np.inf, 0
+            run_max = max(run_max, clock - key)
+            fill += 1
+            hold = hold_s + max(block_max, run_max)
+        push(heap, (key, pos))
+        watermark = max(watermark, clock - hold)
+        while heap and heap[0][0] <= watermark:
+            released.append(pop(heap)[1])
+            times.append(clock)
+        depth = max(depth, len(heap))
+    state.update(clock=clock, watermark=watermark, hold=hold, block_max=block_max, run_max=run_max,
+                 block_fill=fill, max_buffered=depth)
+    state["seen"] += len(keys)
+    return np.array(released, dtype=np.int64), np.array(times, dtype=np.float64)
+
+
+def flush_resequencer(state):
+    # Release everything still buffered at the end of the stream
+    heap = state["heap"]
+    released, times = [], []
+    while heap:
+        k, p = heapq.heappop(heap)
+        released.append(p)
+        times.append(k + state["hold"])
+    return np.array(released, dtype=np.int64), np.array(times, dtype=np.float64)
+
+
+def resequence_stream(keys, arrivals, hold_s=1e-6, adaptive=False, offset_window=1000, chunk_size=1 << 20):
+    # The streaming engine over whole arrays, returning what resequence()
+    # does (buffered holds only the peak depth)
+    keys = np.asarray(keys, dtype=np.float64)
+    arrivals = np.asarray(arrivals, dtype=np.float64)
+    state = new_resequencer_state(hold_s, adaptive, offset_window)
+    parts = [resequence_chunk(state, keys[start:start + chunk_size], arrivals[start:start + chunk_size])
+             for start in range(0, len(keys), chunk_size)]
+    parts.append(flush_resequencer(state))
+    order = np.concatenate([positions for positions, _ in parts])
+    release = np.empty(len(keys))
+    release[order] = np.concatenate([times for _, times in parts])
+    hold = order_holds(keys, np.maximum.accumulate(arrivals), hold_s, adaptive, offset_window)
+    return {"order": order, "release_s": release, "hold_s": hold, "buffered": np.array([state["max_buffered"]])}
+
+
+def order_holds(keys, arrivals, hold_s=1e-6, adaptive=False, offset_window=1000):
+    # Hold set at each arrival (arrivals already made non-decreasing)
+    n = len(keys)
+    if not adaptive:
+        return np.full(n, float(hold_s))
+    offset = arrivals - keys
+    pad = -n % offset_window
+    blocks = np.concatenate((offset, np.full(pad, -np.inf))).reshape(-1, offset_window)
+    run_max = np.maximum.accumulate(blocks, axis=1).ravel()[:n]
+    prev_max = np.concatenate(([-np.inf], blocks.max(axis=1)[:-1]))
+    return hold_s + np.maximum(prev_max[np.arange(n) // offset_window], run_max)
+
+
+def resequence(keys, arrivals, hold_s=1e-6, adaptive=False, offset_window=1000):
+    # Batch re-sequencing of a whole stream. Returns the release sequence
+    # (arrival positions), and per arrival position the release time and hold.
+    keys = np.asarray(keys, dtype=np.float64)
+    arrivals = np.maximum.accumulate(np.asarray(arrivals, dtype=np.float64))
+    n = len(keys)
+    if not n:
+        return {"order": np.empty(0, dtype=np.int64), "release_s": np.empty(0), "hold_s": np.empty(0),
+                "buffered": np.empty(0, dtype=np.int64)}
+    hold = order_holds(keys, arrivals, hold_s, adaptive, offset_window)
+
+    # Watermark at each arrival (start) and just before the next one (end):
+    # a cumulative max over start_0, end_0, start_1, end_1, ...
+    marks = np.empty(2 * n - 1)
+    marks[0::2] = arrivals - hold
+    marks[1::2] = arrivals[1:] - hold[:-1]
+    np.maximum.accumulate(marks, out=marks)
+    start = marks[0::2]
+    end = np.append(marks[1::2], np.inf)
+
+    # Each order leaves in the first interval (from its own arrival on) whose
+    # watermark reaches its key: at once if the watermark jumped past it at an
+    # arrival, otherwise when the trailing watermark catches up
+    interval = np.maximum(np.arange(n), np.searchsorted(end, keys, side="left"))
+    at_arrival = start[interval] >= keys
+    release = np.where(at_arrival, arrivals[interval], keys + hold[interval])
+    # Release sequence: by interval, those released at its arrival first, then by key
+    order = np.lexsort((np.arange(n), keys, ~at_arrival, interval))
+    # Orders held just after each arrival's releases
+    released = np.cumsum(np.bincount(interval, minlength=n)) - np.bincount(interval[~at_arrival], minlength=n)
+    return {"order": order, "release_s": release, "hold_s": hold, "buffered": np.arange(1, n + 1) - released}
+
+
+def resequence_summary(order_ids, arrivals, result, inversions=False):
+    # Violations before / after (descents, the rule of anomaly_detector.py)
+    # against the latency added per order; inversion counts on request (they
+    # cost a few seconds per 1e7 orders)
+    order_ids = np.asarray(order_ids)
+    arrivals = np.maximum.accumulate(np.asarray(arrivals, dtype=np.float64))
+    released_ids = order_ids[result["order"]]
+    added = result["release_s"] - arrivals
+    n = len(order_ids)
+    before = int(np.count_nonzero(order_ids[1:] < order_ids[:-1]))
+    after = int(np.count_nonzero(released_ids[1:] < released_ids[:-1]))
+    p50, p99 = np.percentile(added, [50, 99]) if n else (0.0, 0.0)
+    summary = {
+        "orders": n,
+        "violations_before": before,
+        "violations_after": after,
+        "violations_removed": before - after,
+        "violation_rate": after / n if n else 0.0,
+        "mean_added_latency_s": float(added.mean()) if n else 0.0,
+        "p50_added_latency_s": float(p50),
+        "p99_added_latency_s": float(p99),
+        "max_added_latency_s": float(added.max()) if n else 0.0,
+        "mean_hold_s": float(result["hold_s"].mean()) if n else 0.0,
+        "max_buffered": int(result["buffered"].max()) if n else 0,
+    }
+    if inversions:
+        summary["inversions_before"] = inversion_count(order_ids)
+        summary["inversions_after"] = inversion_count(released_ids)
+    return summary
+
+
+def smallest_hold(summaries, max_violation_rate):
+    # First summary (in the given, increasing-hold order) meeting the fairness target, or None
+    for summary in summaries:
+        if summary["violation_rate"] <= max_violation_rate:
+            return summary
+    return None
@@ -0,0 +1,91 @@
+import os
+import csv
+import pandas as pd
+from risk_engine import DEFAULT_LEVELS, aggregator_summary, histogram_table, run_risk
+from stage_params import run_stage
+from instrumentation import section, set_phase
+
+# Monte Carlo Parameters: every scenario is a full pipeline run with its own
+# drift rate, fault realization and price path (see risk_engine.py; settings
+# not listed here come from param_sweep.DEFAULT_POINT)
+num_scenarios = 1000
+scenario = {
+    "duration_sec": 0.1,
+    "drift_per_sec": 10e-6,      # Mean drift rate ...
+    "drift_std": 5e-6,           # ... and its spread across scenarios
+    "fault_chance": 0.05,
+    "correction": "servo",
+    "order_interval": 100,
+}
+levels = DEFAULT_LEVELS          # VaR / ES confidence levels
+base_seed = 42                   # Scenario seeds are spawned from this (np.random.SeedSequence)
+max_workers = None               # None = one worker per CPU core
+report_every = 100               # Convergence checkpoint every N scenarios
+scenarios_path = "output/risk/scenario_losses.csv"      # One summary row per scenario (streamed)
+convergence_path = "output/risk/risk_convergence.csv"
+summary_path = "output/risk/risk_summary.csv"
+histogram_path = "output/risk/loss_histogram.csv"
+
+
+def main(plots=True):
+    os.makedirs("output/risk", exist_ok=True)
+    os.makedirs("output/plots", exist_ok=True)
+
+    checkpoints = []
+    with open(scenarios_path, "w", newline="") as out:
+        writer = None
+
+        def write_row(row):
+            nonlocal writer
+            with section("csv_io"):
+                if writer is None:
+                    writer = csv.DictWriter(out, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+
+        agg = run_risk(num_scenarios, base_seed=base_seed, scenario=scenario, max_workers=max_workers,
+                       report_every=report_every, levels=levels, on_result=write_row, on_checkpoint=checkpoints.append)
+
+    convergence = pd.DataFrame(checkpoints)
+    histogram = pd.DataFrame(histogram_table(agg))
+    with section("csv_io"):
+        pd.DataFrame([aggregator_summary(agg, levels)]).to_csv(summary_path, index=False)
+        convergence.to_csv(convergence_path, index=False)
+        histogram.to_csv(histogram_path, index=False)
+    print(f"Scenario losses saved to: {scenarios_path}")
+    print(f"Risk summary saved to: {summary_path}")
+    print(f"Convergence trace saved to: {convergence_path}")
+    print(f"Loss histogram saved to: {histogram_path}")
+    if not plots:
+        return
+
+    import matplotlib.pyplot as plt
+    set_phase("plot")
+    # Loss distribution with VaR markers, and VaR / ES convergence
+    fig, (ax_hist, ax_conv) = plt.subplots(1, 2, figsize=(14, 5))
+    centers = (histogram["bin_low"] + histogram["bin_high"]) / 2
+    ax_hist.bar(centers, histogram["count"], width=histogram["bin_high"] - histogram["bin_low"], color="steelblue")
+    for level in levels:
+        tag = f"{level * 100:g}"
+        ax_hist.axvline(convergence[f"var_{tag}"].iloc[-1], linestyle="--", label=f"VaR {tag}%")
+        ax_conv.plot(convergence["scenarios"], convergence[f"var_{tag}"], marker="o", markersize=3, label=f"VaR {tag}%")
+        ax_conv.plot(convergence["scenarios"], convergence[f"es_{tag}"], marker="o", markersize=3, linestyle=":",
+                     label=f"ES {tag}%")
+    ax_hist.set_title("Total Loss per Scenario")
+    ax_hist.set_xlabel("Loss (₹ or $)")
+    ax_hist.set_ylabel("Scenarios")
+    ax_hist.legend()
+    ax_conv.set_title("Tail Risk Convergence")
+    ax_conv.set_xlabel("Scenarios")
+    ax_conv.set_ylabel("Loss (₹ or $)")
+    ax_conv.grid(True)
+    ax_conv.legend()
+    plt.tight_layout()
+    plt.savefig("output/plots/risk_distribution.png")
+    plt.close()
+    print("Risk plot saved to: output/plots/risk_distribution.png")
+
+
+if __name__ == "__main__":
+    # The guard keeps worker processes (spawned on Windows) from rerunning the simulation
+    run_stage(globals())
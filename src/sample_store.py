@@ -0,0 +1,275 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from instrumentation import add_store_bytes, section, timed_iter
+from timebase import SECONDS_COLUMNS, TICK_COLUMNS, derive_seconds, is_tick_table
+
+# 📦 Columnar sample store shared by every stage
+#
+# A table such as "data/clock_drift" is kept as a folder of one .npy file per
+# column plus a small meta.json sidecar:
+#
+#   data/clock_drift.cols/
+#       meta.json
+#       sample.npy
+#       time_sec.npy
+#       ...
+#
+# Columns are memory-mapped on load, so a stage that only needs two columns
+# never touches the others. CSV export ("data/clock_drift.csv") is opt-in via
+# export_csv=True or the CLOCK_DRIFT_EXPORT_CSV=1 environment variable.
+# Clock tables stored in integer ticks (see timebase.py) also serve their
+# float-seconds columns, derived from the tick columns as they are read.
+# Reads and writes are charged to the "store_io" / "csv_io" phases of the
+# running stage's report (see instrumentation.py).
+
+STORE_SUFFIX = ".cols"
+META_FILE = "meta.json"
+CSV_FLOAT_FORMAT = "%.10f"
+
+
+def export_csv_enabled():
+    return os.environ.get("CLOCK_DRIFT_EXPORT_CSV", "0").lower() in ("1", "true", "yes")
+
+
+def store_dir(name):
+    return name + STORE_SUFFIX
+
+
+def csv_path(name):
+    return name + ".csv"
+
+
+def table_exists(name):
+    return os.path.exists(os.path.join(store_dir(name), META_FILE))
+
+
+def read_meta(name):
+    with open(os.path.join(store_dir(name), META_FILE)) as f:
+        return json.load(f)
+
+
+# Helper: turn a DataFrame or dict of arrays into an ordered {column: ndarray}
+def _as_columns(data):
+    if isinstance(data, pd.DataFrame):
+        return {col: data[col].to_numpy() for col in data.columns}
+    return {col: np.asarray(values) for col, values in data.items()}
+
+
+def _write_meta(name, rows, columns, attrs):
+    meta = {
+        "rows": rows,
+        "columns": list(columns),
+        "dtypes": {col: values.dtype.str for col, values in columns.items()},
+        "attrs": attrs or {},
+    }
+    with open(os.path.join(store_dir(name), META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+# Helper: remove column files left over from an earlier, wider version of a table
+def _drop_stale_columns(path, columns):
+    for fname in os.listdir(path):
+        if fname.endswith(".npy") and fname[:-4] not in columns:
+            os.remove(os.path.join(path, fname))
+
+
+def save_table(name, data, attrs=None, export_csv=None, float_format=CSV_FLOAT_FORMAT):
+    columns = _as_columns(data)
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"Columns of '{name}' have different lengths: {sorted(lengths)}")
+
+    path = store_dir(name)
+    os.makedirs(path, exist_ok=True)
+
+    _drop_stale_columns(path, columns)
+
+    with section("store_io"):
+        for col, values in columns.items():
+            np.save(os.path.join(path, col + ".npy"), np.ascontiguousarray(values))
+    add_store_bytes(written=sum(values.nbytes for values in columns.values()))
+
+    _write_meta(name, lengths.pop() if lengths else 0, columns, attrs)
+
+    if export_csv is None:
+        export_csv = export_csv_enabled()
+    if export_csv:
+        with section("csv_io"):
+            pd.DataFrame(columns).to_csv(csv_path(name), index=False, float_format=float_format)
+
+    return path
+
+
+class TableWriter:
+    # Stream chunks (dicts of equal-length arrays or DataFrames) into .npy
+    # files with plain sequential writes, so neither the table nor a mapping
+    # of it is ever held in memory.
+
+    def __init__(self, name, rows, attrs=None, export_csv=None, float_format=CSV_FLOAT_FORMAT):
+        self.name = name
+        self.rows = rows
+        self.attrs = attrs
+        self.export_csv = export_csv_enabled() if export_csv is None else export_csv
+        self.float_format = float_format
+        self.outputs = {}
+        self.dtypes = {}
+        self.written = 0
+        os.makedirs(store_dir(name), exist_ok=True)
+
+    def write(self, chunk):
+        columns = _as_columns(chunk)
+        size = len(next(iter(columns.values())))
+        if self.written + size > self.rows:
+            raise ValueError(f"Table '{self.name}' received more than the declared {self.rows} rows")
+        if not self.outputs:
+            _drop_stale_columns(store_dir(self.name), columns)
+            for col, values in columns.items():
+                f = open(os.path.join(store_dir(self.name), col + ".npy"), "wb")
+                np.lib.format.write_array_header_1_0(f, {
+                    "descr": np.lib.format.dtype_to_descr(values.dtype),
+                    "fortran_order": False,
+                    "shape": (self.rows,),
+                })
+                self.outputs[col] = f
+                self.dtypes[col] = values.dtype
+        with section("store_io"):
+            for col, values in columns.items():
+                self.outputs[col].write(np.ascontiguousarray(values, dtype=self.dtypes[col]).tobytes())
+        add_store_bytes(written=size * sum(dtype.itemsize for dtype in self.dtypes.values()))
+        if self.export_csv:
+            first = self.written == 0
+            with section("csv_io"):
+                pd.DataFrame(columns).to_csv(csv_path(self.name), index=False, float_format=self.float_format,
+                                             mode="w" if first else "a", header=first)
+        self.written += size
+
+    def close(self):
+        if self.written != self.rows:
+            raise ValueError(f"Table '{self.name}' declared {self.rows} rows but received {self.written}")
+        for f in self.outputs.values():
+            f.close()
+        _write_meta(self.name, self.rows, {col: np.empty(0, dtype) for col, dtype in self.dtypes.items()}, self.attrs)
+        return store_dir(self.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+def save_table_chunks(name, chunks, rows, attrs=None, export_csv=None, float_format=CSV_FLOAT_FORMAT):
+    with TableWriter(name, rows, attrs=attrs, export_csv=export_csv, float_format=float_format) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    return store_dir(name)
+
+
+# Helper: stored columns to read for `wanted`, and the derived ones among them
+def _plan_columns(name, meta, wanted):
+    derived = [col for col in wanted if col not in meta["columns"] and col in SECONDS_COLUMNS
+               and is_tick_table(meta.get("attrs"))]
+    missing = [col for col in wanted if col not in meta["columns"] and col not in derived]
+    if missing:
+        raise KeyError(f"Table '{name}' has no column(s) {missing}")
+    stored = [col for col in wanted if col not in derived]
+    if derived:
+        stored += [col for col in TICK_COLUMNS if col not in stored]
+    return stored, derived
+
+
+# Helper: the wanted columns, in order, from stored plus derived ones
+def _finish_columns(loaded, meta, wanted, derived):
+    if derived:
+        loaded = {**loaded, **derive_seconds(loaded, meta["attrs"], derived)}
+    return {col: loaded[col] for col in wanted}
+
+
+def load_columns(name, columns=None, mmap=True):
+    # Prefer the binary store; fall back to a legacy CSV (reading only the
+    # requested columns) so older data folders keep working.
+    if table_exists(name):
+        meta = read_meta(name)
+        wanted = meta["columns"] if columns is None else list(columns)
+        stored, derived = _plan_columns(name, meta, wanted)
+        mode = "r" if mmap else None
+        with section("store_io"):
+            loaded = {col: np.load(os.path.join(store_dir(name), col + ".npy"), mmap_mode=mode) for col in stored}
+        add_store_bytes(read=sum(values.nbytes for values in loaded.values()))  # mapped, not necessarily touched
+        return _finish_columns(loaded, meta, wanted, derived)
+
+    if os.path.exists(csv_path(name)):
+        with section("csv_io"):
+            df = pd.read_csv(csv_path(name), usecols=columns)
+        wanted = df.columns if columns is None else columns
+        return {col: df[col].to_numpy() for col in wanted}
+
+    raise FileNotFoundError(f"Missing '{store_dir(name)}' (or '{csv_path(name)}'). Please run the stage that produces it first.")
+
+
+def load_table(name, columns=None, mmap=True):
+    return pd.DataFrame(load_columns(name, columns, mmap=mmap), copy=False)
+
+
+# Helper: (dtype, rows, data offset) of a 1-D .npy column file
+def _column_layout(path):
+    with open(path, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+        return dtype, shape[0], f.tell()
+
+
+def iter_table_chunks(name, columns=None, chunk_size=1 << 20):
+    # Yield {column: ndarray} blocks of at most chunk_size rows using plain
+    # file reads, so memory stays at one chunk whatever the table size.
+    if not table_exists(name):
+        if not os.path.exists(csv_path(name)):
+            load_columns(name, columns)  # raises the usual FileNotFoundError
+        for df in timed_iter(pd.read_csv(csv_path(name), usecols=columns, chunksize=chunk_size), "csv_io"):
+            yield {col: df[col].to_numpy() for col in (df.columns if columns is None else columns)}
+        return
+
+    meta = read_meta(name)
+    wanted = meta["columns"] if columns is None else list(columns)
+    stored, derived = _plan_columns(name, meta, wanted)
+    layouts = {col: _column_layout(os.path.join(store_dir(name), col + ".npy")) for col in stored}
+    files = {col: open(os.path.join(store_dir(name), col + ".npy"), "rb") for col in stored}
+    try:
+        for col, (_, _, offset) in layouts.items():
+            files[col].seek(offset)
+        for start in range(0, meta["rows"], chunk_size):
+            count = min(chunk_size, meta["rows"] - start)
+            with section("store_io"):
+                chunk = {col: np.fromfile(files[col], dtype=layouts[col][0], count=count) for col in stored}
+            add_store_bytes(read=sum(values.nbytes for values in chunk.values()))
+            yield _finish_columns(chunk, meta, wanted, derived)
+    finally:
+        for f in files.values():
+            f.close()
+
+
+def load_strided(name, columns=None, max_points=1_000_000, chunk_size=1 << 20):
+    # Every stride-th row (stride chosen so at most max_points rows come back),
+    # read chunk by chunk; used for plots of arbitrarily long runs.
+    rows = table_rows(name)
+    stride = max(1, -(-rows // max_points))
+    parts = {}
+    start = 0
+    for chunk in iter_table_chunks(name, columns, chunk_size=chunk_size):
+        first = -start % stride
+        for col, values in chunk.items():
+            parts.setdefault(col, []).append(values[first::stride].copy())
+        start += len(next(iter(chunk.values())))
+    return {col: np.concatenate(values) for col, values in parts.items()}
+
+
+def table_rows(name):
+    if table_exists(name):
+        return read_meta(name)["rows"]
+    return len(next(iter(load_columns(name).values())))
@@ -1,55 +1,88 @@
 import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import os
-
-# 🔍 Set working directory to project root if not already
-project_root = "D:/clock-drift-fpga-project"
-if os.getcwd() != project_root:
-    os.chdir(project_root)
-
-# 📁 Ensure output folders exist
-os.makedirs("data", exist_ok=True)
-os.makedirs("output/plots", exist_ok=True)
+from phase_noise import phase_noise_chunks
+from stage_params import run_stage
+from instrumentation import add_rows, section, set_phase
 
 # 📏 Simulation Parameters
 samples = 10000
 base_delay_ns = 3.2            # Baseline propagation delay (ns)
-jitter_stddev_ns = 0.2         # Jitter (ns)
+jitter_stddev_ns = 0.2         # Jitter (ns), white Gaussian noise source
 skew_ns = 0.5                  # Constant skew (ns)
+noise_source = "white"         # "white" (Gaussian jitter) or "phase_noise" (power-law spec below)
+phase_noise = [                # Edge time error, one edge per base_delay_ns (see phase_noise.py)
+    {"type": "white_pm", "h": 1e-24},
+    {"type": "flicker_fm", "h": 1e-20},
+]
+chunk_size = 1 << 20           # Samples generated and written per chunk
+max_plot_points = 1_000_000    # Plot is decimated beyond this many points
+
+
+def main(plots=True):
+    os.makedirs("data", exist_ok=True)
+    os.makedirs("output/plots", exist_ok=True)
+
+    np.random.seed(42)
+
+    if noise_source not in ("white", "phase_noise"):
+        raise ValueError(f"Unknown noise_source '{noise_source}' (expected 'white' or 'phase_noise')")
+    if noise_source == "phase_noise":
+        # Time error in s at one sample per edge, converted to ns
+        noise = phase_noise_chunks(phase_noise, samples, 1e9 / base_delay_ns, chunk_size)
+
+    # 🔀 Simulate signal path delays chunk by chunk, appending to the CSV
+    edge_step_ns = samples * base_delay_ns / (samples - 1) if samples > 1 else 0.0
+    plot_stride = max(1, -(-samples // max_plot_points))
+    plot_sample, plot_delay = [], []
+    for start in range(0, samples, chunk_size):
+        sample = np.arange(start, min(start + chunk_size, samples))
+        if noise_source == "phase_noise":
+            jitter = next(noise) * 1e9
+        else:
+            jitter = np.random.normal(0, jitter_stddev_ns, size=len(sample))
+        signal_a = sample * edge_step_ns + jitter
+        signal_b = signal_a + skew_ns
+
+        # 📊 Calculate delay profile
+        delay_profile = signal_b - signal_a
+
+        # 💾 Save signal delay profile
+        signal_df = pd.DataFrame({
+            "sample": sample,
+            "signal_a_time": signal_a,
+            "signal_b_time": signal_b,
+            "delay_ns": delay_profile
+        })
+        add_rows(len(sample))
+        with section("csv_io"):
+            signal_df.to_csv("data/signal_delay_profile.csv", index=False, float_format="%.10f",
+                             mode="w" if start == 0 else "a", header=start == 0)
+        keep = sample % plot_stride == 0
+        plot_sample.append(sample[keep])
+        plot_delay.append(delay_profile[keep])
+    print("Signal delay profile saved to: data/signal_delay_profile.csv")
+
+    if not plots:
+        return
+
+    import matplotlib.pyplot as plt
+    set_phase("plot")
+    # 📈 Plot waveform
+    plt.figure(figsize=(10, 5))
+    plt.plot(np.concatenate(plot_sample), np.concatenate(plot_delay), label="Delay (Skew + Jitter)", color="purple")
+    plt.axhline(y=skew_ns, color="gray", linestyle="--", label="Ideal Skew")
+    plt.title("Signal Delay Profile with Jitter and Skew")
+    plt.xlabel("Sample Index")
+    plt.ylabel("Delay (ns)")
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig("output/plots/signal_delay_profile.png")
+    plt.close()
+
+    print("Delay waveform saved to: output/plots/signal_delay_profile.png")
+
 
-np.random.seed(42)
-
-# 🔀 Simulate signal path delays
-jitter = np.random.normal(0, jitter_stddev_ns, size=samples)
-signal_a = np.linspace(0, samples * base_delay_ns, samples) + jitter
-signal_b = signal_a + skew_ns
-
-# 📊 Calculate delay profile
-delay_profile = signal_b - signal_a
-
-# 💾 Save signal delay profile
-signal_df = pd.DataFrame({
-    "sample": np.arange(samples),
-    "signal_a_time": signal_a,
-    "signal_b_time": signal_b,
-    "delay_ns": delay_profile
-})
-signal_df.to_csv("data/signal_delay_profile.csv", index=False, float_format="%.10f")
-print("Signal delay profile saved to: data/signal_delay_profile.csv")
-
-# 📈 Plot waveform
-plt.figure(figsize=(10, 5))
-plt.plot(signal_df["sample"], signal_df["delay_ns"], label="Delay (Skew + Jitter)", color="purple")
-plt.axhline(y=skew_ns, color="gray", linestyle="--", label="Ideal Skew")
-plt.title("Signal Delay Profile with Jitter and Skew")
-plt.xlabel("Sample Index")
-plt.ylabel("Delay (ns)")
-plt.grid(True)
-plt.legend()
-plt.tight_layout()
-plt.savefig("output/plots/signal_delay_profile.png")
-plt.close()
-
-print("Delay waveform saved to: output/plots/signal_delay_profile.png")
+if __name__ == "__main__":
+    run_stage(globals())
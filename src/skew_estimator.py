@@ -0,0 +1,185 @@
+import os
+import itertools
+import numpy as np
+import pandas as pd
+from timebase import order_seconds
+from clock_xcorr import RESULT_COLUMNS, flush_xcorr, new_xcorr_state, to_reference, update_xcorr
+from clock_stream import with_throughput
+from stage_params import run_stage
+from instrumentation import section, set_phase, timed_iter
+
+# 🔀 Blind Skew Estimation Parameters (see clock_xcorr.py)
+# Stream A is the FPGA_1 stamps of data/normal_orders.csv, stream B the FPGA_2
+# stamps of data/drifted_orders.csv, each read on its own: no order_id join and
+# no ground truth. FPGA_1 in the drifted file is only used to score the result.
+window_s = 0.1           # Estimation window (~100 orders at the default 1 kHz order rate)
+step_s = None            # Window spacing (None = window_s, no overlap)
+bin_s = 1e-6             # Event-count bin of the coarse cross-correlation
+max_lag_s = 50e-6        # Offset search range around the tracked prior
+gate_s = None            # First-pass match gate of the fine fit (None = bin_s)
+fit_events = 2048        # A events per window used by the fine fit (evenly strided)
+min_score = 0.2          # Minimum peak correlation for a window to be accepted
+min_peak_ratio = 1.5     # Minimum peak over runner-up (> 1 bin away): rejects ambiguous lags
+min_matches = 3          # Minimum matched events for a window to be accepted
+initial_offset_s = 0.0   # Prior for the first window (B - A)
+per_clock = True         # Separate estimate per clock_id when the orders carry one
+chunk_size = 1 << 20     # Orders read per chunk of each file
+max_plot_points = 100_000
+
+estimates_path = "data/skew_estimates.csv"
+blind_orders_path = "data/blind_orders.csv"    # Drifted orders with FPGA_2 corrected blind (for financial_model.py)
+summary_path = "output/skew_summary.csv"
+
+
+def clock_groups(orders, column):
+    # {clock_id: sorted stamps} for one chunk; a single clock 0 without clock_id
+    stamps = orders[column].to_numpy(dtype=np.float64)
+    if not per_clock or "clock_id" not in orders.columns:
+        return {0: stamps}
+    ids = orders["clock_id"].to_numpy()
+    return {int(cid): stamps[ids == cid] for cid in np.unique(ids)}
+
+
+def main(plots=True):
+    os.makedirs("data", exist_ok=True)
+    os.makedirs("output/plots", exist_ok=True)
+
+    params = {"window_s": window_s, "step_s": step_s, "bin_s": bin_s, "max_lag_s": max_lag_s, "gate_s": gate_s,
+              "fit_events": fit_events, "min_score": min_score, "min_peak_ratio": min_peak_ratio,
+              "min_matches": min_matches, "initial_offset_s": initial_offset_s}
+    for path in ("data/normal_orders.csv", "data/drifted_orders.csv"):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Missing '{path}'. Please run the order simulator first.")
+
+    # 📡 Both files in step: each is sorted by its own stamp, so after a chunk every
+    # clock's stream is complete up to that chunk's last stamp
+    states = {}
+    parts = []
+
+    def feed(name, groups, until):
+        for cid in groups.keys() - states.keys():
+            states[cid] = new_xcorr_state(**params)
+        for cid, state in states.items():
+            events = groups.get(cid, ())
+            update = {"a_events": events, "a_until": until} if name == "a" else {"b_events": events, "b_until": until}
+            try:
+                parts.append((cid, update_xcorr(state, **update)))
+            except ValueError as exc:
+                raise ValueError(f"{exc} (clock {cid}); the order files must be sorted by their own stamps") from exc
+
+    normal = pd.read_csv("data/normal_orders.csv", chunksize=chunk_size)
+    drifted = pd.read_csv("data/drifted_orders.csv", chunksize=chunk_size)
+    pairs = itertools.zip_longest(timed_iter(normal, "csv_io"), timed_iter(drifted, "csv_io"))
+    for a_orders, b_orders in with_throughput(pairs, "skew_estimator"):
+        if a_orders is not None:
+            a_orders = order_seconds(a_orders)
+            feed("a", clock_groups(a_orders, "fpga_1_ts"), a_orders["fpga_1_ts"].max())
+        if b_orders is not None:
+            b_orders = order_seconds(b_orders)
+            feed("b", clock_groups(b_orders, "fpga_2_ts"), b_orders["fpga_2_ts"].max())
+    for cid, state in states.items():
+        parts.append((cid, flush_xcorr(state)))
+
+    estimates = {cid: {col: np.concatenate([part[col] for c, part in parts if c == cid]) for col in RESULT_COLUMNS}
+                 for cid in sorted(states)}
+    estimates_df = pd.concat([pd.DataFrame({"clock_id": cid, **est}) for cid, est in estimates.items()],
+                             ignore_index=True)
+    with section("csv_io"):
+        estimates_df.to_csv(estimates_path, index=False)
+    print(f"Offset / skew estimates saved to: {estimates_path}")
+
+    # 🩹 Blind-correct every drifted order; its true stamp only scores the correction
+    if os.path.exists(blind_orders_path):
+        os.remove(blind_orders_path)
+    errors = {cid: {"orders": 0, "raw_sq": 0.0, "blind_sq": 0.0, "blind_max": 0.0} for cid in estimates}
+    plot_parts = []
+    for orders in timed_iter(pd.read_csv("data/drifted_orders.csv", chunksize=chunk_size), "csv_io"):
+        orders = order_seconds(orders)
+        orders = orders.drop(columns=[col for col in orders.columns if col.startswith(("fpga_1_ts_", "fpga_2_ts_"))])
+        raw = orders["fpga_2_ts"].to_numpy(dtype=np.float64)
+        truth = orders["fpga_1_ts"].to_numpy(dtype=np.float64)
+        ids = orders["clock_id"].to_numpy() if per_clock and "clock_id" in orders.columns else np.zeros(len(raw), int)
+        corrected = raw.copy()
+        for cid in np.unique(ids):
+            picked = ids == cid
+            corrected[picked] = to_reference(estimates[int(cid)], raw[picked])
+            err = errors[int(cid)]
+            err["orders"] += int(picked.sum())
+            err["raw_sq"] += float(np.sum((raw[picked] - truth[picked]) ** 2))
+            err["blind_sq"] += float(np.sum((corrected[picked] - truth[picked]) ** 2))
+            err["blind_max"] = max(err["blind_max"], float(np.max(np.abs(corrected[picked] - truth[picked]))))
+        orders["fpga_2_raw_ts"] = raw
+        orders["offset_est_s"] = raw - corrected
+        orders["fpga_2_ts"] = corrected
+        with section("csv_io"):
+            orders.to_csv(blind_orders_path, mode="a", header=not os.path.exists(blind_orders_path), index=False)
+        plot_parts.append(pd.DataFrame({"time_s": truth, "true_offset_s": raw - truth,
+                                        "offset_est_s": raw - corrected}))
+        # Keep the plot series bounded: thin what has been collected so far
+        if sum(len(part) for part in plot_parts) > 2 * max_plot_points:
+            plot_parts = [pd.concat(plot_parts).iloc[::2]]
+    print(f"Blind-corrected orders saved to: {blind_orders_path}")
+
+    summary = []
+    for cid, est in estimates.items():
+        err = errors[cid]
+        accepted = est["accepted"]
+        count = max(err["orders"], 1)
+        summary.append({
+            "clock_id": cid,
+            "windows": len(accepted),
+            "accepted_fraction": float(accepted.mean()) if len(accepted) else 0.0,
+            "median_skew_ppm": float(np.nanmedian(est["skew"][accepted])) * 1e6 if accepted.any() else np.nan,
+            "median_score": float(np.nanmedian(est["score"])) if len(accepted) else np.nan,
+            "orders": err["orders"],
+            "raw_rms_error_s": np.sqrt(err["raw_sq"] / count),
+            "blind_rms_error_s": np.sqrt(err["blind_sq"] / count),
+            "blind_max_error_s": err["blind_max"],
+        })
+        if len(accepted) and accepted.mean() < 0.5:
+            print(f"[WARN] clock {cid}: {accepted.sum()} of {len(accepted)} windows accepted; a sparse or strictly "
+                  "periodic stream leaves the lag ambiguous (try a longer window_s or initial_offset_s)")
+        if summary[-1]["blind_rms_error_s"] > summary[-1]["raw_rms_error_s"]:
+            print(f"[WARN] clock {cid}: blind correction is worse than none (RMS error "
+                  f"{summary[-1]['blind_rms_error_s']:.3g} s vs {summary[-1]['raw_rms_error_s']:.3g} s raw); "
+                  "the estimates have likely locked onto the wrong lag")
+    summary_df = pd.DataFrame(summary)
+    with section("csv_io"):
+        summary_df.to_csv(summary_path, index=False)
+    print(summary_df.to_string(index=False))
+    print(f"Skew summary saved to: {summary_path}")
+
+    if not plots:
+        return
+
+    import matplotlib.pyplot as plt
+    set_phase("plot")
+    # 📈 Estimated vs true offset of the drifted stamps, and the per-window skew
+    merged = pd.concat(plot_parts) if plot_parts else pd.DataFrame(columns=["time_s", "true_offset_s", "offset_est_s"])
+    merged = merged.sort_values("time_s")
+    fig, (ax_offset, ax_skew) = plt.subplots(2, 1, figsize=(10, 7), sharex=True)
+    ax_offset.plot(merged["time_s"], merged["true_offset_s"] * 1e6, ".", markersize=2, alpha=0.4,
+                   label="True FPGA_2 - FPGA_1")
+    ax_offset.plot(merged["time_s"], merged["offset_est_s"] * 1e6, ".", markersize=2, color="green",
+                   label="Blind estimate")
+    ax_offset.set_ylabel("Offset (µs)")
+    ax_offset.set_title("Blind Offset Estimation (FFT Cross-Correlation)")
+    ax_offset.grid(True)
+    ax_offset.legend(loc="upper left")
+    for cid, est in estimates.items():
+        accepted = est["accepted"]
+        ax_skew.plot(est["time_s"][accepted], est["skew"][accepted] * 1e6, marker="o", markersize=3,
+                     label=f"Clock {cid}" if len(estimates) <= 8 else None)
+    ax_skew.set_xlabel("Reference time (s)")
+    ax_skew.set_ylabel("Skew (ppm)")
+    ax_skew.grid(True)
+    if 1 < len(estimates) <= 8:
+        ax_skew.legend(loc="upper left")
+    plt.tight_layout()
+    plt.savefig("output/plots/skew_estimate.png")
+    plt.close()
+    print("Skew plot saved to: output/plots/skew_estimate.png")
+
+
+if __name__ == "__main__":
+    run_stage(globals())
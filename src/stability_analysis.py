@@ -0,0 +1,81 @@
+import os
+import pandas as pd
+from sample_store import iter_table_chunks, read_meta, table_exists, table_rows
+from clock_stability import DEFAULT_MAX_LAG, default_m_values, new_stability_state, stability_results, update_stability
+from clock_stream import with_throughput
+from stage_params import run_stage
+from instrumentation import section, set_phase
+
+# 📐 Stability Analysis Parameters (ADEV / TDEV / MTIE, see clock_stability.py)
+# Each series is a time error FPGA_2 - FPGA_1 from a stored table; missing
+# tables (stages that were not run) are skipped.
+series = {
+    "drift": ("data/clock_drift", "fpga_2_time"),
+    "faulted": ("data/clock_drift_faulted", "fpga_2_faulted"),
+    "corrected": ("data/clock_drift_corrected", "fpga_2_corrected"),
+}
+sampling_rate_hz = None      # None = read from the clock_drift table (1 MHz if absent)
+points_per_decade = 5        # Averaging times per decade, from tau0 up to max_tau_fraction of the run
+max_tau_fraction = 0.25
+max_lag = DEFAULT_MAX_LAG    # Taus up to this many samples are exact; longer ones use block decimation
+chunk_size = 1 << 20         # Samples read per chunk
+
+
+def main(plots=True):
+    os.makedirs("output/plots", exist_ok=True)
+
+    rate_hz = sampling_rate_hz
+    if rate_hz is None:
+        attrs = read_meta("data/clock_drift").get("attrs", {}) if table_exists("data/clock_drift") else {}
+        rate_hz = attrs.get("sampling_rate_hz", 1e6)
+    tau0_s = 1 / rate_hz
+
+    # 🔁 Stream every series once, updating all averaging times per chunk
+    results = []
+    for label, (table, column) in series.items():
+        if not table_exists(table) and not os.path.exists(table + ".csv"):
+            print(f"Skipping '{label}': {table} not found")
+            continue
+        m_values = default_m_values(table_rows(table), points_per_decade, max_tau_fraction)
+        state = new_stability_state(tau0_s, m_values, max_lag)
+        chunks = iter_table_chunks(table, columns=["fpga_1_time", column], chunk_size=chunk_size)
+        for chunk in with_throughput(chunks, f"stability_analysis:{label}"):
+            update_stability(state, chunk[column] - chunk["fpga_1_time"])
+        frame = pd.DataFrame(stability_results(state))
+        frame.insert(0, "series", label)
+        results.append(frame)
+
+    if not results:
+        raise FileNotFoundError("No clock series found. Please run clock_simulator.py first.")
+
+    # 💾 Save the stability curves
+    stability_df = pd.concat(results, ignore_index=True)
+    with section("csv_io"):
+        stability_df.to_csv("output/stability_metrics.csv", index=False)
+    print("Stability metrics saved to: output/stability_metrics.csv")
+    if not plots:
+        return
+
+    import matplotlib.pyplot as plt
+    set_phase("plot")
+    # 📈 Plot ADEV, TDEV and MTIE against tau (log-log)
+    fig, axes = plt.subplots(1, 3, figsize=(15, 5))
+    for label, frame in stability_df.groupby("series", sort=False):
+        axes[0].loglog(frame["tau_s"], frame["adev"], marker="o", markersize=3, label=label)
+        axes[1].loglog(frame["tau_s"], frame["tdev_s"] * 1e9, marker="o", markersize=3, label=label)
+        axes[2].loglog(frame["tau_s"], frame["mtie_s"] * 1e9, marker="o", markersize=3, label=label)
+    for ax, title, ylabel in zip(axes, ["Allan Deviation", "Time Deviation", "MTIE"],
+                                 ["ADEV", "TDEV (ns)", "MTIE (ns)"]):
+        ax.set_title(title)
+        ax.set_xlabel("Averaging time tau (s)")
+        ax.set_ylabel(ylabel)
+        ax.grid(True, which="both", alpha=0.4)
+        ax.legend()
+    plt.tight_layout()
+    plt.savefig("output/plots/stability_plot.png")
+    plt.close()
+    print("Stability plot saved to: output/plots/stability_plot.png")
+
+
+if __name__ == "__main__":
+    run_stage(globals())
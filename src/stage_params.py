@@ -0,0 +1,73 @@
+import os
+import json
+import importlib
+
+# 🔧 Parameter overrides and entry point for stage scripts
+#
+# Stage scripts keep their parameters as module-level constants and their work
+# in main(plots=True), so importing one has no side effects. run_stage() is
+# how a script runs, standalone (`if __name__ == "__main__"`), from cli.py or
+# from library code: it enters the project root, applies parameter overrides,
+# starts the stage's run report (instrumentation.py) and calls main().
+#
+# The pipeline runner (pipeline.py) passes overrides as JSON in
+# CLOCK_DRIFT_STAGE_PARAMS, the project root in CLOCK_DRIFT_PROJECT_ROOT
+# (default: the repository) and CLOCK_DRIFT_PLOTS=0 to skip plots, in which
+# case matplotlib is never imported. Only names the script already defines can
+# be overridden, so a typo in a pipeline parameter fails loudly instead of
+# being ignored.
+
+PARAMS_ENV = "CLOCK_DRIFT_STAGE_PARAMS"
+ROOT_ENV = "CLOCK_DRIFT_PROJECT_ROOT"
+PLOTS_ENV = "CLOCK_DRIFT_PLOTS"
+DEFAULT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def stage_overrides():
+    return json.loads(os.environ.get(PARAMS_ENV) or "{}")
+
+
+def parse_value(raw):
+    # A command-line parameter value: JSON if it parses, else the string itself
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return raw
+
+
+def apply_overrides(namespace, overrides=None):
+    overrides = stage_overrides() if overrides is None else overrides
+    unknown = sorted(name for name in overrides if name not in namespace)
+    if unknown:
+        raise KeyError(f"Unknown stage parameter(s) {unknown}")
+    namespace.update(overrides)
+    return overrides
+
+
+def project_root():
+    return os.environ.get(ROOT_ENV, DEFAULT_ROOT)
+
+
+def enter_project_root():
+    root = project_root()
+    if os.getcwd() != root:
+        os.chdir(root)
+    return root
+
+
+def plots_enabled():
+    return os.environ.get(PLOTS_ENV, "1").lower() not in ("0", "false", "no")
+
+
+def run_stage(stage, overrides=None, plots=None, report=True):
+    # Runs a stage script's main() in this process. stage is a script module
+    # name ("clock_simulator") or a script's globals(); overrides default to
+    # CLOCK_DRIFT_STAGE_PARAMS and plots to CLOCK_DRIFT_PLOTS. Overrides stay
+    # set on the module. report=False skips the run report (one per process).
+    namespace = stage if isinstance(stage, dict) else vars(importlib.import_module(stage))
+    enter_project_root()
+    params = apply_overrides(namespace, overrides)
+    if report:
+        from instrumentation import start_stage
+        start_stage(os.path.splitext(os.path.basename(namespace["__file__"]))[0], params=params)
+    return namespace["main"](plots=plots_enabled() if plots is None else plots)
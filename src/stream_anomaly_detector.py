@@ -0,0 +1,93 @@
+import os
+import asyncio
+import pandas as pd
+from stream_detector import (DEFAULT_BATCH, detector_summary, is_order_column, queue_source, replay_file,
+                             run_detector, send_batches, socket_source, to_order_batch)
+from stage_params import run_stage
+
+# Streaming detector parameters (see stream_detector.py)
+orders_path = "data/drifted_orders.csv"  # Orders in arrival (FPGA_2) order
+source = "file"              # "file" (direct replay), "queue" (in-process asyncio.Queue) or "socket" (local TCP)
+drift_threshold_s = 5e-6     # Alert when |FPGA_2 - FPGA_1| exceeds this
+batch_size = DEFAULT_BATCH   # Orders per event batch
+orders_per_s = None          # Replay pacing; None = as fast as possible
+socket_port = 50007
+alerts_path = "output/stream_alerts.csv"
+
+
+async def write_alerts(alerts):
+    # Alert sink: drains published alert batches into the alert log, off the detection path
+    while True:
+        batch = await alerts.get()
+        if batch is None:
+            return
+        frame = pd.DataFrame(batch)
+        frame.to_csv(alerts_path, mode="a", header=not os.path.exists(alerts_path), index=False)
+
+
+async def detect_from_queue(publish):
+    queue = asyncio.Queue(maxsize=64)
+
+    async def produce():
+        async for _, batch in replay_file(orders_path, batch_size, orders_per_s):
+            await queue.put(batch)
+        await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    state = await run_detector(queue_source(queue), publish, drift_threshold_s)
+    await producer
+    return state
+
+
+async def detect_from_socket(publish):
+    done = asyncio.get_running_loop().create_future()
+
+    async def handle(reader, writer):
+        done.set_result(await run_detector(socket_source(reader), publish, drift_threshold_s))
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", socket_port)
+    async with server:
+        _, writer = await asyncio.open_connection("127.0.0.1", socket_port)
+        frames = pd.read_csv(orders_path, usecols=is_order_column, chunksize=1 << 20)
+        await send_batches(writer, (to_order_batch(frame) for frame in frames), batch_size)
+        return await done
+
+
+async def detect():
+    alerts = asyncio.Queue()
+    writer = asyncio.create_task(write_alerts(alerts))
+    if source == "file":
+        state = await run_detector(replay_file(orders_path, batch_size, orders_per_s), alerts.put_nowait, drift_threshold_s)
+    elif source == "queue":
+        state = await detect_from_queue(alerts.put_nowait)
+    elif source == "socket":
+        state = await detect_from_socket(alerts.put_nowait)
+    else:
+        raise ValueError(f"Unknown source '{source}' (expected 'file', 'queue' or 'socket')")
+    alerts.put_nowait(None)
+    await writer
+    return state
+
+
+def main(plots=True):
+    # No plots: the alert log is the output
+    os.makedirs("output", exist_ok=True)
+
+    if not os.path.exists(orders_path):
+        raise FileNotFoundError(f"Missing '{orders_path}'. Please run order_simulator.py first.")
+
+    if os.path.exists(alerts_path):
+        os.remove(alerts_path)
+    summary = detector_summary(asyncio.run(detect()))
+    print(f"[stream_detector] {summary['orders']} orders in {summary['elapsed_s']:.2f} s "
+          f"({summary['orders_per_s']:,.0f} orders/s)")
+    print(f"Sequence violations: {summary['sequence_alerts']}, drift breaches (> {drift_threshold_s * 1e6:g} µs): "
+          f"{summary['drift_alerts']}")
+    print(f"Detection latency p50: {summary['latency_p50_us']:.1f} µs, p99: {summary['latency_p99_us']:.1f} µs")
+    if os.path.exists(alerts_path):
+        print(f"Alerts saved to: {alerts_path}")
+
+
+if __name__ == "__main__":
+    run_stage(globals())
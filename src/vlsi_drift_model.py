@@ -1,55 +1,94 @@
 import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import os
+from clock_tree import elmore_delays, h_tree, monte_carlo_skew
+from stage_params import run_stage
+from instrumentation import add_rows, section, set_phase
 
-# 🔍 Set working directory to project root if not already
-project_root = "D:/clock-drift-fpga-project"
-if os.getcwd() != project_root:
-    os.chdir(project_root)
+# 🔧 Simulation Parameters (binary H-tree, see clock_tree.py)
+tree_levels = 10                 # 2**levels sinks (17 -> 131,072 sinks)
+die_size_um = 1_000.0            # Clock region edge length (um)
+wire_r_ohm_per_um = 0.08         # Wire resistance per um
+wire_c_ff_per_um = 0.2           # Wire capacitance per um (fF)
+sink_cap_ff = 2.0                # Flip-flop clock pin load (fF)
+driver_r_ohm = 50.0              # Clock driver output resistance
+base_clock_period_ns = 2.0       # Nominal clock period (e.g., 500 MHz)
 
-# 📁 Create necessary folders
-os.makedirs("data", exist_ok=True)
-os.makedirs("output/plots", exist_ok=True)
+# Process variation (Monte Carlo)
+mc_samples = 1000                # Variation samples
+sigma_local = 0.1                # Per-segment relative std-dev of R and C
+sigma_global = 0.05              # Die-level relative std-dev (shared by all elements)
+sink_cap_sigma = 0.1             # Per-sink relative std-dev of the load
+batch_mb = 256                   # Memory budget for one batch of samples
+seed = 42
 
-# 🔧 Simulation Parameters
-num_paths = 5
-samples = 10000
-base_clock_period_ns = 2.0       # Nominal clock period (e.g., 500 MHz)
-rc_delay_base = 0.3              # Base RC delay (ns)
-rc_delay_variation = 0.1         # Standard deviation of delay variation
-
-np.random.seed(42)
-
-# 🏗️ Simulate delay for each path in clock tree
-delays = []
-for i in range(num_paths):
-    delay_profile = rc_delay_base + np.random.normal(0, rc_delay_variation, size=samples)
-    delays.append(delay_profile)
-
-# 📊 Organize into DataFrame
-delay_df = pd.DataFrame(delays).T
-delay_df.columns = [f"path_{i+1}" for i in range(num_paths)]
-delay_df["sample"] = np.arange(samples)
-
-# 🧮 Compute max skew across paths
-delay_df["max_skew"] = delay_df.max(axis=1) - delay_df.min(axis=1)
-
-# 💾 Save skew data
-delay_df.to_csv("data/vlsi_clock_skew.csv", index=False, float_format="%.10f")
-print("VLSI clock skew data saved to: data/vlsi_clock_skew.csv")
-
-# 📈 Plot max skew vs. time
-plt.figure(figsize=(10, 5))
-plt.plot(delay_df["sample"], delay_df["max_skew"], label="Max Clock Skew (ns)", color="red")
-plt.title("Clock Tree Skew Simulation (VLSI Delay Model)")
-plt.xlabel("Sample Index")
-plt.ylabel("Skew (ns)")
-plt.grid(True)
-plt.legend()
-plt.tight_layout()
-plt.savefig("output/plots/vlsi_skew_plot.png")
-plt.close()
-
-print("Clock skew waveform saved to: output/plots/vlsi_skew_plot.png")
+
+def main(plots=True):
+    os.makedirs("data", exist_ok=True)
+    os.makedirs("output/plots", exist_ok=True)
+
+    # 🏗️ Build the clock tree and its nominal Elmore delays
+    tree = h_tree(tree_levels, die_size_um=die_size_um, r_per_um=wire_r_ohm_per_um, c_per_um=wire_c_ff_per_um * 1e-15,
+                  sink_cap=sink_cap_ff * 1e-15, driver_r=driver_r_ohm)
+    sinks = tree["sinks"]
+    nominal = elmore_delays(tree)[sinks]
+    print(f"Clock tree: {len(tree['parent'])} nodes, {len(sinks)} sinks, nominal sink delay "
+          f"{nominal.mean() * 1e9:.3f} ns, nominal skew {(nominal.max() - nominal.min()) * 1e12:.3f} ps")
+
+    # 🎲 Monte Carlo skew over process variation, in memory-bounded batches
+    mc = monte_carlo_skew(tree, mc_samples, sigma_local=sigma_local, sigma_global=sigma_global,
+                          sink_sigma=sink_cap_sigma, seed=seed, batch_bytes=batch_mb << 20)
+    add_rows(mc_samples * len(sinks))
+    skew_ns = mc["skew_s"] * 1e9
+    print(f"Skew over {mc_samples} samples: mean {skew_ns.mean() * 1e3:.2f} ps, "
+          f"p99 {np.percentile(skew_ns, 99) * 1e3:.2f} ps "
+          f"({np.percentile(skew_ns, 99) / base_clock_period_ns:.2%} of the clock period)")
+
+    # 💾 Save skew per variation sample and delay statistics per sink
+    delay_df = pd.DataFrame({
+        "sample": np.arange(mc_samples),
+        "max_skew": skew_ns,
+        "min_delay_ns": mc["min_delay_s"] * 1e9,
+        "max_delay_ns": mc["max_delay_s"] * 1e9,
+        "mean_delay_ns": mc["mean_delay_s"] * 1e9,
+    })
+    sink_df = pd.DataFrame({
+        "sink": sinks,
+        "x_um": tree["x_um"][sinks],
+        "y_um": tree["y_um"][sinks],
+        "nominal_delay_ns": nominal * 1e9,
+        "mean_delay_ns": mc["sink_mean_s"] * 1e9,
+        "std_delay_ns": mc["sink_std_s"] * 1e9,
+    })
+    with section("csv_io"):
+        delay_df.to_csv("data/vlsi_clock_skew.csv", index=False, float_format="%.10f")
+        sink_df.to_csv("data/vlsi_sink_delays.csv", index=False, float_format="%.10f")
+    print("VLSI clock skew data saved to: data/vlsi_clock_skew.csv")
+    print("Per-sink delay statistics saved to: data/vlsi_sink_delays.csv")
+
+    if not plots:
+        return
+
+    import matplotlib.pyplot as plt
+    set_phase("plot")
+    # 📈 Plot the skew distribution and the mean sink delay across the die
+    fig, (ax_hist, ax_map) = plt.subplots(1, 2, figsize=(12, 5))
+    ax_hist.hist(skew_ns * 1e3, bins=50, color="red", alpha=0.8)
+    ax_hist.set_title("Clock Skew over Process Variation")
+    ax_hist.set_xlabel("Skew (ps)")
+    ax_hist.set_ylabel("Samples")
+    ax_hist.grid(True)
+    points = ax_map.scatter(sink_df["x_um"] / 1e3, sink_df["y_um"] / 1e3, c=sink_df["mean_delay_ns"], s=4, cmap="viridis")
+    fig.colorbar(points, ax=ax_map, label="Mean sink delay (ns)")
+    ax_map.set_title("Clock Tree Sink Delays (H-tree, Elmore)")
+    ax_map.set_xlabel("x (mm)")
+    ax_map.set_ylabel("y (mm)")
+    plt.tight_layout()
+    plt.savefig("output/plots/vlsi_skew_plot.png")
+    plt.close()
+
+    print("Clock skew plots saved to: output/plots/vlsi_skew_plot.png")
+
+
+if __name__ == "__main__":
+    run_stage(globals())